@@ -0,0 +1,90 @@
+"""
+打卡记录归档（checkin_archive）
+- 过期打卡记录不再直接删除，而是按 目标+月份 合并为一行
+- days: 当月打卡日相对月初的偏移（0~30），升序，每天1字节
+- checkins: 归档的原始打卡记录数
+- 热表 checkins 只保留近期记录，历史统计通过流式接口读取归档
+"""
+from datetime import date
+
+from .storage import day_key, month_of
+
+SQL_USER_ARCHIVE = '''
+    SELECT g.goal, a.month, a.days, a.checkins
+    FROM goals g
+    JOIN checkin_archive a ON a.goal_id = g.id
+    WHERE g.user_id = ?
+    ORDER BY g.goal, a.month
+'''
+
+
+def month_start(month):
+    """月份键 -> 当月1日的日序号"""
+    return day_key(date(month // 100, month % 100, 1))
+
+
+def encode_days(month, days):
+    """当月打卡日 -> 紧凑字节串"""
+    start = month_start(month)
+    return bytes(sorted({day - start for day in days}))
+
+
+def decode_days(month, blob):
+    """紧凑字节串 -> 当月打卡日（升序）"""
+    start = month_start(month)
+    return [start + offset for offset in blob]
+
+
+def create_archive_table(c):
+    """创建归档表"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS checkin_archive (
+            goal_id INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            days BLOB NOT NULL,
+            checkins INTEGER NOT NULL,
+            PRIMARY KEY (goal_id, month),
+            FOREIGN KEY (goal_id) REFERENCES goals(id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def archive_checkins(c, rows):
+    """把打卡记录并入归档（需在删除这些记录的同一事务中调用）
+
+    Args:
+        rows: [(goal_id, day), ...]
+    """
+    grouped = {}
+    for goal_id, day in rows:
+        entry = grouped.setdefault((goal_id, month_of(day)), [set(), 0])
+        entry[0].add(day)
+        entry[1] += 1
+    for (goal_id, month), (days, count) in grouped.items():
+        existing = c.execute(
+            "SELECT days, checkins FROM checkin_archive WHERE goal_id = ? AND month = ?",
+            (goal_id, month)
+        ).fetchone()
+        if existing:
+            days.update(decode_days(month, existing[0]))
+            count += existing[1]
+        c.execute(
+            "INSERT OR REPLACE INTO checkin_archive (goal_id, month, days, checkins) VALUES (?, ?, ?, ?)",
+            (goal_id, month, encode_days(month, days), count)
+        )
+
+
+def is_archived(c, goal_id, day):
+    """目标在某日是否已有归档记录"""
+    month = month_of(day)
+    row = c.execute(
+        "SELECT days FROM checkin_archive WHERE goal_id = ? AND month = ?",
+        (goal_id, month)
+    ).fetchone()
+    return bool(row) and day in decode_days(month, row[0])
+
+
+def iter_archive(conn, user_id):
+    """流式读取用户归档 -> (目标, 月份, 打卡日列表, 记录数)"""
+    for goal, month, blob, checkins in conn.execute(SQL_USER_ARCHIVE, (user_id,)):
+        yield goal, month, decode_days(month, blob), checkins
@@ -0,0 +1,245 @@
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .transfer import IMPORT_TRANSACTION, REBUILD_CHUNK, iter_chunks, open_import
+
+
+class GroupCommitQueue:
+    """打卡写入合并队列（组提交）
+
+    并发到达的打卡请求先进入队列，在收集窗口结束或达到批量上限时
+    通过存储引擎的 checkin_many 合并为一个事务提交。
+    每个调用方在所属事务提交后才拿到结果。
+    """
+    def __init__(self, adb, window_ms=20, max_batch=64):
+        self.adb = adb
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []
+        self._full = None
+        self._flusher = None
+
+    async def checkin(self, user_id, goals):
+        """提交一次打卡，等待所在批次提交后返回打卡ID列表"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_id, goals, future))
+        if self._flusher is None or self._flusher.done():
+            self._full = asyncio.Event()
+            self._flusher = asyncio.create_task(self._collect())
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _collect(self):
+        """等待收集窗口结束（或批次已满）后提交"""
+        try:
+            await asyncio.wait_for(self._full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        await self.flush()
+
+    async def flush(self):
+        """立即提交所有排队的请求（提交期间新到的请求并入下一批）"""
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        """按写入分片拆分批次，各分片并行提交"""
+        grouped = {}
+        for item in batch:
+            grouped.setdefault(self.adb.db.shard_index(item[0]), []).append(item)
+        await asyncio.gather(*[
+            self._commit_shard(shard, items) for shard, items in grouped.items()
+        ])
+
+    async def _commit_shard(self, shard, batch):
+        requests = [(user_id, goals) for user_id, goals, _ in batch]
+        try:
+            results = await self.adb.run(self.adb.db.checkin_many, requests, shard=shard)
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def drain(self):
+        """同步提交剩余请求（插件卸载时调用，事件循环可能已停止）"""
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        requests = [(user_id, goals) for user_id, goals, _ in batch]
+        try:
+            results = self.adb.db.checkin_many(requests)
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            method = future.set_exception if isinstance(result, Exception) else future.set_result
+            try:
+                future.get_loop().call_soon_threadsafe(method, result)
+            except RuntimeError:
+                pass
+
+
+class AsyncDatabase:
+    """存储引擎（CheckinStorage）的异步外观
+
+    所有数据库调用都在线程中执行，不阻塞事件循环：
+    - 写操作串行提交到写线程（SQLite同一时刻只允许一个写者）；
+      分片存储每个分片一个写线程，单用户写操作路由到所在分片
+    - 只读查询分发到读线程池，每个线程持有自己的长连接
+    用法与 CheckinStorage 相同，只是每个方法都需要 await。
+    """
+    # 只读方法（其余方法一律走写线程）
+    READ_METHODS = frozenset({
+        'get_checkins',
+        'get_goals',
+        'get_last_goals',
+        'get_admin_qq',
+        'has_checked_in_today',
+        'get_today_status',
+        'get_consecutive_days',
+        'get_checkin_report',
+        'get_history_summary',
+        'get_period_stats',
+        'get_day_bitmaps',
+        'get_group_ranking',
+        'get_group_stats',
+        'get_recent_checkins',
+        'check_query_plans',
+        'backup_database',  # 只读取数据库，长时间运行不能占用写线程
+        'list_backups',
+        'export_checkins',  # 同上，流式读取快照
+    })
+    # 第一个参数为 user_id 的写方法（分片存储时路由到所在分片的写线程）
+    USER_WRITE_METHODS = frozenset({
+        'checkin',
+        'supplement_checkin',
+        'delete_goals',
+        'delete_all_checkins',
+        'join_group',
+    })
+
+    def __init__(self, db, readers=4, write_behind=None):
+        self.db = db
+        self._writers = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"checkin-db-writer{i}")
+            for i in range(db.write_shards)
+        ]
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="checkin-db-reader")
+        self.write_queue = None
+        if write_behind and write_behind.get("enabled"):
+            self.write_queue = GroupCommitQueue(
+                self,
+                window_ms=write_behind.get("window_ms", 20),
+                max_batch=write_behind.get("max_batch", 64)
+            )
+
+    async def run(self, func, *args, write=True, shard=0, **kwargs):
+        """在数据库线程中执行任意函数（写操作使用 shard 号分片的写线程）"""
+        executor = self._writers[shard] if write else self._readers
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    async def checkin(self, user_id, goals):
+        """打卡（开启写入合并时进入组提交队列）"""
+        if self.write_queue:
+            return await self.write_queue.checkin(user_id, goals)
+        return await self.run(self.db.checkin, user_id, goals, shard=self.db.shard_index(user_id))
+
+    async def flush(self):
+        """提交写入合并队列中尚未提交的打卡"""
+        if self.write_queue:
+            await self.write_queue.flush()
+
+    async def import_checkins(self, path, fmt=None):
+        """分批导入（返回值同 CheckinStorage.import_checkins）
+
+        文件在读线程中解析；每 IMPORT_TRANSACTION 行的写事务、每 REBUILD_CHUNK 个目标的
+        派生表重算都作为单独的任务提交到所在分片的写线程，其间排队的打卡照常执行，
+        导入期间打卡最多等待一个事务。
+        """
+        start = time.perf_counter()
+        affected = {}
+        error = None
+        try:
+            records, report = await self.run(open_import, path, fmt, write=False)
+            batches = iter_chunks(records, IMPORT_TRANSACTION)
+            while True:
+                batch = await self.run(next, batches, None, write=False)
+                if batch is None:
+                    break
+                grouped = {}
+                for record in batch:
+                    grouped.setdefault(self.db.shard_index(record[0]), []).append(record)
+                results = await asyncio.gather(*[
+                    self.run(self.db.import_batch, items, shard=shard) for shard, items in grouped.items()
+                ], return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        error = error or result
+                        continue
+                    report["imported"] += result[0]
+                    report["skipped"] += result[1]
+                    affected.update(result[2])
+                if error:
+                    break
+        except Exception as e:
+            error = e
+        try:
+            # 已提交的批次（包括中途失败时）都需要重算派生表
+            await self._rebuild_imported(affected)
+        except Exception as e:
+            error = error or e
+        if error:
+            error_msg = f"数据导入失败: {str(error)}"
+            self.db.log_error(error_msg)
+            return False, error_msg
+        report["elapsed"] = time.perf_counter() - start
+        return True, report
+
+    async def _rebuild_imported(self, goal_users):
+        """各分片并行重算；同一分片逐批提交（不一次排满写线程队列）"""
+        grouped = {}
+        for key, user_id in goal_users.items():
+            grouped.setdefault(self.db.shard_index(user_id), []).append(key)
+
+        async def rebuild(shard, keys):
+            for start in range(0, len(keys), REBUILD_CHUNK):
+                chunk = {key: goal_users[key] for key in keys[start:start + REBUILD_CHUNK]}
+                await self.run(self.db.rebuild_imported, chunk, shard=shard)
+
+        await asyncio.gather(*[rebuild(shard, keys) for shard, keys in grouped.items()])
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+        write = name not in self.READ_METHODS
+        by_user = name in self.USER_WRITE_METHODS
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            shard = 0
+            if by_user:
+                # user_id 也可能以关键字参数传入（如 supplement_checkin(user_id=...)）
+                shard = self.db.shard_index(args[0] if args else kwargs['user_id'])
+            return await self.run(attr, *args, write=write, shard=shard, **kwargs)
+        return wrapper
+
+    def close(self):
+        """等待进行中的操作完成后关闭线程和连接"""
+        self._readers.shutdown(wait=True)
+        for writer in self._writers:
+            writer.shutdown(wait=True)
+        if self.write_queue:
+            self.write_queue.drain()
+        self.db.close()
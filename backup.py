@@ -0,0 +1,217 @@
+"""
+在线数据库备份
+- 使用 SQLite 备份 API 按页分步复制，不整体读入内存
+- 复制期间持有一个读事务（WAL快照），写入不会打断或污染备份
+- 每步之间短暂让出，打卡写入照常进行
+- 可选 gzip 流式压缩，并以 SHA-256 校验备份内容
+"""
+import os
+import gzip
+import time
+import shutil
+import sqlite3
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+china_tz = timezone(timedelta(hours=8))
+
+BACKUP_PREFIX = "checkin_backup"
+# 流式读写的块大小
+CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256_file(path, opener=open):
+    """流式计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with opener(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def new_backup_name(backup_dirs, compress=True):
+    """生成在所有备份目录中都未使用的备份文件名（分片存储同一轮次的备份同名）"""
+    timestamp = datetime.now(china_tz).strftime("%Y%m%d_%H%M%S")
+    ext = ".db.gz" if compress else ".db"
+    name = f"{BACKUP_PREFIX}_{timestamp}"
+    suffix = 1
+    while any(
+        os.path.exists(os.path.join(folder, name + ".db" + gz))
+        for folder in backup_dirs for gz in ("", ".gz")
+    ):
+        name = f"{BACKUP_PREFIX}_{timestamp}_{suffix}"
+        suffix += 1
+    return name + ext
+
+
+class BackupEngine:
+    """备份引擎（同步执行，应在数据库线程中调用）"""
+    def __init__(self, db_path, backup_dir, max_backups=3, compress=True,
+                 step_pages=1024, step_pause_ms=1):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.max_backups = max_backups
+        self.compress = compress
+        self.step_pages = step_pages
+        self.step_pause = step_pause_ms / 1000
+
+    def create(self, name=None, rotate=True):
+        """创建一份备份并轮换旧备份
+
+        Args:
+            name (str): 备份文件名（默认按时间生成；分片存储同一轮次使用相同文件名）
+            rotate (bool): 是否立即轮换（分片存储在全部分片成功后再轮换）
+
+        Returns:
+            str: 备份文件路径
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        name = name or new_backup_name([self.backup_dir], self.compress)
+        backup_path = os.path.join(self.backup_dir, name)
+        if os.path.exists(backup_path):
+            raise FileExistsError(f"备份已存在: {name}")
+        snapshot_path = backup_path + ".tmp"
+        try:
+            self._snapshot(snapshot_path)
+            self._quick_check(snapshot_path)
+            checksum = self._store(snapshot_path, backup_path)
+        finally:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+        # 校验文件与备份一起保存
+        with open(backup_path + ".sha256", 'w', encoding='utf-8') as f:
+            f.write(f"{checksum}  {name}\n")
+        if rotate:
+            self.rotate()
+        return backup_path
+
+    def _snapshot(self, snapshot_path):
+        """分步复制数据库到临时文件"""
+        src = sqlite3.connect(self.db_path)
+        dst = sqlite3.connect(snapshot_path)
+        try:
+            # 持有读事务，所有分步都复制同一个快照
+            src.execute("BEGIN")
+            src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            src.backup(dst, pages=self.step_pages, progress=self._yield)
+            src.rollback()
+        finally:
+            dst.close()
+            src.close()
+
+    def _yield(self, status, remaining, total):
+        """每复制一步后让出，避免长时间占用磁盘与CPU"""
+        time.sleep(self.step_pause)
+
+    @staticmethod
+    def _quick_check(path):
+        conn = sqlite3.connect(path)
+        try:
+            result = conn.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            conn.close()
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"备份快照校验失败: {result}")
+
+    def _store(self, snapshot_path, backup_path):
+        """流式写入备份文件（可选压缩），返回备份内容的 SHA-256"""
+        digest = hashlib.sha256()
+        tmp_path = backup_path + ".part"
+        opener = gzip.open if backup_path.endswith(".gz") else open
+        with open(snapshot_path, 'rb') as src, opener(tmp_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                dst.write(chunk)
+        checksum = digest.hexdigest()
+
+        # 回读校验，确认写入的内容可以完整还原
+        if _sha256_file(tmp_path, opener) != checksum:
+            os.remove(tmp_path)
+            raise IOError("备份文件回读校验失败")
+        os.replace(tmp_path, backup_path)
+        return checksum
+
+    def list_backups(self):
+        """按时间倒序列出备份文件路径"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [
+            f for f in os.listdir(self.backup_dir)
+            if f.startswith(BACKUP_PREFIX) and (f.endswith(".db") or f.endswith(".db.gz"))
+        ]
+        return sorted(
+            (os.path.join(self.backup_dir, f) for f in names),
+            key=os.path.getmtime,
+            reverse=True
+        )
+
+    def rotate(self):
+        """仅保留最新的 max_backups 份备份"""
+        for old_backup in self.list_backups()[self.max_backups:]:
+            self.remove(old_backup)
+
+    @staticmethod
+    def remove(backup_path):
+        """删除备份文件及其校验文件"""
+        for path in (backup_path, backup_path + ".sha256"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def verify(backup_path):
+        """按校验文件核对备份内容（无校验文件的旧备份返回 None）"""
+        checksum_path = backup_path + ".sha256"
+        if not os.path.exists(checksum_path):
+            return None
+        with open(checksum_path, 'r', encoding='utf-8') as f:
+            expected = f.read().split()[0]
+        opener = gzip.open if backup_path.endswith(".gz") else open
+        return _sha256_file(backup_path, opener) == expected
+
+    @staticmethod
+    def extract(backup_path, target_path):
+        """将备份还原为普通数据库文件（流式解压）"""
+        opener = gzip.open if backup_path.endswith(".gz") else open
+        with opener(backup_path, 'rb') as src, open(target_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+    def restore(self, backup_path, target_conn):
+        """校验备份后通过备份API整体写入目标连接（目标不能处于事务中）
+
+        其他连接在下一次读取时即可看到恢复后的数据，无需重新连接。
+        """
+        self.apply(self.prepare(backup_path), target_conn)
+
+    def prepare(self, backup_path):
+        """校验备份并解压为临时数据库文件（未通过校验时抛出异常，不留临时文件）
+
+        Returns:
+            str: 临时文件路径（交给 apply 写入后删除，放弃恢复时调用 discard）
+        """
+        if self.verify(backup_path) is False:
+            raise IOError("备份文件校验和不匹配")
+        tmp_path = backup_path + ".restore"
+        try:
+            self.extract(backup_path, tmp_path)
+            self._quick_check(tmp_path)
+        except Exception:
+            self.discard(tmp_path)
+            raise
+        return tmp_path
+
+    def apply(self, tmp_path, target_conn):
+        """把 prepare 得到的临时文件写入目标连接，完成后删除临时文件"""
+        try:
+            src = sqlite3.connect(tmp_path)
+            try:
+                src.backup(target_conn, pages=self.step_pages, progress=self._yield)
+            finally:
+                src.close()
+        finally:
+            self.discard(tmp_path)
+
+    @staticmethod
+    def discard(tmp_path):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
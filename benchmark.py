@@ -0,0 +1,353 @@
+"""
+数据库性能基准测试
+在插件目录的上一级运行（以包方式导入插件模块）：
+    python -m DailyGoalsTracker.benchmark write-behind --writers 200
+    python -m DailyGoalsTracker.benchmark reads --duration 5
+    python -m DailyGoalsTracker.benchmark shards --shards 4
+    python -m DailyGoalsTracker.benchmark bitmaps --years 5
+    python -m DailyGoalsTracker.benchmark rankings --members 2000
+所有测试均使用临时数据库，不会读写正式数据。
+"""
+import os
+import time
+import asyncio
+import random
+import argparse
+import tempfile
+import statistics
+
+from .dbedit import DatabaseManager
+from .shards import ShardedStorage
+from .storage import today_key, day_key, day_to_date, UTC_OFFSET
+from .asyncdb import AsyncDatabase
+from .streaks import rebuild_streaks
+from .rollups import rebuild_rollups
+from .bitmaps import DayBitmap, rebuild_bitmaps
+
+
+def _temp_db(tmp_dir, name="bench.db"):
+    return DatabaseManager(db_path=os.path.join(tmp_dir, name), data_dir=tmp_dir)
+
+
+class _CommitCounter:
+    """统计数据库连接上执行的 COMMIT 次数"""
+    def __init__(self, db):
+        self.count = 0
+        self._open = db.pool._open
+        db.pool._open = self._traced_open
+
+    def _traced_open(self):
+        conn = self._open()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, sql):
+        if sql.startswith("COMMIT"):
+            self.count += 1
+
+
+def _seed(db, users, goals, days, density=1.0):
+    """直接批量写入历史打卡数据（每个用户每个目标每天以 density 的概率打卡一次）"""
+    today = today_key()
+    rng = random.Random(0)
+    with db.pool.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO goals (user_id, goal) VALUES (?, ?)",
+            [(f"user{u}", f"目标{g}") for u in range(users) for g in range(goals)]
+        )
+        rows = conn.execute("SELECT id, user_id FROM goals").fetchall()
+        conn.executemany(
+            "INSERT INTO checkins (user_id, checkin_time, goal_id, day) VALUES (?, ?, ?, ?)",
+            (
+                (user_id, day * 86400 - UTC_OFFSET + 8 * 3600, goal_id, day)  # 当日 08:00
+                for goal_id, user_id in rows
+                for day in range(today - days + 1, today + 1)
+                if density >= 1.0 or rng.random() < density
+            )
+        )
+        rebuild_streaks(conn)
+        rebuild_rollups(conn)
+        rebuild_bitmaps(conn)
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def _print_result(title, count, elapsed, commits):
+    print(
+        f"{title}: {count} 次打卡, 用时 {elapsed:.3f}s, "
+        f"{count / elapsed:.0f} 打卡/s, {commits} 次提交 ({commits / elapsed:.0f} 提交/s)"
+    )
+
+
+async def _burst(adb, writers, goals_per_checkin):
+    """模拟高峰期：writers 个用户同时打卡"""
+    goals = [f"目标{i}" for i in range(goals_per_checkin)]
+    start = time.perf_counter()
+    await asyncio.gather(*[adb.checkin(f"user{i}", goals) for i in range(writers)])
+    return time.perf_counter() - start
+
+
+def bench_write_behind(args):
+    """逐次提交 vs 组提交"""
+    async def run(write_behind):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = _temp_db(tmp_dir)
+            counter = _CommitCounter(db)
+            adb = AsyncDatabase(db, write_behind=write_behind)
+            elapsed = await _burst(adb, args.writers, args.goals)
+            adb.close()
+            return elapsed, counter.count
+
+    elapsed, commits = asyncio.run(run(None))
+    _print_result("逐次提交", args.writers, elapsed, commits)
+    elapsed, commits = asyncio.run(run({
+        "enabled": True,
+        "window_ms": args.window_ms,
+        "max_batch": args.max_batch,
+    }))
+    _print_result("组提交  ", args.writers, elapsed, commits)
+
+
+def bench_reads(args):
+    """报表读取与打卡写入并发：只读快照连接下写入延迟是否受影响"""
+    async def writer(adb, deadline, latencies):
+        while time.perf_counter() < deadline:
+            user = f"user{random.randrange(args.users)}"
+            start = time.perf_counter()
+            await adb.checkin(user, [f"目标{random.randrange(args.goals)}"])
+            latencies.append(time.perf_counter() - start)
+
+    async def reader(adb, deadline, latencies):
+        while time.perf_counter() < deadline:
+            user = f"user{random.randrange(args.users)}"
+            start = time.perf_counter()
+            await adb.get_checkin_report(user)
+            await adb.get_recent_checkins(user)
+            latencies.append(time.perf_counter() - start)
+
+    async def run(readers):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = _temp_db(tmp_dir)
+            _seed(db, args.users, args.goals, args.days)
+            adb = AsyncDatabase(db, readers=max(readers, 1))
+            deadline = time.perf_counter() + args.duration
+            write_lat, read_lat = [], []
+            await asyncio.gather(
+                *[writer(adb, deadline, write_lat) for _ in range(args.writers)],
+                *[reader(adb, deadline, read_lat) for _ in range(readers)]
+            )
+            adb.close()
+            return write_lat, read_lat
+
+    for title, readers in (("仅写入    ", 0), ("读写并发  ", args.readers)):
+        write_lat, read_lat = asyncio.run(run(readers))
+        line = (
+            f"{title}: 打卡 {len(write_lat) / args.duration:.0f}/s, "
+            f"延迟 p50 {statistics.median(write_lat) * 1000:.2f}ms "
+            f"p99 {_percentile(write_lat, 99) * 1000:.2f}ms"
+        )
+        if read_lat:
+            line += (
+                f" | 报表 {len(read_lat) / args.duration:.0f}/s, "
+                f"p50 {statistics.median(read_lat) * 1000:.2f}ms"
+            )
+        print(line)
+
+
+def bench_shards(args):
+    """并发打卡：单分片 vs 多分片（每个分片独立写锁与写线程）"""
+    async def writer(adb, index):
+        for i in range(args.checkins):
+            await adb.checkin(f"user{index}_{i % args.users_per_writer}", ["目标"])
+
+    async def run(shards):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            adb = AsyncDatabase(ShardedStorage(data_dir=tmp_dir, shards=shards))
+            start = time.perf_counter()
+            await asyncio.gather(*[writer(adb, i) for i in range(args.writers)])
+            elapsed = time.perf_counter() - start
+            adb.close()
+            return elapsed
+
+    total = args.writers * args.checkins
+    for shards in (1, args.shards):
+        elapsed = asyncio.run(run(shards))
+        print(f"{shards} 个分片: {total} 次打卡, 用时 {elapsed:.3f}s, {total / elapsed:.0f} 打卡/s")
+
+
+# 逐行计算的参照实现（位图之前的做法）
+SQL_USER_GOAL_DAYS = '''
+    SELECT DISTINCT g.goal, c.day
+    FROM checkins c
+    JOIN goals g ON c.goal_id = g.id
+    WHERE c.user_id = ?
+    ORDER BY g.goal, c.day
+'''
+
+
+def _stats_by_rows(db, user_id, today, window_start, month_start):
+    with db.read_pool.snapshot() as conn:
+        rows = conn.execute(SQL_USER_GOAL_DAYS, (user_id,)).fetchall()
+    goals, all_days = {}, set()
+    for goal, day in rows:
+        goals.setdefault(goal, []).append(day)
+        all_days.add(day)
+    user_streak = 0
+    while today - user_streak in all_days:
+        user_streak += 1
+    stats = {}
+    for goal, days in goals.items():
+        longest = run = 0
+        prev = None
+        for day in days:
+            run = run + 1 if prev is not None and day == prev + 1 else 1
+            longest = max(longest, run)
+            prev = day
+        stats[goal] = (
+            longest,
+            sum(1 for day in days if window_start <= day <= today),
+            [day for day in days if month_start <= day <= today],
+        )
+    return user_streak, stats
+
+
+def _stats_by_bitmaps(db, user_id, today, window_start, month_start):
+    bitmaps = db.get_day_bitmaps(user_id)
+    merged = DayBitmap()
+    for bitmap in bitmaps.values():
+        merged = merged | bitmap
+    stats = {
+        goal: (
+            bitmap.longest_streak(),
+            bitmap.count(window_start, today),
+            bitmap.days(month_start, today),
+        )
+        for goal, bitmap in bitmaps.items()
+    }
+    return merged.streak_ending(today), stats
+
+
+def bench_bitmaps(args):
+    """多年历史：逐行计算 vs 位图（连续天数、最长连续、近一年天数、本月月历）"""
+    today = today_key()
+    window_start = today - 364
+    month_start = day_key(day_to_date(today).replace(day=1))
+    users = [f"user{u}" for u in range(args.users)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = _temp_db(tmp_dir)
+        _seed(db, args.users, args.goals, args.years * 365, args.density)
+        conn = db.pool.connection()
+        checkins = conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0]
+        blob_bytes = conn.execute("SELECT SUM(LENGTH(bits)) FROM goal_bitmaps").fetchone()[0]
+        print(
+            f"历史数据: {args.users} 用户 x {args.goals} 目标 x {args.years} 年, "
+            f"{checkins} 条打卡记录, 位图共 {blob_bytes} 字节"
+        )
+        for title, func in (("逐行计算", _stats_by_rows), ("位图    ", _stats_by_bitmaps)):
+            start = time.perf_counter()
+            for user_id in users:
+                func(db, user_id, today, window_start, month_start)
+            elapsed = time.perf_counter() - start
+            print(f"{title}: {len(users)} 个用户, 用时 {elapsed:.3f}s, 每用户 {elapsed / len(users) * 1000:.2f}ms")
+        for user_id in users[:20]:
+            assert _stats_by_rows(db, user_id, today, window_start, month_start) == \
+                _stats_by_bitmaps(db, user_id, today, window_start, month_start), user_id
+        db.close()
+
+
+def bench_rankings(args):
+    """群排行：逐成员逐目标查询 vs 预计算的前 K 名索引；群统计：逐成员读取 vs 聚合查询"""
+    goal = "目标0"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = _temp_db(tmp_dir)
+        _seed(db, args.members, args.goals, args.days, args.density)
+        members = [f"user{u}" for u in range(args.members)]
+        start = time.perf_counter()
+        for user_id in members:
+            db.join_group(user_id, "group")
+        print(f"登记 {len(members)} 名成员: {time.perf_counter() - start:.3f}s")
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            naive = sorted(
+                ((user_id, db.get_consecutive_days(user_id, goal)) for user_id in members),
+                key=lambda row: -row[1]
+            )[:args.top]
+        elapsed = (time.perf_counter() - start) / args.rounds
+        print(f"逐成员查询: 每次排行 {elapsed * 1000:.2f}ms（{len(members)} 次查询）")
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            streaks, _ = db.get_group_ranking("group", goal, args.top)
+        elapsed = (time.perf_counter() - start) / args.rounds
+        print(f"前 K 名索引: 每次排行 {elapsed * 1000:.2f}ms")
+        assert [days for _, days in naive] == [days for _, days in streaks], (naive, streaks)
+
+        since_day = today_key() - 6
+        start = time.perf_counter()
+        for user_id in members:
+            [row for row in db.get_checkins(user_id) if row[2] >= (since_day * 86400 - UTC_OFFSET)]
+        elapsed = time.perf_counter() - start
+        print(f"群统计（逐成员读取记录）: {elapsed * 1000:.2f}ms")
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            stats = db.get_group_stats("group", since_day)
+        elapsed = (time.perf_counter() - start) / args.rounds
+        print(f"群统计（聚合查询）: {elapsed * 1000:.2f}ms，近7天 {stats['checkins']} 次打卡")
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DailyGoalsTracker 数据库基准测试")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("write-behind", help="高峰期并发打卡：逐次提交 vs 组提交")
+    p.add_argument("--writers", type=int, default=200, help="并发打卡用户数")
+    p.add_argument("--goals", type=int, default=3, help="每次打卡的目标数")
+    p.add_argument("--window-ms", type=int, default=20)
+    p.add_argument("--max-batch", type=int, default=64)
+    p.set_defaults(func=bench_write_behind)
+
+    p = sub.add_parser("reads", help="报表读取与打卡写入并发")
+    p.add_argument("--users", type=int, default=200, help="历史数据用户数")
+    p.add_argument("--goals", type=int, default=5, help="每个用户的目标数")
+    p.add_argument("--days", type=int, default=365, help="每个目标的历史打卡天数")
+    p.add_argument("--writers", type=int, default=8, help="并发打卡协程数")
+    p.add_argument("--readers", type=int, default=4, help="并发报表协程数")
+    p.add_argument("--duration", type=float, default=5.0, help="每轮运行秒数")
+    p.set_defaults(func=bench_reads)
+
+    p = sub.add_parser("shards", help="并发打卡：单分片 vs 多分片")
+    p.add_argument("--shards", type=int, default=4, help="对比的分片数")
+    p.add_argument("--writers", type=int, default=64, help="并发打卡协程数")
+    p.add_argument("--checkins", type=int, default=50, help="每个协程的打卡次数")
+    p.add_argument("--users-per-writer", type=int, default=10)
+    p.set_defaults(func=bench_shards)
+
+    p = sub.add_parser("bitmaps", help="多年历史统计：逐行计算 vs 位图")
+    p.add_argument("--users", type=int, default=200, help="用户数")
+    p.add_argument("--goals", type=int, default=3, help="每个用户的目标数")
+    p.add_argument("--years", type=int, default=5, help="历史年数")
+    p.add_argument("--density", type=float, default=0.8, help="每天打卡的概率")
+    p.set_defaults(func=bench_bitmaps)
+
+    p = sub.add_parser("rankings", help="群排行与群统计：逐成员查询 vs 索引/聚合查询")
+    p.add_argument("--members", type=int, default=2000, help="群成员数")
+    p.add_argument("--goals", type=int, default=3, help="每个成员的目标数")
+    p.add_argument("--days", type=int, default=90, help="历史天数")
+    p.add_argument("--density", type=float, default=0.8, help="每天打卡的概率")
+    p.add_argument("--top", type=int, default=10, help="排行人数")
+    p.add_argument("--rounds", type=int, default=20, help="重复次数")
+    p.set_defaults(func=bench_rankings)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
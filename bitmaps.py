@@ -0,0 +1,222 @@
+"""
+目标打卡日位图（goal_bitmaps）
+- 每个目标一行：bits 的第 i 位（小端字节序）表示 base_day + i 日已打卡
+- 打卡、补打卡时置位；记录直接删除且当日已无记录时清位；并入归档时不变
+- 连续天数、最长连续、区间打卡天数与月历均由整数位运算完成，不逐条读取打卡记录
+"""
+from .archive import decode_days
+
+SQL_USER_BITMAPS = '''
+    SELECT g.goal, b.base_day, b.bits
+    FROM goals g
+    JOIN goal_bitmaps b ON b.goal_id = g.id
+    WHERE g.user_id = ?
+'''
+
+
+class DayBitmap:
+    """打卡日集合（以 Python 大整数作位图）"""
+    __slots__ = ('base', 'bits')
+
+    def __init__(self, base=0, bits=0):
+        self.base = base
+        self.bits = bits
+
+    @classmethod
+    def from_blob(cls, base, blob):
+        return cls(base, int.from_bytes(blob, 'little'))
+
+    @classmethod
+    def from_days(cls, days):
+        bitmap = cls()
+        for day in days:
+            bitmap.add(day)
+        return bitmap
+
+    def to_blob(self):
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __contains__(self, day):
+        offset = day - self.base
+        return offset >= 0 and (self.bits >> offset) & 1 == 1
+
+    def __or__(self, other):
+        base = min(self.base, other.base) if self and other else (self.base if self else other.base)
+        bits = 0
+        for bitmap in (self, other):
+            if bitmap:
+                bits |= bitmap.bits << (bitmap.base - base)
+        return DayBitmap(base, bits)
+
+    def add(self, day):
+        if not self.bits:
+            self.base = day
+        elif day < self.base:
+            self.bits <<= self.base - day
+            self.base = day
+        self.bits |= 1 << (day - self.base)
+
+    def discard(self, day):
+        offset = day - self.base
+        if offset >= 0:
+            self.bits &= ~(1 << offset)
+        if self.bits:
+            # 起始日保持在最早的打卡日
+            low = (self.bits & -self.bits).bit_length() - 1
+            self.bits >>= low
+            self.base += low
+
+    def first_day(self):
+        return self.base if self.bits else None
+
+    def last_day(self):
+        return self.base + self.bits.bit_length() - 1 if self.bits else None
+
+    def _window(self, start, end):
+        """[start, end] 区间的位（低位对应 start）"""
+        lo = max(start - self.base, 0)
+        hi = end - self.base
+        if hi < lo:
+            return 0
+        return (self.bits >> lo) & ((1 << (hi - lo + 1)) - 1)
+
+    def count(self, start=None, end=None):
+        """区间内的打卡天数（默认全部）"""
+        if start is None and end is None:
+            return self.bits.bit_count()
+        start = self.base if start is None else start
+        end = self.last_day() if end is None else end
+        if end is None:
+            return 0
+        return self._window(start, end).bit_count()
+
+    def days(self, start, end):
+        """区间内的打卡日（升序），用于月历"""
+        first = max(start, self.base)
+        x = self._window(start, end)
+        result = []
+        while x:
+            low = x & -x
+            result.append(first + low.bit_length() - 1)
+            x ^= low
+        return result
+
+    def streak_ending(self, day):
+        """截至 day 的连续天数（day 未打卡为0）"""
+        if day not in self:
+            return 0
+        offset = day - self.base
+        gaps = ~self.bits & ((1 << (offset + 1)) - 1)
+        if not gaps:
+            return offset + 1
+        return offset - (gaps.bit_length() - 1)
+
+    def longest_streak(self):
+        """最长连续天数：每次 x &= x >> 1 使所有连续区间缩短1天"""
+        x, longest = self.bits, 0
+        while x:
+            x &= x >> 1
+            longest += 1
+        return longest
+
+
+def create_bitmap_table(c):
+    """创建位图表"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS goal_bitmaps (
+            goal_id INTEGER PRIMARY KEY,
+            base_day INTEGER NOT NULL,
+            bits BLOB NOT NULL,
+            FOREIGN KEY (goal_id) REFERENCES goals(id)
+        )
+    ''')
+
+
+def load_bitmap(c, goal_id):
+    row = c.execute("SELECT base_day, bits FROM goal_bitmaps WHERE goal_id = ?", (goal_id,)).fetchone()
+    return DayBitmap.from_blob(*row) if row else DayBitmap()
+
+
+def save_bitmap(c, goal_id, bitmap):
+    if bitmap:
+        c.execute(
+            "INSERT OR REPLACE INTO goal_bitmaps (goal_id, base_day, bits) VALUES (?, ?, ?)",
+            (goal_id, bitmap.base, bitmap.to_blob())
+        )
+    else:
+        c.execute("DELETE FROM goal_bitmaps WHERE goal_id = ?", (goal_id,))
+
+
+def _group(rows):
+    grouped = {}
+    for goal_id, day in rows:
+        grouped.setdefault(goal_id, set()).add(day)
+    return grouped
+
+
+def set_days(c, rows):
+    """置位新写入的打卡日（需在写入记录的同一事务中调用）
+
+    Args:
+        rows: [(goal_id, day), ...]
+    """
+    for goal_id, days in _group(rows).items():
+        bitmap = load_bitmap(c, goal_id)
+        for day in days:
+            bitmap.add(day)
+        save_bitmap(c, goal_id, bitmap)
+
+
+def clear_days(c, rows):
+    """记录直接删除后，清除已无记录的打卡日（需在删除之后调用）"""
+    for goal_id, days in _group(rows).items():
+        bitmap = load_bitmap(c, goal_id)
+        for day in days:
+            if not c.execute(
+                "SELECT 1 FROM checkins WHERE goal_id = ? AND day = ? LIMIT 1", (goal_id, day)
+            ).fetchone():
+                bitmap.discard(day)
+        save_bitmap(c, goal_id, bitmap)
+
+
+def delete_bitmaps(c, goal_ids):
+    """删除目标的位图"""
+    goal_ids = list(goal_ids)
+    if goal_ids:
+        c.execute(
+            "DELETE FROM goal_bitmaps WHERE goal_id IN ({})".format(','.join('?' * len(goal_ids))),
+            goal_ids
+        )
+
+
+def rebuild_bitmaps(c, goal_ids=None):
+    """从打卡记录与归档重建位图（goal_ids为空时重建全部）"""
+    if goal_ids is None:
+        where, params = '', []
+        c.execute("DELETE FROM goal_bitmaps")
+    else:
+        params = list(goal_ids)
+        if not params:
+            return
+        where = "AND goal_id IN ({})".format(','.join('?' * len(params)))
+        delete_bitmaps(c, params)
+    bitmaps = {}
+    for goal_id, month, blob in c.execute(
+        f"SELECT goal_id, month, days FROM checkin_archive WHERE 1 {where} ORDER BY goal_id, month",
+        params
+    ):
+        bitmap = bitmaps.setdefault(goal_id, DayBitmap())
+        for day in decode_days(month, blob):
+            bitmap.add(day)
+    for goal_id, day in c.execute(
+        f"SELECT DISTINCT goal_id, day FROM checkins WHERE day IS NOT NULL {where} ORDER BY goal_id, day",
+        params
+    ):
+        bitmaps.setdefault(goal_id, DayBitmap()).add(day)
+    c.executemany(
+        "INSERT INTO goal_bitmaps (goal_id, base_day, bits) VALUES (?, ?, ?)",
+        [(goal_id, bitmap.base, bitmap.to_blob()) for goal_id, bitmap in bitmaps.items()]
+    )
@@ -0,0 +1,64 @@
+import os
+import json
+import copy
+
+# 插件配置文件（可选，缺省项使用默认值）
+CONFIG_PATH = os.path.join("data/plugins/DailyGoalsTracker", "config.json")
+
+DEFAULT_CONFIG = {
+    # 存储引擎：sqlite（持久化）或 memory（内存，重启即丢失）
+    "storage": {
+        "engine": "sqlite",
+        "data_dir": "data/plugins/DailyGoalsTracker",   # 数据库、备份与日志目录
+    },
+    # 打卡写入合并：高峰期把并发打卡合并成一次提交
+    "write_behind": {
+        "enabled": False,
+        "window_ms": 20,    # 收集窗口（毫秒）
+        "max_batch": 64,    # 单次提交最多打卡请求数
+    },
+    # 过期打卡记录归档：每日低峰时段后台分批执行
+    "retention": {
+        "enabled": False,
+        "keep_days": 365,       # 热表保留最近多少天的记录
+        "archive": True,        # 过期记录并入按月归档（False 为直接删除）
+        "batch_size": 500,      # 每批移出的记录数
+        "pause_ms": 50,         # 批次之间让出写线程的时间
+        "offpeak_start": 3,     # 低峰时段（UTC+8 小时）
+        "offpeak_end": 5,
+        "vacuum_pages": 1000,   # 每次增量回收的页数
+    },
+    # 群统计（/打卡统计）
+    "group_stats": {
+        "days": 7,              # 默认统计最近多少天
+        "cache_seconds": 60,    # 同一群的结果缓存时间
+        "top_goals": 5,         # 显示的热门目标数
+    },
+    # 数据库备份
+    "backup": {
+        "max_backups": 3,       # 保留的备份份数
+        "compress": True,       # gzip 压缩
+    },
+}
+
+
+def _merge(base, override):
+    """递归合并配置（override 覆盖 base）"""
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def load_config(path=CONFIG_PATH):
+    """读取配置文件并补全默认值"""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                _merge(config, json.load(f))
+        except json.JSONDecodeError:
+            pass
+    return config
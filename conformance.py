@@ -0,0 +1,525 @@
+"""
+存储引擎一致性校验
+所有存储引擎必须通过同一组检查，在插件目录的上一级运行：
+    python -m DailyGoalsTracker.conformance            # 校验全部引擎
+    python -m DailyGoalsTracker.conformance memory     # 只校验指定引擎
+每项检查使用独立的临时数据目录，不会读写正式数据。
+"""
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import tempfile
+import traceback
+from datetime import datetime, timedelta
+
+from .storage import create_storage, china_tz, today_key, day_to_date, month_of, epoch_day, from_epoch
+from .rollups import DAY, MONTH, YEAR
+from .migrations import MIGRATIONS, latest_version
+from .dbedit import DatabaseManager
+
+# 引擎名称 -> 配置中的 storage 段
+ENGINES = {
+    "sqlite": {"engine": "sqlite"},
+    "sharded": {"engine": "sqlite", "shards": 3},
+    "memory": {"engine": "memory"},
+}
+CHECKS = []
+
+
+def check(func):
+    """登记一项检查"""
+    CHECKS.append(func)
+    return func
+
+
+def _days_ago(n):
+    return (datetime.now(china_tz) - timedelta(days=n)).strftime('%Y-%m-%d')
+
+
+def _expect_error(func, *args):
+    try:
+        func(*args)
+    except ValueError:
+        return
+    raise AssertionError(f"{func.__name__}{args} 应抛出 ValueError")
+
+
+@check
+def checkin_and_lookup(db):
+    ids = db.checkin("u1", ["读书", "跑步"])
+    assert len(ids) == 2 and len(set(ids)) == 2, ids
+    rows = db.get_checkins("u1")
+    assert sorted(row[3] for row in rows) == sorted(["读书", "跑步"]), rows
+    assert all(row[1] == "u1" for row in rows), rows
+    assert {row[0] for row in rows} == set(ids), rows
+    assert db.get_goals(ids[0]) == ["读书"]
+    assert db.get_goals(-1) == []
+    assert db.get_checkins("nobody") == []
+
+
+@check
+def epoch_times(db):
+    before = int(datetime.now(china_tz).timestamp())
+    db.checkin("u1", ["a"])
+    db.supplement_checkin("u1", "b", "2024-03-01")
+    times = {row[3]: row[2] for row in db.get_checkins("u1")}
+    assert all(isinstance(t, int) for t in times.values()), times
+    assert before <= times["a"] <= before + 5, times
+    assert epoch_day(times["a"]) == today_key()
+    # 补打卡只给日期时为 UTC+8 中午
+    assert from_epoch(times["b"]).strftime('%Y-%m-%d %H:%M') == "2024-03-01 12:00"
+
+
+@check
+def checkin_many_results(db):
+    results = db.checkin_many([("u1", ["a"]), ("u2", ["b", "c"])])
+    assert len(results) == 2
+    assert len(results[0]) == 1 and len(results[1]) == 2, results
+    assert len(db.get_checkins("u2")) == 2
+
+
+@check
+def last_goals(db):
+    assert db.get_last_goals("u1") == []
+    db.supplement_checkin("u1", "旧目标", _days_ago(3))
+    db.checkin("u1", ["a", "b"])
+    assert db.get_last_goals("u1") == ["a", "b"], db.get_last_goals("u1")
+
+
+@check
+def today_status_and_streaks(db):
+    db.supplement_checkin("u1", "a", _days_ago(2))
+    db.checkin("u1", ["a"])
+    status = db.get_today_status("u1", ["a", "b"])
+    assert status == {"a": (True, 1), "b": (False, 0)}, status
+    # 补录中间一天后连续天数修复为3
+    db.supplement_checkin("u1", "a", _days_ago(1))
+    assert db.get_consecutive_days("u1", "a") == 3
+    assert db.has_checked_in_today("u1", "a")
+    assert not db.has_checked_in_today("u1", "b")
+    # 仅有历史记录的目标当前连续天数为0
+    db.supplement_checkin("u1", "b", _days_ago(1))
+    assert db.get_today_status("u1", ["b"]) == {"b": (False, 0)}
+
+
+@check
+def user_consecutive_days(db):
+    assert db.get_consecutive_days("u1") == 0
+    db.checkin("u1", ["a"])
+    db.supplement_checkin("u1", "b", _days_ago(1))
+    db.supplement_checkin("u1", "a", _days_ago(3))
+    assert db.get_consecutive_days("u1") == 2
+
+
+@check
+def checkin_report(db):
+    db.checkin("u1", ["a", "b"])
+    db.supplement_checkin("u1", "c", _days_ago(5))
+    checkins, streaks = db.get_checkin_report("u1")
+    assert len(checkins) == 3
+    assert streaks == {"a": 1, "b": 1, "c": 0}, streaks
+
+
+@check
+def supplement_rejects(db):
+    db.supplement_checkin("u1", "a", _days_ago(1))
+    _expect_error(db.supplement_checkin, "u1", "a", _days_ago(1))
+    _expect_error(db.supplement_checkin, "u1", "a", _days_ago(-2))
+    _expect_error(db.supplement_checkin, "u1", "a", "不是日期")
+    assert len(db.get_checkins("u1")) == 1
+
+
+@check
+def recent_checkins(db):
+    db.supplement_checkin("u1", "b", _days_ago(40))
+    db.supplement_checkin("u1", "b", _days_ago(3))
+    db.checkin("u1", ["a"])
+    recent = db.get_recent_checkins("u1")
+    assert list(recent) == ["a", "b"], recent
+    assert len(recent["b"]) == 1
+    assert len(db.get_recent_checkins("u1", days=60)["b"]) == 2
+
+
+@check
+def admin_qq(db):
+    assert db.get_admin_qq() == '0'
+    db.checkin("u2", ["a"])
+    db.supplement_checkin("u1", "a", _days_ago(10))
+    assert db.get_admin_qq() == "u1"
+
+
+@check
+def delete_goal(db):
+    db.checkin("u1", ["a", "b"])
+    assert db.delete_goals("u1", "a") == 1
+    assert db.delete_goals("u1", "a") == 0
+    assert [row[3] for row in db.get_checkins("u1")] == ["b"]
+    assert db.get_today_status("u1", ["a"]) == {"a": (False, 0)}
+    # 删除后重新打卡从1开始
+    db.checkin("u1", ["a"])
+    assert db.get_consecutive_days("u1", "a") == 1
+
+
+@check
+def delete_all(db):
+    db.checkin("u1", ["a", "b"])
+    db.checkin("u2", ["a"])
+    assert db.delete_all_checkins("u1") == 2
+    assert db.get_checkins("u1") == []
+    assert db.get_consecutive_days("u1", "a") == 0
+    assert len(db.get_checkins("u2")) == 1
+    db.clear_database()
+    assert db.get_checkins("u2") == []
+    assert db.get_admin_qq() == '0'
+
+
+@check
+def purge_expired(db):
+    for n in (30, 20, 10):
+        db.supplement_checkin("u1", "old", _days_ago(n))
+    db.supplement_checkin("u1", "kept", _days_ago(20))
+    db.checkin("u1", ["kept"])
+    deleted = db.purge_checkins_chunk(today_key() - 15, limit=2)
+    assert deleted == 2, deleted
+    deleted = db.purge_checkins_chunk(today_key() - 15, limit=2)
+    assert deleted == 1, deleted
+    assert db.purge_checkins_chunk(today_key() - 15) == 0
+    goals = sorted(row[3] for row in db.get_checkins("u1"))
+    assert goals == ["kept", "old"], goals
+    assert db.clear_old_checkins(days=5) == 1
+    # 近期记录移入归档，目标保留，历史统计不变
+    assert sorted(row[3] for row in db.get_checkins("u1")) == ["kept"]
+    history = db.get_history_summary("u1")
+    assert history["old"]["days"] == 3, history
+    assert history["old"]["first_day"] == today_key() - 30, history
+    assert history["kept"]["days"] == 2, history
+    # 已归档的日期不能重复补录
+    _expect_error(db.supplement_checkin, "u1", "old", _days_ago(30))
+
+
+@check
+def purge_without_archive(db):
+    for n in (30, 20):
+        db.supplement_checkin("u1", "old", _days_ago(n))
+    assert db.clear_old_checkins(days=15, archive=False) == 2
+    # 失去所有记录的目标被清理，可重新补录
+    assert db.get_history_summary("u1") == {}
+    db.supplement_checkin("u1", "old", _days_ago(30))
+
+
+@check
+def history_summary(db):
+    db.supplement_checkin("u1", "read", _days_ago(40))
+    db.supplement_checkin("u1", "read", _days_ago(39))
+    db.checkin("u1", ["read", "read"])
+    db.clear_old_checkins(days=35)
+    summary = db.get_history_summary("u1")["read"]
+    assert summary["days"] == 3, summary
+    assert summary["last_day"] == today_key(), summary
+    assert sum(summary["months"].values()) == 3, summary
+    this_year = day_to_date(today_key()).year
+    assert db.get_history_summary("u1", year=this_year - 2) == {}
+
+
+@check
+def period_stats(db):
+    today = today_key()
+    old_day = today - 400
+    old_year, old_month = day_to_date(old_day).year, month_of(old_day)
+    db.checkin("u1", ["read", "run"])
+    db.checkin("u1", ["read"])
+    db.supplement_checkin("u1", "read", _days_ago(400))
+    db.supplement_checkin("u1", "run", _days_ago(400))
+    assert db.get_period_stats("u1", DAY, today) == {"read": (1, 2), "run": (1, 1)}
+    assert db.get_period_stats("u1", MONTH, month_of(today)) == {"read": (1, 2), "run": (1, 1)}
+    assert db.get_period_stats("u1", YEAR, day_to_date(today).year)["read"] == (1, 2)
+    expected = {"read": (1, 1), "run": (1, 1)}
+    assert db.get_period_stats("u1", YEAR, old_year) == expected
+    # 并入归档后汇总不变，重算结果一致
+    db.clear_old_checkins(days=30)
+    assert db.get_period_stats("u1", MONTH, old_month) == expected
+    db.rebuild_rollups()
+    assert db.get_period_stats("u1", YEAR, old_year) == expected
+    assert db.get_period_stats("u1", DAY, today) == {"read": (1, 2), "run": (1, 1)}
+    db.delete_goals("u1", "run")
+    assert db.get_period_stats("u1", YEAR, old_year) == {"read": (1, 1)}
+    assert db.get_period_stats("u2", YEAR, old_year) == {}
+
+
+@check
+def period_stats_after_delete(db):
+    db.supplement_checkin("u1", "read", _days_ago(400))
+    db.checkin("u1", ["read"])
+    db.clear_old_checkins(days=30, archive=False)
+    year = day_to_date(today_key() - 400).year
+    assert db.get_period_stats("u1", YEAR, year) == {}
+    db.delete_all_checkins("u1")
+    assert db.get_period_stats("u1", DAY, today_key()) == {}
+
+
+@check
+def day_bitmaps(db):
+    for n in (12, 11, 10, 5, 4, 3, 2, 1):
+        db.supplement_checkin("u1", "read", _days_ago(n))
+    db.checkin("u1", ["read", "read"])
+    for n in (9, 8, 7, 6):
+        db.supplement_checkin("u1", "run", _days_ago(n))
+    bitmap = db.get_day_bitmaps("u1")["read"]
+    today = today_key()
+    assert bitmap.count() == 9, bitmap.count()
+    assert bitmap.streak_ending(today) == 6
+    assert bitmap.longest_streak() == 6
+    assert bitmap.count(today - 11, today - 3) == 5
+    assert bitmap.days(today - 6, today - 3) == [today - 5, today - 4, today - 3]
+    assert bitmap.first_day() == today - 12 and bitmap.last_day() == today
+    # 不指定目标时合并各目标（run 填补了第6~9天的空缺）
+    assert db.get_consecutive_days("u1") == 13
+    # 并入归档后位图不变；直接删除后清位
+    db.clear_old_checkins(days=8)
+    assert db.get_day_bitmaps("u1")["read"].count() == 9
+    assert db.get_consecutive_days("u1") == 13
+    db.clear_old_checkins(days=3, archive=False)
+    assert db.get_day_bitmaps("u1")["read"].days(today - 12, today) == [
+        today - 12, today - 11, today - 10, today - 3, today - 2, today - 1, today
+    ]
+    assert db.get_consecutive_days("u1") == 4
+    db.delete_goals("u1", "read")
+    assert list(db.get_day_bitmaps("u1")) == ["run"]
+
+
+@check
+def supplement_after_archive(db):
+    # 补录早于最近打卡日时连续统计按历史重算，已归档的打卡日同样计入
+    db.join_group("u1", "g1")
+    for n in range(40, 0, -1):
+        db.supplement_checkin("u1", "read", _days_ago(n))
+    db.checkin("u1", ["read"])
+    db.clear_old_checkins(days=10)
+    db.supplement_checkin("u1", "read", _days_ago(50))
+    assert db.get_consecutive_days("u1", "read") == 41
+    assert db.get_consecutive_days("u1") == 41
+    assert db.get_today_status("u1", ["read"]) == {"read": (True, 41)}
+    streaks, totals = db.get_group_ranking("g1", "read")
+    assert streaks == [("u1", 41)], streaks
+    assert totals == [("u1", 42)], totals
+
+
+@check
+def group_ranking(db):
+    # u1: 今日连续3天；u2: 连续1天但累计4天；u3: 今日未打卡；u4: 未入群
+    for n in (2, 1):
+        db.supplement_checkin("u1", "read", _days_ago(n))
+    db.checkin("u1", ["read"])
+    assert db.join_group("u1", "g1") is True
+    assert db.join_group("u1", "g1") is False
+    db.join_group("u2", "g1")
+    for n in (9, 7, 5):
+        db.supplement_checkin("u2", "read", _days_ago(n))
+    db.checkin("u2", ["read", "run"])
+    db.join_group("u3", "g1")
+    for n in (2, 1):
+        db.supplement_checkin("u3", "run", _days_ago(n))
+    db.checkin("u4", ["read"])
+    streaks, totals = db.get_group_ranking("g1", "read")
+    assert streaks == [("u1", 3), ("u2", 1)], streaks
+    assert totals == [("u2", 4), ("u1", 3)], totals
+    streaks, totals = db.get_group_ranking("g1")
+    assert streaks == [("u1", 3), ("u2", 1)], streaks
+    assert totals == [("u2", 4), ("u1", 3), ("u3", 2)], totals
+    assert db.get_group_ranking("g1", "read", limit=1)[1] == [("u2", 4)]
+    assert db.get_group_ranking("g2") == ([], [])
+    # 删除目标后排行随之更新
+    db.delete_goals("u2", "read")
+    streaks, totals = db.get_group_ranking("g1")
+    assert totals == [("u1", 3), ("u3", 2), ("u2", 1)], totals
+    assert db.get_group_ranking("g1", "read")[1] == [("u1", 3)]
+    db.delete_all_checkins("u1")
+    assert db.get_group_ranking("g1", "read") == ([], [])
+
+
+@check
+def group_stats(db):
+    for user_id in ("u1", "u2", "u4"):
+        db.join_group(user_id, "g1")
+    db.checkin("u1", ["read", "run"])
+    db.supplement_checkin("u1", "read", _days_ago(3))     # 12:00
+    db.supplement_checkin("u1", "read", _days_ago(10))    # 统计范围之外
+    db.checkin("u2", ["read"])
+    db.checkin("u3", ["read"])                            # 非本群成员
+    stats = db.get_group_stats("g1", today_key() - 6)
+    assert (stats["members"], stats["active"], stats["checkins"]) == (3, 2, 4), stats
+    assert stats["goals"] == {"read": (2, 3), "run": (1, 1)}, stats["goals"]
+    hours = [0] * 24
+    hours[datetime.now(china_tz).hour] += 3
+    hours[12] += 1
+    assert stats["hours"] == hours, stats["hours"]
+    assert db.get_group_stats("g2", today_key() - 6)["members"] == 0
+
+
+
+@check
+def export_import(db):
+    db.checkin("u1", ["read", "run"])
+    db.supplement_checkin("u1", "read", _days_ago(1))
+    db.supplement_checkin("u1", "read", _days_ago(3))
+    db.checkin("u2", ["run"])
+    checkins = sorted((row[1], row[2], row[3]) for row in db.get_checkins("u1"))
+    report = db.get_checkin_report("u1")[1]
+    path = os.path.join(db.data_dir, "export", "all.csv")
+    ok, result = db.export_checkins(path)
+    assert ok and result["count"] == 5, result
+    ok, result = db.export_checkins(os.path.join(db.data_dir, "export", "u2.jsonl"), user_id="u2")
+    assert ok and result["count"] == 1, result
+
+    # 重复导入全部跳过
+    ok, result = db.import_checkins(path)
+    assert ok and (result["imported"], result["skipped"], result["invalid"]) == (0, 5, 0), result
+    assert len(db.get_checkins("u1")) == 4
+
+    db.clear_database()
+    db.join_group("u1", "g1")
+    ok, result = db.import_checkins(path)
+    assert ok and (result["imported"], result["skipped"]) == (5, 0), result
+    assert sorted((row[1], row[2], row[3]) for row in db.get_checkins("u1")) == checkins
+    assert db.get_checkin_report("u1")[1] == report, db.get_checkin_report("u1")[1]
+    assert db.get_period_stats("u1", MONTH, month_of(today_key()))["read"][1] == sum(
+        1 for row in checkins if row[2] == "read" and month_of(epoch_day(row[1])) == month_of(today_key())
+    )
+    assert today_key() - 3 in db.get_day_bitmaps("u1")["read"]
+    assert db.get_group_ranking("g1")[1] == [("u1", 3)], db.get_group_ranking("g1")
+
+    # 无法解析的行跳过并报告行号；时间也可以是日期文本
+    path = os.path.join(db.data_dir, "import", "extra.jsonl")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"user_id": "u3", "goal": "swim", "time": _days_ago(2)}) + "\n")
+        f.write("{broken\n")
+        f.write(json.dumps({"user_id": "u3", "goal": ""}) + "\n")
+    ok, result = db.import_checkins(path)
+    assert ok and (result["imported"], result["invalid"]) == (1, 2), result
+    assert [line_no for line_no, _ in result["errors"]] == [2, 3], result["errors"]
+    assert db.get_consecutive_days("u3", "swim") == 0
+    assert not db.import_checkins(os.path.join(db.data_dir, "missing.csv"))[0]
+
+
+@check
+def reset_listeners(db):
+    # 恢复备份、清空后通知上层清空缓存（不支持备份的引擎只校验清空）
+    resets = []
+    db.add_reset_listener(lambda: resets.append(True))
+    db.checkin("u1", ["read"])
+    ok, _ = db.backup_database()
+    if ok:
+        db.join_group("u2", "g1")
+        assert db.restore_database("1")[0]
+        assert resets, resets
+        # 恢复后需要重新登记的成员可以再次写入
+        assert db.join_group("u2", "g1") is True
+    resets.clear()
+    db.clear_database()
+    assert resets, resets
+
+
+@check
+def migrate_bad_time(db):
+    # 与引擎无关：版本5（文本时间）的库含无法解析的时间时，迁移不中断，该行移入 legacy_invalid
+    path = os.path.join(db.data_dir, "v5", "checkin.db")
+    os.makedirs(os.path.dirname(path))
+    conn = sqlite3.connect(path)
+    for version in range(1, 6):
+        MIGRATIONS[version](conn.cursor())
+    conn.execute("PRAGMA user_version = 5")
+    conn.execute("INSERT INTO goals (id, user_id, goal) VALUES (1, 'u1', 'read')")
+    conn.executemany(
+        "INSERT INTO checkins (user_id, checkin_time, goal_id, day) "
+        "VALUES ('u1', ?, 1, CAST(julianday(DATE(?)) - julianday('1970-01-01') AS INTEGER))",
+        [("2024-03-01 08:30:00",) * 2, ("garbage",) * 2]
+    )
+    conn.commit()
+    conn.close()
+    manager = DatabaseManager(db_path=path, data_dir=os.path.dirname(path))
+    try:
+        conn = manager.pool.connection()
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == latest_version()
+        assert [row[2] for row in manager.get_checkins("u1")] == [1709253000]
+        assert conn.execute("SELECT legacy_row, checkin_time, goal FROM legacy_invalid").fetchall() == [
+            (2, "garbage", "read")
+        ]
+    finally:
+        manager.close()
+    with open(os.path.join(os.path.dirname(path), "error.log"), encoding="utf-8") as f:
+        assert "legacy_invalid" in f.read()
+
+
+@check
+def migrate_utc_supplements(db):
+    # 与引擎无关：版本2的库中秒数为00的记录（可能是按 UTC 存储的旧补打卡）登记到 legacy_utc_rows
+    path = os.path.join(db.data_dir, "v2", "checkin.db")
+    os.makedirs(os.path.dirname(path))
+    conn = sqlite3.connect(path)
+    for version in range(1, 3):
+        MIGRATIONS[version](conn.cursor())
+    conn.execute("PRAGMA user_version = 2")
+    conn.execute("INSERT INTO goals (id, user_id, goal) VALUES (1, 'u1', 'read')")
+    conn.executemany(
+        "INSERT INTO checkins (user_id, checkin_time, goal_id) VALUES ('u1', ?, 1)",
+        [("2024-03-01 20:15:37",), ("2024-03-01 23:30:00",)]
+    )
+    conn.commit()
+    conn.close()
+    manager = DatabaseManager(db_path=path, data_dir=os.path.dirname(path))
+    try:
+        conn = manager.pool.connection()
+        assert conn.execute("SELECT checkin_id FROM legacy_utc_rows").fetchall() == [(2,)]
+        # 默认仍按本地时间处理，确认校正后按 UTC 处理并重算派生表
+        assert [row[2] for row in manager.get_checkins("u1")] == [1709295337, 1709307000]
+        assert manager.legacy_supplement_count() == 1
+        assert manager.get_day_bitmaps("u1")["read"].days(19783, 19784) == [19783]
+        assert manager.correct_legacy_supplements() == 1
+        assert [row[2] for row in manager.get_checkins("u1")] == [1709295337, 1709335800]
+        assert manager.get_day_bitmaps("u1")["read"].days(19783, 19784) == [19783, 19784]
+        assert conn.execute("SELECT longest_streak FROM goal_streaks").fetchall() == [(2,)]
+        assert manager.legacy_supplement_count() == 0
+        assert manager.correct_legacy_supplements() == 0
+    finally:
+        manager.close()
+
+
+def run_engine(engine, verbose=False):
+    """在指定引擎上执行全部检查，返回失败数"""
+    failures = 0
+    for func in CHECKS:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = create_storage(dict(ENGINES[engine], data_dir=tmp_dir))
+            db.init_db()
+            try:
+                func(db)
+                print(f"[{engine}] ✅ {func.__name__}")
+            except Exception as e:
+                failures += 1
+                print(f"[{engine}] ❌ {func.__name__}: {e!r}")
+                if verbose:
+                    traceback.print_exc()
+            finally:
+                db.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DailyGoalsTracker 存储引擎一致性校验")
+    parser.add_argument("engines", nargs="*", default=list(ENGINES), help="要校验的引擎（默认全部）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印失败的堆栈")
+    args = parser.parse_args()
+    for engine in args.engines:
+        if engine not in ENGINES:
+            parser.error(f"未知的存储引擎: {engine}（可选 {', '.join(ENGINES)}）")
+
+    failures = sum(run_engine(engine, args.verbose) for engine in args.engines)
+    print(f"共 {failures} 项失败" if failures else "全部通过")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
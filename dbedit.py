@@ -1,104 +1,367 @@
 import os
+import time
 import sqlite3
-from datetime import datetime, timedelta, timezone
-import json
+from datetime import datetime, timedelta
+from .dbpool import ConnectionPool
+from .migrations import (
+    run_migrations, check_query_plans, get_schema_version, latest_version, invalid_checkin_count,
+    legacy_utc_count
+)
+from .streaks import record_day, record_days, rebuild_streaks_from_bitmaps, current_streak
+from .cache import LRUCache
+from .backup import BackupEngine
+from .archive import SQL_USER_ARCHIVE, archive_checkins, decode_days, is_archived, iter_archive
+from .rollups import SQL_USER_ROLLUP, add_checkins, remove_checkins, delete_rollups, rebuild_rollups
+from .bitmaps import SQL_USER_BITMAPS, DayBitmap, set_days, clear_days, delete_bitmaps, rebuild_bitmaps
+from .rankings import (
+    ALL_GOALS, SQL_GROUP_TOP_STREAKS, SQL_GROUP_TOP_TOTALS, refresh_rankings, remove_rankings
+)
+from .legacy import LegacyUpgrade, upgrade_aware
+from .migrate_db import is_legacy_schema
+from .transfer import EXPORT_CHUNK, IMPORT_BATCH, IMPORT_TRANSACTION, REBUILD_CHUNK, iter_chunks
+from .storage import (
+    CheckinStorage, DATA_DIR, UTC_OFFSET, china_tz, day_key, today_key, to_epoch, epoch_day, month_of,
+    parse_checkin_time
+)
 
-# 数据库和图片存储路径
-BASE_DIR = "data/plugins/DailyGoalsTracker"
-DB_PATH = os.path.join(BASE_DIR, 'checkin.db')
-IMAGES_DIR = os.path.join(BASE_DIR, 'images')
+# (user_id, goal) -> goal_id 缓存容量
+GOAL_ID_CACHE_SIZE = 4096
 
-# 创建UTC+8时区对象
-china_tz = timezone(timedelta(hours=8))
+# 热点查询（结构迁移后通过 EXPLAIN QUERY PLAN 检查是否走索引）
+SQL_CHECKED_IN_TODAY = '''
+    SELECT 1 FROM checkins c
+    WHERE c.goal_id = (SELECT id FROM goals WHERE user_id = ? AND goal = ?)
+    AND c.day = ?
+    LIMIT 1
+'''
 
-class DatabaseManager:
-    def __init__(self):
+SQL_USER_CHECKINS = '''
+    SELECT c.id, c.user_id, c.checkin_time, g.goal
+    FROM checkins c
+    JOIN goals g ON c.goal_id = g.id
+    WHERE c.user_id = ?
+'''
+
+SQL_RECENT_CHECKINS = '''
+    SELECT c.id, c.checkin_time, g.goal 
+    FROM checkins c
+    JOIN goals g ON c.goal_id = g.id
+    WHERE c.user_id = ? AND c.checkin_time >= ?
+    ORDER BY g.goal, c.checkin_time
+'''
+
+SQL_GOAL_STREAK = '''
+    SELECT s.current_streak, s.last_day
+    FROM goal_streaks s
+    WHERE s.goal_id = (SELECT id FROM goals WHERE user_id = ? AND goal = ?)
+'''
+
+SQL_USER_STREAKS = '''
+    SELECT g.goal, s.current_streak, s.last_day
+    FROM goals g
+    JOIN goal_streaks s ON s.goal_id = g.id
+    WHERE g.user_id = ?
+'''
+
+SQL_TODAY_STATUS = '''
+    SELECT g.goal, s.current_streak, s.last_day
+    FROM goals g
+    JOIN goal_streaks s ON s.goal_id = g.id
+    WHERE g.user_id = ? AND g.goal IN ({})
+'''
+
+SQL_LAST_GOALS = '''
+    SELECT g.goal
+    FROM checkins c
+    JOIN goals g ON c.goal_id = g.id
+    WHERE c.user_id = ?
+    AND c.checkin_time = (
+        SELECT checkin_time FROM checkins
+        WHERE user_id = ?
+        ORDER BY checkin_time DESC LIMIT 1
+    )
+    ORDER BY c.id
+'''
+
+SQL_USER_GOAL_DAYS = '''
+    SELECT DISTINCT g.goal, c.day
+    FROM checkins c
+    JOIN goals g ON c.goal_id = g.id
+    WHERE c.user_id = ?
+'''
+
+SQL_EXPIRED_CHECKINS = '''
+    SELECT id, goal_id, day, user_id FROM checkins
+    WHERE day < ?
+    ORDER BY day
+    LIMIT ?
+'''
+
+# 导出：全量按主键顺序，单个用户按 idx_checkins_user_time 顺序
+SQL_EXPORT_CHECKINS = '''
+    SELECT c.user_id, g.goal, c.checkin_time
+    FROM checkins c
+    JOIN goals g ON g.id = c.goal_id
+    {where}
+'''
+
+# 导入：相同（目标, 时间）的记录已存在时跳过（走 idx_checkins_goal_time）
+SQL_CHECKIN_EXISTS = "SELECT 1 FROM checkins WHERE goal_id = ? AND checkin_time = ?"
+
+SQL_IMPORT_CHECKIN = f'''
+    INSERT INTO checkins (user_id, checkin_time, goal_id, day)
+    SELECT ?, ?, ?, ?
+    WHERE NOT EXISTS ({SQL_CHECKIN_EXISTS})
+'''
+
+# 群统计：按成员关联近期打卡（走 idx_checkins_user_day 的日期范围）
+SQL_GROUP_MEMBER_COUNT = "SELECT COUNT(*) FROM group_members WHERE group_id = ?"
+
+SQL_GROUP_ACTIVITY = '''
+    SELECT COUNT(*), COUNT(DISTINCT c.user_id)
+    FROM group_members m
+    JOIN checkins c ON c.user_id = m.user_id
+    WHERE m.group_id = ? AND c.day >= ?
+'''
+
+SQL_GROUP_GOALS = '''
+    SELECT g.goal, COUNT(DISTINCT c.user_id), COUNT(*)
+    FROM group_members m
+    JOIN checkins c ON c.user_id = m.user_id
+    JOIN goals g ON g.id = c.goal_id
+    WHERE m.group_id = ? AND c.day >= ?
+    GROUP BY g.goal
+'''
+
+# 打卡时间按 UTC+8 取小时
+SQL_GROUP_HOURS = '''
+    SELECT (c.checkin_time + 28800) % 86400 / 3600 AS hour, COUNT(*)
+    FROM group_members m
+    JOIN checkins c ON c.user_id = m.user_id
+    WHERE m.group_id = ? AND c.day >= ?
+    GROUP BY hour
+'''
+
+HOT_QUERIES = {
+    'purge_checkins_chunk': SQL_EXPIRED_CHECKINS,
+    'get_last_goals': SQL_LAST_GOALS,
+    'get_today_status': SQL_TODAY_STATUS.format('?'),
+    'has_checked_in_today': SQL_CHECKED_IN_TODAY,
+    'get_consecutive_days(goal)': SQL_GOAL_STREAK,
+    'get_day_bitmaps': SQL_USER_BITMAPS,
+    'get_recent_checkins': SQL_RECENT_CHECKINS,
+    'get_checkin_report': SQL_USER_STREAKS,
+    'iter_history': SQL_USER_GOAL_DAYS,
+    'iter_history(archive)': SQL_USER_ARCHIVE,
+    'get_period_stats': SQL_USER_ROLLUP,
+    'get_group_ranking(streak)': SQL_GROUP_TOP_STREAKS,
+    'get_group_ranking(total)': SQL_GROUP_TOP_TOTALS,
+    'get_group_stats(activity)': SQL_GROUP_ACTIVITY,
+    'get_group_stats(goals)': SQL_GROUP_GOALS,
+    'get_group_stats(hours)': SQL_GROUP_HOURS,
+    'export_checkins(user)': SQL_EXPORT_CHECKINS.format(
+        where='WHERE c.user_id = ? ORDER BY c.checkin_time'
+    ),
+    'import_checkins': SQL_CHECKIN_EXISTS,
+}
+
+@upgrade_aware
+class DatabaseManager(CheckinStorage):
+    """SQLite 存储引擎"""
+    def __init__(self, db_path=None, data_dir=DATA_DIR):
+        super().__init__(data_dir)
+        db_path = db_path or os.path.join(data_dir, 'checkin.db')
+        self.pool = ConnectionPool(db_path)
+        # 报表与分析走只读连接，长查询不与打卡写入互相等待
+        self.read_pool = ConnectionPool(db_path, readonly=True)
+        self._goal_ids = LRUCache(GOAL_ID_CACHE_SIZE)
+        # 旧版结构在线升级期间不为空（见 legacy.py）
+        self._upgrade = None
         self.init_db()
+
+    def close(self):
+        """关闭所有数据库连接"""
+        upgrade = self._upgrade
+        if upgrade is not None:
+            upgrade.cancel()
+        self.read_pool.close_all()
+        self.pool.close_all()
     
     def init_db(self):
-        """初始化数据库（新版结构）"""
-        os.makedirs(IMAGES_DIR, exist_ok=True)
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
+        """初始化数据库（执行未应用的结构迁移）"""
+        os.makedirs(os.path.join(self.data_dir, 'images'), exist_ok=True)
+        if self._upgrade is not None:
+            return
+        conn = self.pool.connection()
+        # 已是最新结构时只读取一次 user_version，启动耗时与数据量无关
+        if get_schema_version(conn) == latest_version():
+            return
+        if is_legacy_schema(conn):
+            # 旧版结构：后台升级，期间由兼容层继续处理命令
+            self._upgrade = LegacyUpgrade(self)
+            self._upgrade.start()
+            return
+        if run_migrations(conn):
+            # 结构变更后确认热点查询均走索引
+            for name, detail in self.check_query_plans():
+                self.log_error(f"热点查询未使用索引: {name} - {detail}")
+            invalid = invalid_checkin_count(conn)
+            if invalid:
+                self.log_error(f"{invalid} 条旧打卡记录的时间无法解析，已移入 legacy_invalid 表")
+            utc_rows = legacy_utc_count(conn)
+            if utc_rows:
+                self.log_error(
+                    f"{utc_rows} 条旧打卡记录可能是按 UTC 存储的补打卡（已按 UTC+8 处理），"
+                    f"确认后可执行 /打卡管理 校正"
+                )
+
+    def check_query_plans(self):
+        """EXPLAIN QUERY PLAN 检查热点查询，返回未走索引的步骤"""
+        return check_query_plans(self.pool.connection(), HOT_QUERIES)
+
+    def _resolve_goal_ids(self, c, user_id, goals):
+        """批量获取或创建目标ID（需在写事务中调用）
+
+        Returns:
+            dict: 目标 -> 目标ID
+        """
+        goal_ids = {}
+        missing = []
+        for goal in dict.fromkeys(goals):
+            goal_id = self._goal_ids.get((user_id, goal))
+            if goal_id is None:
+                missing.append(goal)
+            else:
+                goal_ids[goal] = goal_id
+        if not missing:
+            return goal_ids
         
-        # 创建目标表（新增UNIQUE约束）
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS goals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                goal TEXT NOT NULL,
-                UNIQUE(user_id, goal)
-            )
-        ''')
+        # 一条语句创建所有缺失目标，再一次性查回ID
+        c.execute(
+            "INSERT OR IGNORE INTO goals (user_id, goal) VALUES {}".format(
+                ','.join(['(?, ?)'] * len(missing))
+            ),
+            [v for goal in missing for v in (user_id, goal)]
+        )
+        c.execute(
+            "SELECT goal, id FROM goals WHERE user_id = ? AND goal IN ({})".format(
+                ','.join('?' * len(missing))
+            ),
+            [user_id, *missing]
+        )
+        goal_ids.update(c.fetchall())
+        return goal_ids
+
+    def _cache_goal_ids(self, user_id, goal_ids):
+        """事务提交后写入目标ID缓存（回滚的新目标不能进入缓存）"""
+        for goal, goal_id in goal_ids.items():
+            self._goal_ids.put((user_id, goal), goal_id)
+
+    def _insert_checkins(self, c, user_id, goals, now, day):
+        """写入一次打卡的所有目标（需在写事务中调用）
+
+        Returns:
+            tuple: (打卡ID列表, 目标 -> 目标ID)
+        """
+        goal_ids = self._resolve_goal_ids(c, user_id, goals)
         
-        # 创建打卡记录表（新增goal_id外键）
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS checkins (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                checkin_time DATETIME NOT NULL,
-                goal_id INTEGER NOT NULL,
-                FOREIGN KEY (goal_id) REFERENCES goals(id)
-            )
-        ''')
+        # 批量插入打卡记录
+        c.executemany('''
+            INSERT INTO checkins (user_id, checkin_time, goal_id, day)
+            VALUES (?, ?, ?, ?)
+        ''', [(user_id, now, goal_ids[goal], day) for goal in goals])
         
-        conn.commit()
-        conn.close()
+        # 同一事务内连续写入，自增ID连续
+        last_id = c.execute("SELECT last_insert_rowid()").fetchone()[0]
+        checkin_ids = list(range(last_id - len(goals) + 1, last_id + 1))
+        
+        # 先置位位图：补录早于最近打卡日时连续统计按位图重算
+        set_days(c, [(goal_id, day) for goal_id in goal_ids.values()])
+        record_days(c, goal_ids.values(), day)
+        add_checkins(c, [(goal_ids[goal], day) for goal in goals])
+        refresh_rankings(c, user_id, goal_ids.values())
+        return checkin_ids, goal_ids
 
     def checkin(self, user_id, goals):
-        """打卡功能（支持多目标）"""
-        conn = sqlite3.connect(DB_PATH)
+        """打卡功能（支持多目标，单事务批量写入）"""
+        conn = self.pool.connection()
         c = conn.cursor()
-        now = datetime.now(china_tz).strftime('%Y-%m-%d %H:%M:%S')
-        checkin_ids = []
+        now_dt = datetime.now(china_tz)
+        now = to_epoch(now_dt)
         
         try:
-            for goal in goals:
-                # 获取或创建目标
-                c.execute('''
-                    INSERT OR IGNORE INTO goals (user_id, goal)
-                    VALUES (?, ?)
-                ''', (user_id, goal))
-                
-                # 获取目标ID
-                c.execute('''
-                    SELECT id FROM goals 
-                    WHERE user_id = ? AND goal = ?
-                ''', (user_id, goal))
-                goal_id = c.fetchone()[0]
-                
-                # 插入打卡记录
-                c.execute('''
-                    INSERT INTO checkins (user_id, checkin_time, goal_id)
-                    VALUES (?, ?, ?)
-                ''', (user_id, now, goal_id))
-                checkin_ids.append(c.lastrowid)
-            
+            checkin_ids, goal_ids = self._insert_checkins(c, user_id, goals, now, day_key(now_dt))
             conn.commit()
-            return checkin_ids
         except Exception as e:
             conn.rollback()
             raise e
-        finally:
-            conn.close()
+        self._cache_goal_ids(user_id, goal_ids)
+        return checkin_ids
+
+    def checkin_many(self, requests):
+        """组提交：多个用户的打卡合并为一个事务
+
+        每个请求使用独立保存点，单个请求失败不影响其他请求。
+
+        Args:
+            requests (list): [(user_id, goals), ...]
+
+        Returns:
+            list: 与请求一一对应，成功为打卡ID列表，失败为异常对象
+        """
+        conn = self.pool.connection()
+        c = conn.cursor()
+        now_dt = datetime.now(china_tz)
+        now = to_epoch(now_dt)
+        day = day_key(now_dt)
+        results = []
+        resolved = []
+        
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            for user_id, goals in requests:
+                c.execute("SAVEPOINT checkin_request")
+                try:
+                    checkin_ids, goal_ids = self._insert_checkins(c, user_id, goals, now, day)
+                except Exception as e:
+                    c.execute("ROLLBACK TO checkin_request")
+                    c.execute("RELEASE checkin_request")
+                    results.append(e)
+                    continue
+                c.execute("RELEASE checkin_request")
+                results.append(checkin_ids)
+                resolved.append((user_id, goal_ids))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        for user_id, goal_ids in resolved:
+            self._cache_goal_ids(user_id, goal_ids)
+        return results
 
     def get_checkins(self, user_id):
         """查询用户所有打卡记录"""
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''
-            SELECT c.id, c.user_id, c.checkin_time, g.goal
-            FROM checkins c
-            JOIN goals g ON c.goal_id = g.id
-            WHERE c.user_id = ?
-        ''', (user_id,))
-        checkins = c.fetchall()
-        conn.close()
-        return checkins
+        with self.read_pool.snapshot() as conn:
+            return conn.execute(SQL_USER_CHECKINS, (user_id,)).fetchall()
+
+    def get_checkin_report(self, user_id):
+        """打卡记录报告数据（同一快照内读取）
+
+        Returns:
+            tuple: (打卡记录列表, {目标: 当前连续天数})
+        """
+        today = today_key()
+        with self.read_pool.snapshot() as conn:
+            checkins = conn.execute(SQL_USER_CHECKINS, (user_id,)).fetchall()
+            streaks = {
+                goal: current_streak((streak, last_day), today)
+                for goal, streak, last_day in conn.execute(SQL_USER_STREAKS, (user_id,))
+            }
+        return checkins, streaks
 
     def get_goals(self, checkin_id):
         """通过打卡记录获取目标"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = self.pool.connection()
         c = conn.cursor()
         c.execute('''
             SELECT g.goal 
@@ -107,133 +370,190 @@ class DatabaseManager:
             WHERE c.id = ?
         ''', (checkin_id,))
         goals = [row[0] for row in c.fetchall()]
-        conn.close()
         return goals
 
+    def get_last_goals(self, user_id):
+        """获取用户最近一次打卡（同一时间戳）的目标"""
+        conn = self.pool.connection()
+        c = conn.cursor()
+        c.execute(SQL_LAST_GOALS, (user_id, user_id))
+        return list(dict.fromkeys(row[0] for row in c.fetchall()))
+
     def get_admin_qq(self):
         """获取管理员QQ（基于最早打卡记录）"""
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''
-            SELECT user_id FROM checkins 
+        first = self.get_first_checkin()
+        return first[1] if first else '0'
+
+    def get_first_checkin(self):
+        """最早的一条打卡记录 (checkin_time, user_id)，无记录时为 None"""
+        conn = self.pool.connection()
+        return conn.execute('''
+            SELECT checkin_time, user_id FROM checkins 
             ORDER BY checkin_time ASC 
             LIMIT 1
-        ''')
-        result = c.fetchone()
-        conn.close()
-        return result[0] if result else '0'
+        ''').fetchone()
 
     def clear_database(self):
         """清空数据库（保持表结构）"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = self.pool.connection()
         c = conn.cursor()
+        c.execute("DELETE FROM goal_streaks")
+        c.execute("DELETE FROM checkin_rollups")
+        c.execute("DELETE FROM goal_bitmaps")
+        c.execute("DELETE FROM group_rankings")
+        c.execute("DELETE FROM group_members")
+        c.execute("DELETE FROM checkin_archive")
         c.execute("DELETE FROM checkins")
         c.execute("DELETE FROM goals")
         conn.commit()
-        conn.close()
+        self._goal_ids.clear()
+        self._notify_reset()
 
     def has_checked_in_today(self, user_id, goal):
         """检查当日目标打卡状态"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = self.pool.connection()
         c = conn.cursor()
-        today = datetime.now(china_tz).strftime('%Y-%m-%d')
-        
-        c.execute('''
-            SELECT 1 FROM checkins c
-            JOIN goals g ON c.goal_id = g.id
-            WHERE c.user_id = ? 
-            AND g.goal = ?
-            AND DATE(c.checkin_time) = ?
-            LIMIT 1
-        ''', (user_id, goal, today))
+        c.execute(SQL_CHECKED_IN_TODAY, (user_id, goal, today_key()))
         
         result = c.fetchone()
-        conn.close()
         return result is not None
 
+    def get_today_status(self, user_id, goals):
+        """一次查询多个目标的今日打卡状态与连续天数
+
+        Returns:
+            dict: 目标 -> (今日是否已打卡, 当前连续天数)
+        """
+        goals = list(dict.fromkeys(goals))
+        status = {goal: (False, 0) for goal in goals}
+        if not goals:
+            return status
+        
+        conn = self.pool.connection()
+        c = conn.cursor()
+        c.execute(
+            SQL_TODAY_STATUS.format(','.join('?' * len(goals))),
+            [user_id, *goals]
+        )
+        today = today_key()
+        for goal, streak, last_day in c.fetchall():
+            days = current_streak((streak, last_day), today)
+            status[goal] = (last_day == today, days)
+        return status
+
     def get_consecutive_days(self, user_id, goal=None):
         """计算连续打卡天数"""
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        query = '''
-            SELECT DISTINCT DATE(c.checkin_time) as date
-            FROM checkins c
-            JOIN goals g ON c.goal_id = g.id
-            WHERE c.user_id = ?
-        '''
-        params = [user_id]
-        
         if goal:
-            query += " AND g.goal = ?"
-            params.append(goal)
-        
-        query += " ORDER BY date DESC"
-        
-        c.execute(query, params)
-        dates = [row[0] for row in c.fetchall()]
-        conn.close()
+            # 单目标：直接读取统计表
+            with self.read_pool.snapshot() as conn:
+                row = conn.execute(SQL_GOAL_STREAK, (user_id, goal)).fetchone()
+            return current_streak(row, today_key())
         
-        # 后续计算逻辑保持不变...
-        # [原有日期处理逻辑，此处省略]
-        if not dates:
-            return 0
-        
-        date_objs = []
-        today = datetime.now(china_tz).date()
+        # 任一目标打卡即算：合并各目标位图
+        merged = DayBitmap()
+        for bitmap in self.get_day_bitmaps(user_id).values():
+            merged = merged | bitmap
+        return merged.streak_ending(today_key())
 
-        for date_str in dates:
-            if ' ' in date_str:
-                date_part = date_str.split(' ')[0]
-            else:
-                date_part = date_str
-            try:
-                date_obj = datetime.strptime(date_part, '%Y-%m-%d').date()
-                date_objs.append(date_obj)
-            except ValueError:
-                continue
-        
-        if not date_objs:
-            return 0
-        
-        consecutive_days = 0
-        if date_objs[0] == today:
-            consecutive_days = 1
-            prev_date = date_objs[0]
-            for date_obj in date_objs[1:]:
-                if (prev_date - date_obj).days == 1:
-                    consecutive_days += 1
-                    prev_date = date_obj
-                else:
-                    break
-        return consecutive_days
-
-    def clear_old_checkins(self):
-        """清理30天前记录（级联删除）"""
-        conn = sqlite3.connect(DB_PATH)
+    def purge_checkins_chunk(self, cutoff_day, limit=500, archive=True):
+        """移出一批早于 cutoff_day 的打卡记录（默认并入归档），并清理因此失去记录的目标
+
+        连续打卡统计保留历史累计值，不随旧记录移出而回退。
+
+        Returns:
+            int: 本批移出的记录数（0 表示已清理完毕）
+        """
+        conn = self.pool.connection()
         c = conn.cursor()
-        cutoff = (datetime.now(china_tz) - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
-        
-        # 先删除旧打卡记录
-        c.execute('''
-            DELETE FROM checkins 
-            WHERE checkin_time < ?
-        ''', (cutoff,))
-        
-        # 清理孤立目标
-        c.execute('''
-            DELETE FROM goals 
-            WHERE id NOT IN (
-                SELECT DISTINCT goal_id FROM checkins
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            c.execute(SQL_EXPIRED_CHECKINS, (cutoff_day, limit))
+            rows = c.fetchall()
+            if not rows:
+                conn.rollback()
+                return 0
+            
+            if archive:
+                archive_checkins(c, [(goal_id, day) for _, goal_id, day, _ in rows])
+            else:
+                remove_checkins(c, [(goal_id, day) for _, goal_id, day, _ in rows])
+            checkin_ids = [row[0] for row in rows]
+            c.execute(
+                "DELETE FROM checkins WHERE id IN ({})".format(','.join('?' * len(checkin_ids))),
+                checkin_ids
             )
-        ''')
+            orphans = self._delete_orphan_goals(c, {row[1] for row in rows})
+            if not archive:
+                clear_days(c, [(goal_id, day) for _, goal_id, day, _ in rows])
+                # 合计行依赖位图，随之刷新
+                for user_id in {row[3] for row in rows}:
+                    refresh_rankings(c, user_id, [])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        for key in orphans:
+            self._goal_ids.pop(key)
+        return len(checkin_ids)
+
+    def _delete_orphan_goals(self, c, goal_ids):
+        """删除给定目标中既无打卡记录也无归档的目标
+
+        Returns:
+            list: 被删除目标的 (user_id, goal)
+        """
+        goal_ids = list(goal_ids)
+        if not goal_ids:
+            return []
+        c.execute('''
+            SELECT id, user_id, goal FROM goals
+            WHERE id IN ({})
+            AND NOT EXISTS (SELECT 1 FROM checkins WHERE goal_id = goals.id)
+            AND NOT EXISTS (SELECT 1 FROM checkin_archive WHERE goal_id = goals.id)
+        '''.format(','.join('?' * len(goal_ids))), goal_ids)
+        orphans = c.fetchall()
+        if not orphans:
+            return []
         
-        conn.commit()
-        conn.close()
+        orphan_ids = [row[0] for row in orphans]
+        placeholders = ','.join('?' * len(orphan_ids))
+        c.execute(f"DELETE FROM goal_streaks WHERE goal_id IN ({placeholders})", orphan_ids)
+        delete_rollups(c, orphan_ids)
+        delete_bitmaps(c, orphan_ids)
+        for _, user_id, goal in orphans:
+            remove_rankings(c, user_id, [goal])
+        c.execute(f"DELETE FROM goals WHERE id IN ({placeholders})", orphan_ids)
+        return [(user_id, goal) for _, user_id, goal in orphans]
+
+    def incremental_vacuum_enabled(self):
+        """是否已处于增量回收模式"""
+        return self.pool.connection().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    def enable_incremental_vacuum(self):
+        """将旧库切换为增量回收模式（由管理员命令触发）
+
+        需要一次完整VACUUM：重写整个数据库文件，期间写线程被占用，打卡会等待，
+        耗时随数据库大小增长，应在低峰时段执行。
+
+        Returns:
+            bool: 是否执行了转换
+        """
+        conn = self.pool.connection()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+
+    def incremental_vacuum(self, pages=1000):
+        """回收一批空闲页，返回剩余空闲页数"""
+        conn = self.pool.connection()
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return conn.execute("PRAGMA freelist_count").fetchone()[0]
 
     def delete_goals(self, user_id, goal):
         """删除用户特定目标及相关记录"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = self.pool.connection()
         c = conn.cursor()
         
         try:
@@ -247,11 +567,23 @@ class DatabaseManager:
             if not goal_ids:
                 return 0
                 
-            # 删除相关打卡记录
+            # 删除相关打卡记录及统计
             c.execute('''
                 DELETE FROM checkins 
                 WHERE goal_id IN ({})
             '''.format(','.join('?'*len(goal_ids))), goal_ids)
+            c.execute('''
+                DELETE FROM goal_streaks 
+                WHERE goal_id IN ({})
+            '''.format(','.join('?'*len(goal_ids))), goal_ids)
+            c.execute('''
+                DELETE FROM checkin_archive 
+                WHERE goal_id IN ({})
+            '''.format(','.join('?'*len(goal_ids))), goal_ids)
+            delete_rollups(c, goal_ids)
+            delete_bitmaps(c, goal_ids)
+            remove_rankings(c, user_id, [goal])
+            refresh_rankings(c, user_id, [])
             
             # 删除目标
             c.execute('''
@@ -260,71 +592,49 @@ class DatabaseManager:
             '''.format(','.join('?'*len(goal_ids))), goal_ids)
             
             conn.commit()
+            self._goal_ids.pop((user_id, goal))
             return c.rowcount
         except Exception as e:
             conn.rollback()
             raise e
-        finally:
-            conn.close()
 
     def delete_all_checkins(self, user_id):
         """删除用户所有打卡记录"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = self.pool.connection()
         c = conn.cursor()
         try:
             c.execute("DELETE FROM checkins WHERE user_id = ?", (user_id,))
             deleted_checkins = c.rowcount
+            c.execute('''
+                DELETE FROM goal_streaks 
+                WHERE goal_id IN (SELECT id FROM goals WHERE user_id = ?)
+            ''', (user_id,))
+            c.execute('''
+                DELETE FROM checkin_archive 
+                WHERE goal_id IN (SELECT id FROM goals WHERE user_id = ?)
+            ''', (user_id,))
+            c.execute('''
+                DELETE FROM checkin_rollups 
+                WHERE goal_id IN (SELECT id FROM goals WHERE user_id = ?)
+            ''', (user_id,))
+            c.execute('''
+                DELETE FROM goal_bitmaps 
+                WHERE goal_id IN (SELECT id FROM goals WHERE user_id = ?)
+            ''', (user_id,))
+            remove_rankings(c, user_id)
             conn.commit()
             return deleted_checkins
         except Exception as e:
             conn.rollback()
             raise e
-        finally:
-            conn.close()
 
-    def read_admin_id(self, user_id):
-        """读取或创建管理员ID"""
-        current_directory = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(current_directory, "admin_data.json")
-        
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, "r") as f:
-                    admin_data = json.load(f)
-                    if "admin_id" in admin_data:
-                        return ["存在", admin_data["admin_id"]]
-                    else:
-                        admin_data["admin_id"] = user_id
-                        with open(file_path, "w") as f:
-                            json.dump(admin_data, f)
-                        return ["不存在", user_id]
-            except json.JSONDecodeError:
-                admin_data = {"admin_id": user_id}
-                with open(file_path, "w") as f:
-                    json.dump(admin_data, f)
-                return ["不存在", user_id]
-        else:
-            with open(file_path, "w") as f:
-                return ["不存在", user_id]
-            
     def get_recent_checkins(self, user_id, days=30):
         """获取用户近期的打卡记录（按目标分组）"""
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        cutoff_date = (datetime.now(timezone(timedelta(hours=8))) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        cutoff = to_epoch(datetime.now(china_tz) - timedelta(days=days))
         
         # 获取打卡记录和目标
-        c.execute('''
-            SELECT c.id, c.checkin_time, g.goal 
-            FROM checkins c
-            JOIN goals g ON c.goal_id = g.id
-            WHERE c.user_id = ? AND c.checkin_time >= ?
-            ORDER BY g.goal, c.checkin_time
-        ''', (user_id, cutoff_date))
-        
-        records = c.fetchall()
-        conn.close()
+        with self.read_pool.snapshot() as conn:
+            records = conn.execute(SQL_RECENT_CHECKINS, (user_id, cutoff)).fetchall()
         
         # 按目标分组
         goal_data = {}
@@ -336,49 +646,301 @@ class DatabaseManager:
         
         return goal_data
     
-    def backup_database(self, backup_dir=BASE_DIR, max_backups=3):
-        """备份数据库文件
+    def iter_history(self, user_id):
+        """流式读取用户全部打卡日（先归档、后近期记录，同一快照内）"""
+        with self.read_pool.snapshot() as conn:
+            for goal, _, days, _ in iter_archive(conn, user_id):
+                for day in days:
+                    yield goal, day
+            for goal, day in conn.execute(SQL_USER_GOAL_DAYS, (user_id,)):
+                yield goal, day
+
+    def get_day_bitmaps(self, user_id):
+        """读取用户各目标的打卡日位图"""
+        with self.read_pool.snapshot() as conn:
+            return {
+                goal: DayBitmap.from_blob(base_day, bits)
+                for goal, base_day, bits in conn.execute(SQL_USER_BITMAPS, (user_id,))
+            }
+
+    def join_group(self, user_id, group_id):
+        """登记群成员（已登记时不做任何操作），返回是否新加入"""
+        conn = self.pool.connection()
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            c.execute(
+                "INSERT OR IGNORE INTO group_members (group_id, user_id) VALUES (?, ?)",
+                (group_id, user_id)
+            )
+            joined = c.rowcount > 0
+            if joined:
+                # 新成员按已有记录写入排行
+                refresh_rankings(c, user_id)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        return joined
+
+    def get_group_ranking(self, group_id, goal=None, limit=10):
+        """群内前 K 名（按索引倒序读取）
+
+        Returns:
+            tuple: ([(user_id, 当前连续天数), ...], [(user_id, 累计天数), ...])
+        """
+        goal = goal or ALL_GOALS
+        with self.read_pool.snapshot() as conn:
+            streaks = conn.execute(
+                SQL_GROUP_TOP_STREAKS, (group_id, goal, today_key(), limit)
+            ).fetchall()
+            totals = conn.execute(SQL_GROUP_TOP_TOTALS, (group_id, goal, limit)).fetchall()
+        return streaks, totals
+
+    def get_group_stats(self, group_id, since_day):
+        """群内自 since_day 起的打卡统计（同一快照内的几条聚合查询）"""
+        params = (group_id, since_day)
+        with self.read_pool.snapshot() as conn:
+            members = conn.execute(SQL_GROUP_MEMBER_COUNT, (group_id,)).fetchone()[0]
+            checkins, active = conn.execute(SQL_GROUP_ACTIVITY, params).fetchone()
+            goals = {
+                goal: (goal_members, goal_checkins)
+                for goal, goal_members, goal_checkins in conn.execute(SQL_GROUP_GOALS, params)
+            }
+            hours = [0] * 24
+            for hour, count in conn.execute(SQL_GROUP_HOURS, params):
+                hours[hour] = count
+        return {
+            "members": members,
+            "active": active,
+            "checkins": checkins,
+            "goals": goals,
+            "hours": hours,
+        }
+
+    def get_period_stats(self, user_id, grain, period):
+        """按汇总表读取某日/月/年的统计（每个目标一次主键查找）"""
+        with self.read_pool.snapshot() as conn:
+            return {
+                goal: (days, checkins)
+                for goal, days, checkins in conn.execute(SQL_USER_ROLLUP, (user_id, grain, period))
+            }
+
+    def rebuild_rollups(self):
+        """从打卡记录与归档重算全部汇总"""
+        conn = self.pool.connection()
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            rebuild_rollups(c)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+    def legacy_supplement_count(self):
+        """迁移时登记、尚未校正的旧补打卡候选记录数"""
+        return legacy_utc_count(self.pool.connection())
+
+    def correct_legacy_supplements(self):
+        """把 legacy_utc_rows 中的记录按 UTC 时间校正（由管理员确认后触发）
+
+        旧补打卡存储 UTC 文本，迁移时按本地时间处理，时间早 8 小时；校正后时间加 8 小时、
+        重算日序号，并按受影响目标重算汇总、位图、连续统计与排行。
+        已归档或已删除的记录无法校正，登记一并清除。
+
+        Returns:
+            int: 校正的记录数
+        """
+        conn = self.pool.connection()
+        if not legacy_utc_count(conn):
+            return 0
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            affected = dict(c.execute('''
+                SELECT DISTINCT c.goal_id, c.user_id
+                FROM legacy_utc_rows l JOIN checkins c ON c.id = l.checkin_id
+            ''').fetchall())
+            c.execute(f'''
+                UPDATE checkins SET checkin_time = checkin_time + {UTC_OFFSET}
+                WHERE id IN (SELECT checkin_id FROM legacy_utc_rows)
+            ''')
+            corrected = c.rowcount
+            c.execute(f'''
+                UPDATE checkins SET day = (checkin_time + {UTC_OFFSET}) / 86400
+                WHERE id IN (SELECT checkin_id FROM legacy_utc_rows)
+            ''')
+            c.execute("DELETE FROM legacy_utc_rows")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        self._rebuild_goals(affected)
+        self._notify_reset()
+        return corrected
+
+    def iter_export_rows(self, user_id=None, chunk_size=EXPORT_CHUNK):
+        """流式读取打卡记录（同一快照内 fetchmany 分块）
+
+        Yields:
+            list: [(user_id, 目标, 打卡时间), ...]，每块不超过 chunk_size 行
+        """
+        if user_id is None:
+            sql, params = SQL_EXPORT_CHECKINS.format(where='ORDER BY c.id'), ()
+        else:
+            sql = SQL_EXPORT_CHECKINS.format(where='WHERE c.user_id = ? ORDER BY c.checkin_time')
+            params = (user_id,)
+        with self.read_pool.snapshot() as conn:
+            rows = conn.execute(sql, params)
+            while True:
+                chunk = rows.fetchmany(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def import_rows(self, records):
+        """分批写入打卡记录
+
+        每 IMPORT_BATCH 行一次 executemany，每 IMPORT_TRANSACTION 行提交一次；
+        相同（目标, 时间）已存在或当日已归档的记录跳过。写入完成（或中途失败）后
+        按受影响目标重算统计、汇总、位图与排行。
+
+        Args:
+            records: (user_id, goal, checkin_time) 可迭代对象，逐批消费
+
+        Returns:
+            tuple: (导入数, 跳过数)
+        """
+        imported = skipped = 0
+        affected = {}   # 目标ID -> user_id
+        try:
+            for batch in iter_chunks(records, IMPORT_TRANSACTION):
+                batch_imported, batch_skipped, batch_affected = self.import_batch(batch)
+                imported += batch_imported
+                skipped += batch_skipped
+                affected.update(batch_affected)
+        finally:
+            # 已提交的批次（包括中途失败时）都需要修复派生表
+            self._rebuild_goals(affected)
+        return imported, skipped
+
+    def import_batch(self, records):
+        """在一个写事务中写入一批记录（每 IMPORT_BATCH 行一次 executemany），不重算派生表
+
+        Returns:
+            tuple: (导入数, 跳过数, {目标ID: user_id}) 最后一项交给 rebuild_imported
+        """
+        conn = self.pool.connection()
+        c = conn.cursor()
+        imported = skipped = 0
+        affected = {}
+        archived = {}   # (目标ID, 月份) -> 已归档的打卡日（本事务内缓存）
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            for batch in iter_chunks(records, IMPORT_BATCH):
+                goals = {}
+                for user_id, goal, _ in batch:
+                    goals.setdefault(user_id, []).append(goal)
+                goal_ids = {
+                    user_id: self._resolve_goal_ids(c, user_id, user_goals)
+                    for user_id, user_goals in goals.items()
+                }
+                rows = []
+                for user_id, goal, checkin_time in batch:
+                    goal_id = goal_ids[user_id][goal]
+                    day = epoch_day(checkin_time)
+                    if day in self._archived_days(c, archived, goal_id, day):
+                        skipped += 1
+                        continue
+                    rows.append((user_id, checkin_time, goal_id, day, goal_id, checkin_time))
+                    affected[goal_id] = user_id
+                before = conn.total_changes
+                c.executemany(SQL_IMPORT_CHECKIN, rows)
+                inserted = conn.total_changes - before
+                imported += inserted
+                skipped += len(rows) - inserted
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        return imported, skipped, affected
+
+    def rebuild_imported(self, goal_users):
+        """重算 import_batch 写入的目标的派生表（每 REBUILD_CHUNK 个目标一个事务）"""
+        self._rebuild_goals(goal_users)
+
+    def _archived_days(self, c, archived, goal_id, day):
+        """目标在某日所在月份的已归档打卡日（按月缓存）"""
+        key = (goal_id, month_of(day))
+        if key not in archived:
+            row = c.execute(
+                "SELECT days FROM checkin_archive WHERE goal_id = ? AND month = ?", key
+            ).fetchone()
+            archived[key] = set(decode_days(key[1], row[0])) if row else set()
+        return archived[key]
+
+    def _rebuild_goals(self, goal_users):
+        """按目标重算汇总、位图、连续统计与排行（每 REBUILD_CHUNK 个目标一个事务）
+
+        连续统计按位图（含归档）重算，最长连续与累计天数不低于原值
+        （未归档直接删除的历史只保留在统计中）。
+
+        Args:
+            goal_users (dict): 目标ID -> user_id
+        """
+        conn = self.pool.connection()
+        c = conn.cursor()
+        goal_ids = list(goal_users)
+        for start in range(0, len(goal_ids), REBUILD_CHUNK):
+            chunk = goal_ids[start:start + REBUILD_CHUNK]
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                rebuild_rollups(c, chunk)
+                rebuild_bitmaps(c, chunk)
+                rebuild_streaks_from_bitmaps(c, chunk)
+                users = {}
+                for goal_id in chunk:
+                    users.setdefault(goal_users[goal_id], []).append(goal_id)
+                for user_id, user_goal_ids in users.items():
+                    refresh_rankings(c, user_id, user_goal_ids)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+
+    def backup_engine(self, backup_dir=None, max_backups=3, compress=True):
+        """备份目录（默认为数据目录下的 backup）对应的备份引擎"""
+        return BackupEngine(
+            self.pool.db_path,
+            os.path.join(backup_dir or self.data_dir, 'backup'),
+            max_backups=max_backups,
+            compress=compress
+        )
+
+    def backup_database(self, backup_dir=None, max_backups=3, compress=True, name=None, rotate=True):
+        """在线备份数据库（分步复制，不阻塞写入）
         
         Args:
-            backup_dir (str): 备份存储目录（相对路径）
+            backup_dir (str): 备份存储目录（默认为数据目录）
             max_backups (int): 最大保留备份数量
+            compress (bool): 是否 gzip 压缩
+            name (str): 备份文件名（分片存储同一轮次的各分片使用相同文件名）
+            rotate (bool): 是否立即轮换旧备份
         
         Returns:
             tuple: (备份是否成功, 备份文件路径或错误信息)
         """
         try:
             # 确保数据库文件存在
-            if not os.path.exists(DB_PATH):
+            if not os.path.exists(self.pool.db_path):
                 return False, "数据库文件不存在"
             
-            # 创建备份目录（如果不存在）
-            abs_backup_dir = os.path.join(backup_dir,'backup')
-            os.makedirs(abs_backup_dir, exist_ok=True)
-            
-            # 生成备份文件名（带时间戳）
-            timestamp = datetime.now(china_tz).strftime("%Y%m%d_%H%M%S")
-            backup_name = f"checkin_backup_{timestamp}.db"
-            backup_path = os.path.join(abs_backup_dir, backup_name)
-            
-            # 执行备份（文件复制）
-            with open(DB_PATH, 'rb') as src, open(backup_path, 'wb') as dst:
-                dst.write(src.read())
-            
-            # 清理旧备份（按时间倒序保留最新的）
-            backups = sorted(
-                [f for f in os.listdir(abs_backup_dir) if f.startswith("checkin_backup")],
-                key=lambda x: os.path.getmtime(os.path.join(abs_backup_dir, x)),
-                reverse=True
-            )
-            
-            for old_backup in backups[max_backups:]:
-                try:
-                    os.remove(os.path.join(abs_backup_dir, old_backup))
-                except Exception as e:
-                    self.log_error(f"删除旧备份失败: {old_backup} - {str(e)}")
+            engine = self.backup_engine(backup_dir, max_backups, compress)
+            backup_path = engine.create(name=name, rotate=rotate)
             
             # 验证备份文件
-            if os.path.exists(backup_path) and os.path.getsize(backup_path) > 0:
+            if engine.verify(backup_path):
                 return True, backup_path
             return False, "备份文件验证失败"
         
@@ -387,117 +949,129 @@ class DatabaseManager:
             self.log_error(error_msg)
             return False, error_msg
 
-    def log_error(self, message):
-        """记录错误日志"""
-        error_log_path = os.path.join(BASE_DIR, "error.log")
-        timestamp = datetime.now(china_tz).strftime("%Y-%m-%d %H:%M:%S")
-        with open(error_log_path, 'a', encoding='utf-8') as f:
-            f.write(f"[{timestamp}] {message}\n")
+    def list_backups(self, backup_dir=None):
+        """列出已有备份（最新在前）
+
+        Returns:
+            list: [(文件名, 大小字节数, 修改时间), ...]
+        """
+        engine = self.backup_engine(backup_dir)
+        return [
+            (os.path.basename(path), os.path.getsize(path),
+             datetime.fromtimestamp(os.path.getmtime(path), china_tz))
+            for path in engine.list_backups()
+        ]
+
+    def restore_database(self, backup_name, backup_dir=None):
+        """从备份恢复数据库（在线替换，无需重启插件）
+        
+        Args:
+            backup_name (str): 备份文件名，或 list_backups 中的序号（从1开始）
+            backup_dir (str): 备份存储目录（默认为数据目录）
+        
+        Returns:
+            tuple: (是否成功, {"path", "elapsed", "counts"} 或错误信息)
+        """
+        start = time.perf_counter()
+        success, prepared = self.prepare_restore(backup_name, backup_dir)
+        if not success:
+            return False, prepared
+        return self.apply_restore(prepared, start)
+
+    def prepare_restore(self, backup_name, backup_dir=None):
+        """查找并校验备份（校验和与 quick_check），解压为临时文件，尚不改动数据库
+
+        Returns:
+            tuple: (是否通过, (备份路径, 临时文件路径) 或错误信息)
+        """
+        engine = self.backup_engine(backup_dir)
+        backups = engine.list_backups()
+        if backup_name.isdigit() and 1 <= int(backup_name) <= len(backups):
+            backup_path = backups[int(backup_name) - 1]
+        else:
+            matched = [p for p in backups if os.path.basename(p) == backup_name]
+            if not matched:
+                return False, f"未找到备份：{backup_name}"
+            backup_path = matched[0]
+        try:
+            return True, (backup_path, engine.prepare(backup_path))
+        except Exception as e:
+            error_msg = f"数据库恢复失败: {str(e)}"
+            self.log_error(error_msg)
+            return False, error_msg
+
+    def apply_restore(self, prepared, start=None):
+        """把 prepare_restore 校验过的备份写入数据库（返回值同 restore_database）"""
+        backup_path, tmp_path = prepared
+        start = start if start is not None else time.perf_counter()
+        try:
+            conn = self.pool.connection()
+            self.backup_engine().apply(tmp_path, conn)
+            # 缓存的目标ID已失效；旧备份可能需要补齐结构迁移
+            self._goal_ids.clear()
+            self.init_db()
+            self._notify_reset()
+        except Exception as e:
+            error_msg = f"数据库恢复失败: {str(e)}"
+            self.log_error(error_msg)
+            return False, error_msg
+        
+        counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('goals', 'checkins')
+        }
+        return True, {
+            "path": backup_path,
+            "elapsed": time.perf_counter() - start,
+            "counts": counts,
+        }
 
-    # 在DatabaseManager类中添加以下方法
     def supplement_checkin(self, user_id, goal, checkin_date):
-        """补打卡功能（纯标准库实现）"""
-        conn = sqlite3.connect(DB_PATH)
+        """补打卡功能"""
+        conn = self.pool.connection()
         c = conn.cursor()
         
         try:
-            # 时区定义（中国时区 UTC+8）
-            china_tz = timezone(timedelta(hours=8))
+            checkin_time = parse_checkin_time(checkin_date)
             
-            # 支持的日期格式（增强兼容性）
-            time_formats = [
-                '%Y-%m-%d %H:%M',    # 标准格式
-                '%Y-%m-%d',           # 仅日期
-                '%Y-%m-%d %H:%M:%S',  # 带秒数
-                '%Y/%m/%d %H:%M',     # 斜线分隔
-                '%Y.%m.%d %H:%M',    # 点分隔
-                '%Y-%m-%dT%H:%M',     # ISO格式
-                '%Y%m%d %H%M'        # 紧凑格式
-            ]
-            # 预处理输入（统一分隔符）
-            processed_date = checkin_date.replace('/', '-').replace('.', '-').replace('T', ' ')
+            # 转换为数据库存储格式（与打卡一致，使用时间戳）
+            db_time = to_epoch(checkin_time)
+            day = day_key(checkin_time)
             
-            # 尝试解析日期
-            checkin_time = None
-            for fmt in time_formats:
-                try:
-                    checkin_time = datetime.strptime(processed_date, fmt)
-                    break
-                except ValueError:
-                    continue
-            # 处理纯数字格式（如20230317）
-            if not checkin_time and len(processed_date) >= 8:
-                try:
-                    if ' ' in processed_date:
-                        date_part, time_part = processed_date.split(' ', 1)
-                        checkin_time = datetime.strptime(date_part, '%Y%m%d')
-                        checkin_time = checkin_time.replace(
-                            hour=int(time_part[:2]),
-                            minute=int(time_part[2:4])
-                        )
-                    else:
-                        checkin_time = datetime.strptime(processed_date, '%Y%m%d')
-                except:
-                    pass
-            # 添加默认时间
-            if checkin_time:
-                if checkin_time.hour == 0 and checkin_time.minute == 0:
-                    checkin_time = checkin_time.replace(hour=12)
-            else:
-                raise ValueError(
-                    f"日期格式错误，支持格式示例：\n"
-                    f"2025-03-17\n2025/3/17 12:00\n2025.12.31 23:59"
-                )
-            # 转换为中国时区（aware时间）
-            checkin_time = checkin_time.replace(tzinfo=china_tz)
-            
-            # 获取当前时间（带时区）
-            now = datetime.now(china_tz)
-            
-            # 未来时间检查
-            if checkin_time > now:
-                raise ValueError("不能补未来的打卡记录")
-            
-            # 转换为数据库存储格式（UTC时间）
-            db_time = checkin_time.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-            
-            # 处理目标表
-            c.execute('''
-                INSERT OR IGNORE INTO goals (user_id, goal)
-                VALUES (?, ?)
-            ''', (user_id, goal))
-            
-            # 获取目标ID
-            c.execute('''
-                SELECT id FROM goals 
-                WHERE user_id = ? AND goal = ?
-            ''', (user_id, goal))
-            goal_id = c.fetchone()[0]
+            # 获取或创建目标
+            goal_ids = self._resolve_goal_ids(c, user_id, [goal])
+            goal_id = goal_ids[goal]
             
-            # 检查重复记录（按UTC日期比较）
+            # 检查重复记录（按日序号比较）
             c.execute('''
                 SELECT 1 FROM checkins 
-                WHERE user_id = ? 
-                AND goal_id = ?
-                AND DATE(checkin_time) = DATE(?, 'utc')
-            ''', (user_id, goal_id, db_time))
+                WHERE goal_id = ? AND day = ?
+                LIMIT 1
+            ''', (goal_id, day))
             
-            if c.fetchone():
+            if c.fetchone() or is_archived(c, goal_id, day):
                 raise ValueError("该日期已存在此目标的打卡记录")
             
             # 插入记录
             c.execute('''
-                INSERT INTO checkins (user_id, checkin_time, goal_id)
-                VALUES (?, ?, ?)
-            ''', (user_id, db_time, goal_id))
+                INSERT INTO checkins (user_id, checkin_time, goal_id, day)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, db_time, goal_id, day))
+            checkin_id = c.lastrowid
+            
+            # 补录日期可能填补历史空缺：先置位位图，统计表按位图（含归档）修复
+            set_days(c, [(goal_id, day)])
+            record_day(c, goal_id, day)
+            add_checkins(c, [(goal_id, day)])
+            refresh_rankings(c, user_id, [goal_id])
             
             conn.commit()
-            return c.lastrowid
+            self._cache_goal_ids(user_id, goal_ids)
+            return checkin_id
         
         except sqlite3.Error as e:
             conn.rollback()
             raise ValueError(f"数据库错误: {str(e)}")
         except Exception as e:
+            conn.rollback()
             raise ValueError(f"日期处理失败: {str(e)}")
-        finally:
-            conn.close()
\ No newline at end of file
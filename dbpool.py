@@ -0,0 +1,99 @@
+import os
+import sqlite3
+from urllib.parse import quote
+import threading
+from contextlib import contextmanager
+
+# 连接调优参数（每个连接打开时执行一次）
+CONNECTION_PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL", # 仅对新建的空库生效，旧库由保留任务转换
+    "PRAGMA journal_mode=WAL",        # 读写并发，提交只追加WAL
+    "PRAGMA synchronous=NORMAL",      # WAL模式下仅在检查点时fsync
+    "PRAGMA cache_size=-16000",       # 约16MB页缓存
+    "PRAGMA mmap_size=268435456",     # 256MB内存映射读
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# 只读连接参数（不修改数据库文件）
+READONLY_PRAGMAS = (
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA query_only=ON",
+)
+
+
+class ConnectionPool:
+    """SQLite长连接池（每个线程复用一个连接）
+
+    readonly=True 时以 mode=ro 打开，只用于读取：WAL模式下读连接
+    不会阻塞写入，也不会被写入阻塞。数据库文件须已由读写连接创建。
+    """
+    def __init__(self, db_path, readonly=False):
+        self.db_path = db_path
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+
+    def _open(self):
+        """打开并调优一个新连接"""
+        if self.readonly:
+            uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            for pragma in READONLY_PRAGMAS:
+                conn.execute(pragma)
+            return conn
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def connection(self):
+        """获取当前线程的连接（不存在或已失效时重新打开）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.generation != self._generation:
+            conn = self._open()
+            with self._lock:
+                self._connections.append(conn)
+                self._local.generation = self._generation
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """写事务：正常退出提交，异常回滚"""
+        conn = self.connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def snapshot(self):
+        """读事务：块内所有查询读取同一个WAL快照"""
+        conn = self.connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    def close_all(self):
+        """关闭所有线程的连接（插件卸载时调用）"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
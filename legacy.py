@@ -0,0 +1,362 @@
+"""
+旧版（database.py）数据库的在线升级
+- init_db 发现旧版结构（goals.checkin_id）时启动后台升级，插件无需停止
+- 升级期间由 LegacyStorage 直接读写旧表：查询照常返回，打卡与补打卡以旧格式追加，
+  群成员登记暂存、升级完成后补登；删除、导入导出、备份恢复提示稍后再试
+- 后台线程以 migrate_db 的流式迁移把旧库复制到 checkin_upgrade.db（可续传），
+  再在加锁后补齐升级期间追加的记录、核对，并通过 SQLite 备份 API 在线写回原数据库文件
+- 升级失败时继续以兼容模式运行，错误写入日志；重启插件后从检查点继续
+"""
+import os
+import sqlite3
+import threading
+import functools
+from datetime import datetime, timedelta
+
+from .dbpool import ConnectionPool
+from .bitmaps import DayBitmap
+from .rollups import periods
+from .migrate_db import backup_legacy, migrate_database, parse_legacy_time, verify_migration
+from .storage import CheckinStorage, china_tz, today_key, day_key, epoch_day, to_epoch, parse_checkin_time
+
+UPGRADING = "数据库正在升级到新版结构，请稍后再试"
+
+# 旧版时间文本格式（UTC+8）
+LEGACY_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SQL_LEGACY_USER_ROWS = '''
+    SELECT g.id, c.checkin_time, g.goal
+    FROM checkins c
+    JOIN goals g ON g.checkin_id = c.id
+    WHERE c.user_id = ?
+    ORDER BY c.id, g.id
+'''
+
+
+class UpgradeCancelled(Exception):
+    """插件关闭时中止后台升级（已提交的部分保留在检查点中）"""
+
+
+class LegacyStorage(CheckinStorage):
+    """旧版结构的兼容读写（只在升级期间使用）
+
+    打卡ID为旧 goals 表的行号（每个目标一行）。定义在本类中的公开方法，
+    在升级期间会替代 DatabaseManager 的同名方法（见 upgrade_aware）。
+    """
+    def __init__(self, db_path, data_dir):
+        super().__init__(data_dir)
+        self.pool = ConnectionPool(db_path)
+        self._pending_members = set()
+
+    def close_connections(self):
+        self.pool.close_all()
+
+    def add_indexes(self):
+        """旧表没有按用户、按打卡记录的索引，升级期间的查询需要"""
+        conn = self.pool.connection()
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_legacy_checkins_user ON checkins(user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_legacy_goals_checkin ON goals(checkin_id)")
+        conn.commit()
+
+    def take_pending_members(self):
+        members, self._pending_members = self._pending_members, set()
+        return members
+
+    def _user_rows(self, user_id):
+        """[(打卡ID, 时间戳, 目标), ...]（时间无法解析的记录跳过）"""
+        rows = []
+        for row_id, text, goal in self.pool.connection().execute(SQL_LEGACY_USER_ROWS, (user_id,)):
+            ts = parse_legacy_time(text)
+            if ts is not None:
+                rows.append((row_id, ts, goal))
+        return rows
+
+    def _append(self, user_id, checkin_dt, goals):
+        """以旧格式写入一次打卡，返回每个目标的打卡ID"""
+        conn = self.pool.connection()
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            c.execute(
+                "INSERT INTO checkins (user_id, checkin_time) VALUES (?, ?)",
+                (user_id, checkin_dt.strftime(LEGACY_TIME_FORMAT))
+            )
+            checkin_id = c.lastrowid
+            ids = []
+            for goal in goals:
+                c.execute("INSERT INTO goals (checkin_id, goal) VALUES (?, ?)", (checkin_id, goal))
+                ids.append(c.lastrowid)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        return ids
+
+    # ---------- 打卡写入 ----------
+    def checkin(self, user_id, goals):
+        return self._append(user_id, datetime.now(china_tz), goals)
+
+    def checkin_many(self, requests):
+        results = []
+        for user_id, goals in requests:
+            try:
+                results.append(self.checkin(user_id, goals))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def supplement_checkin(self, user_id, goal, checkin_date):
+        checkin_time = parse_checkin_time(checkin_date)
+        day = day_key(checkin_time)
+        if any(g == goal and epoch_day(ts) == day for _, ts, g in self._user_rows(user_id)):
+            raise ValueError("该日期已存在此目标的打卡记录")
+        return self._append(user_id, checkin_time, [goal])[0]
+
+    def import_rows(self, records):
+        raise ValueError(UPGRADING)
+
+    def import_batch(self, records):
+        raise ValueError(UPGRADING)
+
+    def rebuild_imported(self, goal_users):
+        """升级期间不会有导入"""
+
+    # ---------- 查询 ----------
+    def get_checkins(self, user_id):
+        return [(row_id, user_id, ts, goal) for row_id, ts, goal in self._user_rows(user_id)]
+
+    def get_checkin_report(self, user_id):
+        today = today_key()
+        streaks = {goal: bitmap.streak_ending(today) for goal, bitmap in self.get_day_bitmaps(user_id).items()}
+        return self.get_checkins(user_id), streaks
+
+    def get_goals(self, checkin_id):
+        return [row[0] for row in self.pool.connection().execute(
+            "SELECT goal FROM goals WHERE id = ?", (checkin_id,)
+        )]
+
+    def get_last_goals(self, user_id):
+        rows = self._user_rows(user_id)
+        if not rows:
+            return []
+        last = max(ts for _, ts, _ in rows)
+        return list(dict.fromkeys(goal for _, ts, goal in rows if ts == last))
+
+    def get_admin_qq(self):
+        first = self.get_first_checkin()
+        return first[1] if first else '0'
+
+    def get_first_checkin(self):
+        row = self.pool.connection().execute(
+            "SELECT checkin_time, user_id FROM checkins ORDER BY checkin_time ASC LIMIT 1"
+        ).fetchone()
+        return (parse_legacy_time(row[0]), row[1]) if row else None
+
+    def has_checked_in_today(self, user_id, goal):
+        bitmap = self.get_day_bitmaps(user_id).get(goal)
+        return bool(bitmap) and today_key() in bitmap
+
+    def get_today_status(self, user_id, goals):
+        today = today_key()
+        bitmaps = self.get_day_bitmaps(user_id)
+        return {
+            goal: (today in bitmaps[goal], bitmaps[goal].streak_ending(today))
+            if goal in bitmaps else (False, 0)
+            for goal in dict.fromkeys(goals)
+        }
+
+    def get_consecutive_days(self, user_id, goal=None):
+        bitmaps = self.get_day_bitmaps(user_id)
+        if goal:
+            bitmaps = {goal: bitmaps[goal]} if goal in bitmaps else {}
+        merged = DayBitmap()
+        for bitmap in bitmaps.values():
+            merged = merged | bitmap
+        return merged.streak_ending(today_key())
+
+    def get_recent_checkins(self, user_id, days=30):
+        cutoff = to_epoch(datetime.now(china_tz) - timedelta(days=days))
+        goal_data = {}
+        for _, ts, goal in sorted(self._user_rows(user_id), key=lambda row: (row[2], row[1])):
+            if ts >= cutoff:
+                goal_data.setdefault(goal, []).append(ts)
+        return goal_data
+
+    def iter_history(self, user_id):
+        # 先读完再返回，升级完成替换文件时不会有读到一半的游标
+        return iter([
+            (goal, day)
+            for goal, bitmap in self.get_day_bitmaps(user_id).items()
+            for day in bitmap.days(bitmap.first_day(), bitmap.last_day())
+        ])
+
+    def get_day_bitmaps(self, user_id):
+        bitmaps = {}
+        for _, ts, goal in self._user_rows(user_id):
+            bitmaps.setdefault(goal, DayBitmap()).add(epoch_day(ts))
+        return bitmaps
+
+    def get_period_stats(self, user_id, grain, period):
+        stats = {}
+        seen = set()
+        for _, ts, goal in self._user_rows(user_id):
+            day = epoch_day(ts)
+            if (grain, period) not in periods(day):
+                continue
+            days, checkins = stats.get(goal, (0, 0))
+            stats[goal] = (days + ((goal, day) not in seen), checkins + 1)
+            seen.add((goal, day))
+        return stats
+
+    def iter_export_rows(self, user_id=None):
+        raise ValueError(UPGRADING)
+
+    # ---------- 群排行（升级期间为空，成员登记在完成后补写） ----------
+    def join_group(self, user_id, group_id):
+        self._pending_members.add((group_id, user_id))
+        return True
+
+    def get_group_ranking(self, group_id, goal=None, limit=10):
+        return [], []
+
+    def get_group_stats(self, group_id, since_day):
+        return {"members": 0, "active": 0, "checkins": 0, "goals": {}, "hours": [0] * 24}
+
+    # ---------- 删除与清理 ----------
+    def delete_goals(self, user_id, goal):
+        raise ValueError(UPGRADING)
+
+    def delete_all_checkins(self, user_id):
+        raise ValueError(UPGRADING)
+
+    def clear_database(self):
+        raise ValueError(UPGRADING)
+
+    def purge_checkins_chunk(self, cutoff_day, limit=500, archive=True):
+        return 0
+
+    # ---------- 维护 ----------
+    def check_query_plans(self):
+        return []
+
+    def rebuild_rollups(self):
+        """升级完成时会重建"""
+
+    def legacy_supplement_count(self):
+        return 0
+
+    def correct_legacy_supplements(self):
+        raise ValueError(UPGRADING)
+
+    def incremental_vacuum_enabled(self):
+        return True
+
+    def enable_incremental_vacuum(self):
+        return False
+
+    def incremental_vacuum(self, pages=1000):
+        return 0
+
+    def backup_database(self, backup_dir=None, max_backups=3, compress=True):
+        return False, UPGRADING
+
+    def restore_database(self, backup_name, backup_dir=None):
+        return False, UPGRADING
+
+
+def upgrade_aware(cls):
+    """类装饰器：升级期间（实例的 _upgrade 不为空），LegacyStorage 定义的公开方法改由兼容层处理"""
+    for name, method in vars(LegacyStorage).items():
+        if name.startswith('_') or not callable(method) or name not in vars(cls):
+            continue
+        setattr(cls, name, _forward(name, getattr(cls, name)))
+    return cls
+
+
+def _forward(name, method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        upgrade = self._upgrade
+        if upgrade is not None:
+            # 与升级的最后一步互斥：要么在替换前由兼容层处理，要么在替换后走新结构
+            with upgrade.lock:
+                if self._upgrade is not None:
+                    return getattr(upgrade.legacy, name)(*args, **kwargs)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+class LegacyUpgrade:
+    """后台升级旧版数据库，完成后在线替换（与 restore_database 相同的方式）"""
+    def __init__(self, manager):
+        self.manager = manager
+        self.db_path = manager.pool.db_path
+        folder = os.path.dirname(self.db_path) or '.'
+        self.work_path = os.path.join(folder, 'checkin_upgrade.db')
+        self.backup_path = os.path.join(folder, 'checkin_backup.db')
+        self.legacy = LegacyStorage(self.db_path, manager.data_dir)
+        self.lock = threading.Lock()
+        self.error = None
+        self._cancelled = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="checkin-db-upgrade", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """等待升级结束，返回是否已升级完成"""
+        if self._thread:
+            self._thread.join(timeout)
+        return self.manager._upgrade is None
+
+    def cancel(self):
+        """插件关闭时调用：尚未替换前中止（下次启动从检查点继续）"""
+        with self.lock:
+            self._cancelled = True
+        if self._thread:
+            self._thread.join()
+        self.legacy.close_connections()
+
+    def _check_cancelled(self, *_):
+        if self._cancelled:
+            raise UpgradeCancelled()
+
+    def _run(self):
+        try:
+            backup_legacy(self.db_path, self.backup_path)
+            self.legacy.add_indexes()
+            # 大部分记录在不加锁时复制，兼容层照常读写
+            migrate_database(self.db_path, self.work_path, finish=False, progress=self._check_cancelled)
+            with self.lock:
+                self._check_cancelled()
+                # 补齐升级期间追加的记录，建索引与派生表
+                migrate_database(self.db_path, self.work_path)
+                problems = verify_migration(self.db_path, self.work_path)
+                if problems:
+                    raise RuntimeError("核对未通过: " + "；".join(problems[:5]))
+                self._swap()
+                members = self.legacy.take_pending_members()
+                self.manager._upgrade = None
+                self.manager.init_db()
+        except UpgradeCancelled:
+            return
+        except Exception as e:
+            self.error = e
+            self.manager.log_error(f"旧版数据库升级失败（继续以兼容模式运行，重启后从检查点重试）: {e}")
+            return
+        os.remove(self.work_path)
+        for group_id, user_id in members:
+            self.manager.join_group(user_id, group_id)
+        # 升级期间缓存的统计来自兼容层（群排行与统计为空）
+        self.manager._notify_reset()
+
+    def _swap(self):
+        """把升级结果整体写入原数据库文件（其他连接下一次读取即看到新结构）"""
+        self.legacy.close_connections()
+        src = sqlite3.connect(self.work_path)
+        try:
+            src.backup(self.manager.pool.connection())
+        finally:
+            src.close()
+        self.manager._goal_ids.clear()
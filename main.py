@@ -1,4 +1,5 @@
 import os
+import time
 import asyncio
 import json
 from pkg.plugin.context import *
@@ -6,12 +7,20 @@ from pkg.plugin.events import *
 from pkg.platform.types import *
 from typing import Dict, Callable, Optional
 from pkg.plugin.context import APIHost, BasePlugin, register
-from .dbedit import DatabaseManager
+from .storage import create_storage, format_time, day_to_date, today_key, month_of
+from .rollups import MONTH, YEAR
+from .asyncdb import AsyncDatabase
+from .config import load_config
+from .retention import RetentionEngine, RetentionPolicy
 from .generator import Generator
+from .cache import LRUCache, TTLCache
+from .transfer import FORMATS
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 
 china_tz = timezone(timedelta(hours=8))
+# 已登记群成员缓存容量
+MEMBER_CACHE_SIZE = 8192
 
 class CommandHandler:
     """命令处理基类"""
@@ -21,6 +30,8 @@ class CommandHandler:
         self.ap = plugin.ap
     async def handle(self, ctx: EventContext, user_id: str, args: list):
         raise NotImplementedError
+    def clear_cache(self):
+        """数据被整体替换后清空缓存（默认无缓存）"""
 class CheckInHandler(CommandHandler):
     """打卡命令处理（支持无参数自动使用上次目标）"""
     async def handle(self, ctx: EventContext, user_id: str, args: list):
@@ -30,7 +41,7 @@ class CheckInHandler(CommandHandler):
             await self._handle_with_args(ctx, user_id, args)
     async def _handle_no_args(self, ctx: EventContext, user_id: str):
         """处理无参数打卡（增强版）"""
-        last_goals = self._get_last_goals(user_id)
+        last_goals = await self._get_last_goals(user_id)
         
         if not last_goals:
             await self._show_help(ctx, user_id)
@@ -40,20 +51,21 @@ class CheckInHandler(CommandHandler):
             ])
             return
         
-        # 获取所有目标的打卡状态
+        # 一次查询所有目标的打卡状态
+        status = await self.db.get_today_status(user_id, last_goals)
         goal_status = []
         valid_goals = []
         for goal in last_goals:
-            if self.db.has_checked_in_today(user_id, goal):
-                days = self.db.get_consecutive_days(user_id, goal) - 1  # 今日之前连续天数
-                goal_status.append(f"【{goal}】今日已打卡（连续 {days} 天）")
+            done, days = status[goal]
+            if done:
+                goal_status.append(f"【{goal}】今日已打卡（连续 {days - 1} 天）")  # 今日之前连续天数
             else:
                 valid_goals.append(goal)
         
         if valid_goals:
             # 执行有效目标打卡
-            checkin_id = self.db.checkin(user_id, valid_goals)
-            details = self._build_checkin_details(user_id, valid_goals)
+            checkin_id = await self.db.checkin(user_id, valid_goals)
+            details = await self._build_checkin_details(user_id, valid_goals)
             
             reply = (
                 f"⏰ 自动使用上次目标\n"
@@ -69,14 +81,9 @@ class CheckInHandler(CommandHandler):
         
         await ctx.reply([At(user_id), Plain(reply)])
 
-    def _get_last_goals(self, user_id: str) -> list:
+    async def _get_last_goals(self, user_id: str) -> list:
         """获取用户最后一次打卡目标"""
-        last_checkin = self.db.get_checkins(user_id)
-        if not last_checkin:
-            return []
-        
-        last_checkin_id = last_checkin[0][0]
-        return self.db.get_goals(last_checkin_id)
+        return await self.db.get_last_goals(user_id)
     async def _handle_with_args(self, ctx: EventContext, user_id: str, args: list):
         """处理带参数打卡"""
         goals = [g.strip() for g in args[0].split(",") if g.strip()]
@@ -85,7 +92,7 @@ class CheckInHandler(CommandHandler):
             await ctx.reply([At(user_id), Plain("❌ 目标不能为空！")])
             return
         
-        new_goals, duplicates = self._filter_duplicates(user_id, goals)
+        new_goals, duplicates = await self._filter_duplicates(user_id, goals)
         
         if duplicates:
             await ctx.reply([
@@ -96,23 +103,25 @@ class CheckInHandler(CommandHandler):
         if not new_goals:
             return
         
-        checkin_id = self.db.checkin(user_id, new_goals)
-        details = self._build_checkin_details(user_id, new_goals)
+        checkin_id = await self.db.checkin(user_id, new_goals)
+        details = await self._build_checkin_details(user_id, new_goals)
         await ctx.reply([At(user_id), Plain(f"✅ 打卡成功！\n{details}")])
 
-    def _filter_duplicates(self, user_id: str, goals: list) -> tuple:
+    async def _filter_duplicates(self, user_id: str, goals: list) -> tuple:
         new_goals = []
         duplicates = []
+        status = await self.db.get_today_status(user_id, goals)
         for goal in goals:
-            if self.db.has_checked_in_today(user_id, goal):
+            if status[goal][0]:
                 duplicates.append(goal)
             else:
                 new_goals.append(goal)
         return new_goals, duplicates
-    def _build_checkin_details(self, user_id: str, goals: list) -> str:
+    async def _build_checkin_details(self, user_id: str, goals: list) -> str:
         details = []
+        status = await self.db.get_today_status(user_id, goals)
         for goal in goals:
-            days = self.db.get_consecutive_days(user_id, goal)
+            days = status[goal][1]
             details.append(f"【{goal}】连续打卡 {days} 天")
         return "\n".join(details)
     async def _show_help(self, ctx: EventContext, user_id: str):
@@ -138,14 +147,19 @@ class DeleteHandler(CommandHandler):
             if not is_admin:
                 return
             
-            count = self.db.delete_all_checkins(user_id)
-            reply = f"已删除所有打卡记录，共{count}次打卡"
-        else:
-            deleted_count = self.db.delete_goals(user_id, target)
-            if deleted_count == 0:
-                reply = f"未找到目标【{target}】的打卡记录"
+        try:
+            if target == "所有":
+                count = await self.db.delete_all_checkins(user_id)
+                reply = f"已删除所有打卡记录，共{count}次打卡"
             else:
-                reply = f"已删除目标【{target}】的{deleted_count}条记录"
+                deleted_count = await self.db.delete_goals(user_id, target)
+                if deleted_count == 0:
+                    reply = f"未找到目标【{target}】的打卡记录"
+                else:
+                    reply = f"已删除目标【{target}】的{deleted_count}条记录"
+        except ValueError as e:
+            # 旧版数据库升级期间暂不支持删除
+            reply = f"❌ {str(e)}"
         
         await ctx.reply([At(user_id), Plain(reply)])
     async def _show_help(self, ctx: EventContext, user_id: str):
@@ -159,42 +173,51 @@ class DeleteHandler(CommandHandler):
 class RecordHandler(CommandHandler):
     """打卡记录查询处理"""
     async def handle(self, ctx: EventContext, user_id: str, args: list):
-        checkins = self.db.get_checkins(user_id)
-        if not checkins:
+        if args and args[0] in ('月', '年'):
+            return await self._handle_period(ctx, user_id, args[0])
+        checkins, streaks = await self.db.get_checkin_report(user_id)
+        # 累计天数包含已归档的历史记录
+        history = await self.db.get_history_summary(user_id)
+        if not checkins and not history:
             return await ctx.reply([At(user_id), Plain(" 暂无打卡记录！")])
         
         # 按目标分类统计
-        goals_stats = self._analyze_goals(checkins, user_id)
+        goals_stats = self._analyze_goals(checkins, streaks, history)
         report = self._format_report(goals_stats)
         
         await ctx.reply([At(user_id), Plain(report)])
-    def _analyze_goals(self, checkins: list, user_id: str) -> list:
+    def _analyze_goals(self, checkins: list, streaks: dict, history: dict) -> list:
         goals_data = {}
-        for checkin in checkins:
-            goals = self.db.get_goals(checkin[0])
-            for goal in goals:
-                if goal not in goals_data:
-                    goals_data[goal] = {
-                        'total': 0,
-                        'last_date': None,
-                        'dates': []
-                    }
-                goals_data[goal]['total'] += 1
-                goals_data[goal]['dates'].append(checkin[2])
-                goals_data[goal]['last_date'] = max(
-                    goals_data[goal]['last_date'] or checkin[2],
-                    checkin[2]
-                )
+        for checkin_id, _, checkin_time, goal in checkins:
+            if goal not in goals_data:
+                goals_data[goal] = {
+                    'total': 0,
+                    'last_date': None,
+                    'dates': []
+                }
+            goals_data[goal]['total'] += 1
+            goals_data[goal]['dates'].append(checkin_time)
+            goals_data[goal]['last_date'] = max(
+                goals_data[goal]['last_date'] or checkin_time,
+                checkin_time
+            )
         
         # 计算连续天数
         stats = []
-        for goal, data in goals_data.items():
-            consecutive = self.db.get_consecutive_days(user_id, goal)
+        for goal in dict.fromkeys([*goals_data, *history]):
+            data = goals_data.get(goal)
+            summary = history.get(goal)
+            consecutive = streaks.get(goal, 0)
+            if data:
+                last_date = format_time(data['last_date'])
+            else:
+                # 只剩归档记录的目标显示最后打卡日期
+                last_date = day_to_date(summary['last_day']).strftime('%Y-%m-%d')
             stats.append((
                 goal,
-                data['total'],
+                summary['days'] if summary else data['total'],
                 consecutive,
-                data['last_date']
+                last_date
             ))
         return sorted(stats, key=lambda x: (-x[1], -x[2]))
     def _format_report(self, stats: list) -> str:
@@ -203,10 +226,114 @@ class RecordHandler(CommandHandler):
             report.append(
                 f"🏷️ 目标：{goal}\n"
                 f"✅ 累计天数：{total}天\n"
-                f"📆 最后打卡：{last_date[:16]}\n"
+                f"📆 最后打卡：{last_date}\n"
                 f"⏳ 当前连续：{consecutive}天"
             )
         return "\n".join(report)
+    async def _handle_period(self, ctx: EventContext, user_id: str, scope: str):
+        """本月/本年统计（直接读取汇总表）"""
+        today = today_key()
+        today_date = day_to_date(today)
+        calendars = {}
+        if scope == '月':
+            title = f"📅 本月打卡（{today_date.year}年{today_date.month}月）"
+            stats = await self.db.get_period_stats(user_id, MONTH, month_of(today))
+            elapsed = today_date.day
+            # 月历由打卡日位图直接取出
+            month_start = today - elapsed + 1
+            for goal, bitmap in (await self.db.get_day_bitmaps(user_id)).items():
+                calendars[goal] = self._format_calendar(bitmap.days(month_start, today), month_start, today)
+        else:
+            title = f"📅 年度打卡（{today_date.year}年）"
+            stats = await self.db.get_period_stats(user_id, YEAR, today_date.year)
+            elapsed = today_date.timetuple().tm_yday
+        if not stats:
+            return await ctx.reply([At(user_id), Plain(f" {title[2:]}暂无打卡记录！")])
+        
+        report = [title, "----------------"]
+        for goal, (days, checkins) in sorted(stats.items(), key=lambda x: (-x[1][0], -x[1][1])):
+            report.append(
+                f"🏷️ 目标：{goal}\n"
+                f"✅ 打卡天数：{days}/{elapsed}天（{days * 100 // elapsed}%）\n"
+                f"🔁 打卡次数：{checkins}次"
+            )
+            if goal in calendars:
+                report.append(f"🗓️ {calendars[goal]}")
+        await ctx.reply([At(user_id), Plain("\n".join(report))])
+    def _format_calendar(self, days: list, start: int, end: int) -> str:
+        """■ 已打卡 □ 未打卡，每7天一组"""
+        done = set(days)
+        cells = ['■' if day in done else '□' for day in range(start, end + 1)]
+        return ' '.join(''.join(cells[i:i + 7]) for i in range(0, len(cells), 7))
+class RankingHandler(CommandHandler):
+    """群打卡排行（读取预计算的前 K 名）"""
+    RANKING_SIZE = 10
+    MEDALS = ['🥇', '🥈', '🥉']
+
+    async def handle(self, ctx: EventContext, user_id: str, args: list):
+        if str(ctx.event.launcher_type) != 'group':
+            return await ctx.reply([At(user_id), Plain(" 打卡排行仅支持在群内使用！")])
+        
+        goal = args[0] if args else None
+        streaks, totals = await self.db.get_group_ranking(
+            str(ctx.event.launcher_id), goal, self.RANKING_SIZE
+        )
+        if not totals:
+            return await ctx.reply([At(user_id), Plain(" 本群暂无打卡记录！")])
+        
+        report = [f"🏆 群打卡排行（{goal or '全部目标'}）", "----------------", "⏳ 当前连续"]
+        report += self._format_rows(streaks) or ["今日暂无人打卡"]
+        report += ["----------------", "✅ 累计天数"]
+        report += self._format_rows(totals)
+        await ctx.reply([At(user_id), Plain("\n".join(report))])
+    def _format_rows(self, rows: list) -> list:
+        return [
+            f"{self.MEDALS[i] if i < len(self.MEDALS) else f'{i + 1}.'} {member}：{days}天"
+            for i, (member, days) in enumerate(rows)
+        ]
+class StatsHandler(CommandHandler):
+    """群打卡统计（聚合查询，结果短时缓存）"""
+    def __init__(self, plugin):
+        super().__init__(plugin)
+        self.settings = plugin.config["group_stats"]
+        self._cache = TTLCache(ttl=self.settings["cache_seconds"])
+
+    async def handle(self, ctx: EventContext, user_id: str, args: list):
+        if str(ctx.event.launcher_type) != 'group':
+            return await ctx.reply([At(user_id), Plain(" 打卡统计仅支持在群内使用！")])
+        
+        group_id = str(ctx.event.launcher_id)
+        days = int(args[0]) if args and args[0].isdigit() else self.settings["days"]
+        days = max(1, min(days, 365))
+        stats = self._cache.get((group_id, days))
+        if stats is None:
+            stats = await self.db.get_group_stats(group_id, today_key() - days + 1)
+            self._cache.put((group_id, days), stats)
+        if not stats["checkins"]:
+            return await ctx.reply([At(user_id), Plain(f" 本群近{days}天暂无打卡记录！")])
+        
+        await ctx.reply([At(user_id), Plain(self._format_stats(stats, days))])
+    def clear_cache(self):
+        self._cache.clear()
+    def _format_stats(self, stats: dict, days: int) -> str:
+        report = [
+            f"📈 本群近{days}天打卡统计",
+            "----------------",
+            f"👥 活跃成员：{stats['active']}/{stats['members']}人",
+            f"✅ 打卡次数：{stats['checkins']}次",
+            "🔥 热门目标",
+        ]
+        goals = sorted(stats["goals"].items(), key=lambda x: (-x[1][0], -x[1][1]))
+        for i, (goal, (members, checkins)) in enumerate(goals[:self.settings["top_goals"]], 1):
+            report.append(f"{i}. {goal}：{members}人 / {checkins}次")
+        
+        # 按4小时一段显示打卡时段分布
+        report.append("⏰ 打卡时段")
+        for start in range(0, 24, 4):
+            count = sum(stats["hours"][start:start + 4])
+            percent = count * 100 // stats["checkins"]
+            report.append(f"{start:02d}-{start + 4:02d}时 {'█' * (percent // 10) or '▏'} {percent}%")
+        return "\n".join(report)
 class AnalysisHandler(CommandHandler):
     """数据分析处理（纯JSON存储版）"""
     def __init__(self, plugin):
@@ -214,6 +341,7 @@ class AnalysisHandler(CommandHandler):
         self.current_directory = os.path.dirname(os.path.abspath(__file__))
         self.storage_file = os.path.join(self.current_directory, "analysis_usage.json")  # 使用记录文件
         self.lock = asyncio.Lock()  # 异步文件操作锁
+        self._reports = None  # 报告缓存，首次使用时从文件读取
 
     async def handle(self, ctx: EventContext, user_id: str, args: list):
         # 检查缓存并处理
@@ -225,7 +353,7 @@ class AnalysisHandler(CommandHandler):
                 Plain(f"📊 分析报告（{time_str}生成）：\n{cached_report['content']}")
             ])
         # 生成新报告流程
-        analysis_data = self._prepare_analysis_data(user_id)
+        analysis_data = await self._prepare_analysis_data(user_id)
         if not analysis_data:
             return await ctx.reply([At(user_id), Plain("⏳ 暂无近期打卡数据可供分析")])
         try:
@@ -246,17 +374,20 @@ class AnalysisHandler(CommandHandler):
             await ctx.reply([At(user_id), Plain("⚠️ 报告生成失败，请稍后重试")])
             self.plugin.ap.logger.error(f"分析失败: {str(e)}")
 
-    async def _get_cached_report(self, user_id: str) -> Optional[dict]:
-        """获取缓存报告"""
-        async with self.lock:
-            if not os.path.exists(self.storage_file):
-                return None
+    def _load_reports(self) -> dict:
+        """报告缓存（首次调用时读取文件，之后只在内存中查找；需持有 self.lock）"""
+        if self._reports is None:
             try:
                 with open(self.storage_file, 'r') as f:
-                    reports = json.load(f)
+                    self._reports = json.load(f)
             except (json.JSONDecodeError, FileNotFoundError):
-                return None
-            user_report = reports.get(user_id)
+                self._reports = {}
+        return self._reports
+
+    async def _get_cached_report(self, user_id: str) -> Optional[dict]:
+        """获取缓存报告"""
+        async with self.lock:
+            user_report = self._load_reports().get(user_id)
             if not user_report:
                 return None
             # 检查时间有效性
@@ -268,15 +399,7 @@ class AnalysisHandler(CommandHandler):
     async def _save_report(self, user_id: str, content: str):
         """保存报告到文件"""
         async with self.lock:
-            # 读取现有数据
-            if os.path.exists(self.storage_file):
-                try:
-                    with open(self.storage_file, 'r') as f:
-                        reports = json.load(f)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    reports = {}
-            else:
-                reports = {}
+            reports = self._load_reports()
             # 更新记录
             reports[user_id] = {
                 "time": datetime.now(china_tz).isoformat(),
@@ -286,8 +409,8 @@ class AnalysisHandler(CommandHandler):
             with open(self.storage_file, 'w') as f:
                 json.dump(reports, f, indent=2, ensure_ascii=False)
             
-    def _prepare_analysis_data(self, user_id: str) -> dict:
-        goal_data = self.db.get_recent_checkins(user_id)
+    async def _prepare_analysis_data(self, user_id: str) -> dict:
+        goal_data = await self.db.get_recent_checkins(user_id)
         if not goal_data:
             return None
         
@@ -299,7 +422,7 @@ class AnalysisHandler(CommandHandler):
         for goal, times in goal_data.items():
                 analysis_data["goals"].append({
                     "goal": goal,
-                    "checkin_times": times,
+                    "checkin_times": [format_time(t) for t in times],
                     "count": len(times)
                 })
             
@@ -335,7 +458,7 @@ class SupplementHandler(CommandHandler):
                     return
             
             # 执行补打卡
-            checkin_id = self.db.supplement_checkin(
+            checkin_id = await self.db.supplement_checkin(
                 user_id=target_user,
                 goal=goal,
                 checkin_date=date_str
@@ -346,7 +469,7 @@ class SupplementHandler(CommandHandler):
                 f"用户：{target_user}\n"
                 f"目标：{goal}\n"
                 f"时间：{date_str}\n"
-                f"当前连续天数：{self.db.get_consecutive_days(target_user, goal)}"
+                f"当前连续天数：{await self.db.get_consecutive_days(target_user, goal)}"
             )
             await ctx.reply([At(user_id), Plain(reply)])
         except ValueError as e:
@@ -389,6 +512,16 @@ class AdminCommandHandler(CommandHandler):
             await self._handle_create_admin(ctx, user_id)
         elif action == "备份":
             await self._handle_backup(ctx, user_id)
+        elif action == "恢复":
+            await self._handle_restore(ctx, user_id, args[1:])
+        elif action == "导出":
+            await self._handle_export(ctx, user_id, args[1:])
+        elif action == "导入":
+            await self._handle_import(ctx, user_id, args[1:])
+        elif action == "回收":
+            await self._handle_vacuum(ctx, user_id)
+        elif action == "校正":
+            await self._handle_correct(ctx, user_id, args[1:])
         else:
             await self._show_help(ctx, user_id)
 
@@ -397,7 +530,7 @@ class AdminCommandHandler(CommandHandler):
         is_admin, _ = await self.plugin._check_admin_permission(ctx, user_id, "创建管理员")
         if not is_admin:
             return
-        status, admin_id = self.db.read_admin_id(user_id)
+        status, admin_id = await self.db.read_admin_id(user_id)
         if status == "存在":
             reply = f"⚠️ 管理员已存在：{admin_id}"
         else:
@@ -410,12 +543,21 @@ class AdminCommandHandler(CommandHandler):
         if not is_admin:
             return
         
-        success, result = self.db.backup_database()
+        backup_cfg = self.plugin.config["backup"]
+        start = time.perf_counter()
+        success, result = await self.db.backup_database(
+            max_backups=backup_cfg["max_backups"],
+            compress=backup_cfg["compress"]
+        )
+        elapsed = time.perf_counter() - start
         if success:
-            backup_size = os.path.getsize(result) / 1024  # 转换为KB
+            # 分片存储返回每个分片的备份路径
+            paths = result if isinstance(result, list) else [result]
+            backup_size = sum(os.path.getsize(path) for path in paths) / 1024  # 转换为KB
+            path_text = "\n".join(paths)
             await ctx.reply(MessageChain([
                 At(user_id),
-                Plain(f"✅ 备份成功\n路径: {result}\n大小: {backup_size:.1f}KB")
+                Plain(f"✅ 备份成功\n路径: {path_text}\n大小: {backup_size:.1f}KB\n用时: {elapsed:.1f}秒（已通过校验）")
             ]))
         else:
             await ctx.reply(MessageChain([
@@ -423,12 +565,170 @@ class AdminCommandHandler(CommandHandler):
                 Plain(f"❌ 备份失败\n原因: {result}")
             ]))
 
+    async def _handle_vacuum(self, ctx: EventContext, user_id: str):
+        """开启增量空间回收（旧库需完整 VACUUM，期间打卡暂停）"""
+        is_admin, _ = await self.plugin._check_admin_permission(ctx, user_id, "空间回收")
+        if not is_admin:
+            return
+        
+        if await self.db.incremental_vacuum_enabled():
+            return await ctx.reply([At(user_id), Plain("✅ 已开启增量空间回收，过期记录清理后会自动回收")])
+        await ctx.reply([At(user_id), Plain("⏳ 正在重写数据库以开启增量空间回收，完成前打卡会暂停...")])
+        await self.db.flush()
+        start = time.perf_counter()
+        try:
+            await self.db.enable_incremental_vacuum()
+        except Exception as e:
+            return await ctx.reply([At(user_id), Plain(f"❌ 空间回收转换失败\n原因: {e}")])
+        await ctx.reply([At(user_id), Plain(
+            f"✅ 已开启增量空间回收\n用时: {time.perf_counter() - start:.1f}秒"
+        )])
+
+    async def _handle_correct(self, ctx: EventContext, user_id: str, args: list):
+        """校正旧版按 UTC 存储的补打卡（不带“确认”时只显示候选条数）"""
+        is_admin, _ = await self.plugin._check_admin_permission(ctx, user_id, "补打卡校正")
+        if not is_admin:
+            return
+        
+        count = await self.db.legacy_supplement_count()
+        if not count:
+            return await ctx.reply([At(user_id), Plain("✅ 没有需要校正的旧补打卡记录")])
+        if args[:1] != ["确认"]:
+            return await ctx.reply([At(user_id), Plain(
+                f"🕗 有 {count} 条旧记录可能是按 UTC 存储的补打卡（迁移时按 UTC+8 处理，时间早 8 小时）\n"
+                "其中也可能包含恰好整分打卡的普通记录，校正后这些记录会晚 8 小时\n"
+                "----------------\n确认校正：/打卡管理 校正 确认"
+            )])
+        await self.db.flush()
+        try:
+            corrected = await self.db.correct_legacy_supplements()
+        except Exception as e:
+            return await ctx.reply([At(user_id), Plain(f"❌ 校正失败\n原因: {e}")])
+        await ctx.reply([At(user_id), Plain(f"✅ 已校正 {corrected} 条旧补打卡记录，统计已重算")])
+
+    async def _handle_restore(self, ctx: EventContext, user_id: str, args: list):
+        """处理数据恢复（不带参数时列出可用备份）"""
+        is_admin, _ = await self.plugin._check_admin_permission(ctx, user_id, "数据恢复")
+        if not is_admin:
+            return
+        
+        if not args:
+            backups = await self.db.list_backups()
+            if not backups:
+                await ctx.reply([At(user_id), Plain("📭 暂无可用备份，请先执行 /打卡管理 备份")])
+                return
+            lines = [
+                f"{i}. {name}（{size / 1024:.1f}KB，{mtime.strftime('%Y-%m-%d %H:%M')}）"
+                for i, (name, size, mtime) in enumerate(backups, 1)
+            ]
+            await ctx.reply([At(user_id), Plain(
+                "🗂️ 可用备份（最新在前）：\n" + "\n".join(lines) +
+                "\n----------------\n恢复：/打卡管理 恢复 <序号|文件名>\n⚠️ 恢复将覆盖当前全部打卡数据"
+            )])
+            return
+        
+        # 先提交合并队列中的打卡，避免与恢复交错
+        await self.db.flush()
+        success, result = await self.db.restore_database(args[0])
+        if success:
+            counts = result["counts"]
+            await ctx.reply(MessageChain([
+                At(user_id),
+                Plain(
+                    f"✅ 恢复成功\n备份: {os.path.basename(result['path'])}\n"
+                    f"目标数: {counts['goals']}\n打卡记录数: {counts['checkins']}\n"
+                    f"用时: {result['elapsed']:.1f}秒"
+                )
+            ]))
+        else:
+            await ctx.reply(MessageChain([
+                At(user_id),
+                Plain(f"❌ 恢复失败\n原因: {result}")
+            ]))
+
+    def _transfer_dirs(self):
+        """(导入目录, 导出目录)"""
+        return (os.path.join(self.db.data_dir, 'import'), os.path.join(self.db.data_dir, 'export'))
+
+    async def _handle_export(self, ctx: EventContext, user_id: str, args: list):
+        """导出全部打卡记录（流式写入，默认 CSV）"""
+        is_admin, _ = await self.plugin._check_admin_permission(ctx, user_id, "数据导出")
+        if not is_admin:
+            return
+        
+        fmt = args[0].lower() if args else FORMATS[0]
+        if fmt not in FORMATS:
+            await ctx.reply([At(user_id), Plain(f"⚠️ 支持的格式：{'、'.join(FORMATS)}")])
+            return
+        await self.db.flush()
+        name = f"checkins_{datetime.now(china_tz).strftime('%Y%m%d_%H%M%S')}.{fmt}"
+        success, result = await self.db.export_checkins(os.path.join(self._transfer_dirs()[1], name), fmt)
+        if success:
+            size = os.path.getsize(result["path"]) / 1024
+            await ctx.reply(MessageChain([
+                At(user_id),
+                Plain(
+                    f"✅ 导出成功\n路径: {result['path']}\n记录数: {result['count']}\n"
+                    f"大小: {size:.1f}KB\n用时: {result['elapsed']:.1f}秒"
+                )
+            ]))
+        else:
+            await ctx.reply(MessageChain([At(user_id), Plain(f"❌ 导出失败\n原因: {result}")]))
+
+    async def _handle_import(self, ctx: EventContext, user_id: str, args: list):
+        """从导入目录（或导出目录）中的文件导入打卡记录（不带参数时列出可用文件）"""
+        is_admin, _ = await self.plugin._check_admin_permission(ctx, user_id, "数据导入")
+        if not is_admin:
+            return
+        
+        dirs = self._transfer_dirs()
+        if not args:
+            names = sorted({
+                name for folder in dirs if os.path.isdir(folder)
+                for name in os.listdir(folder) if name.rsplit('.', 1)[-1].lower() in FORMATS
+            })
+            if not names:
+                await ctx.reply([At(user_id), Plain(f"📭 暂无可导入文件，请将 CSV / JSONL 文件放入 {dirs[0]}")])
+                return
+            await ctx.reply([At(user_id), Plain(
+                "🗂️ 可导入文件：\n" + "\n".join(names) +
+                "\n----------------\n导入：/打卡管理 导入 <文件名>\n已存在的相同记录会自动跳过"
+            )])
+            return
+        
+        # 只接受文件名，不允许访问数据目录以外的路径
+        name = os.path.basename(args[0])
+        paths = [os.path.join(folder, name) for folder in dirs if os.path.isfile(os.path.join(folder, name))]
+        if not paths:
+            await ctx.reply([At(user_id), Plain(f"❌ 未找到文件：{name}")])
+            return
+        await self.db.flush()
+        success, result = await self.db.import_checkins(paths[0])
+        if success:
+            lines = [
+                f"✅ 导入完成\n文件: {name}\n导入: {result['imported']}\n"
+                f"跳过（已存在）: {result['skipped']}\n无法解析: {result['invalid']}\n"
+                f"用时: {result['elapsed']:.1f}秒"
+            ]
+            if result["errors"]:
+                lines.append("无法解析的行：\n" + "\n".join(
+                    f"第{line_no}行 {reason}" for line_no, reason in result["errors"][:5]
+                ))
+            await ctx.reply(MessageChain([At(user_id), Plain("\n".join(lines))]))
+        else:
+            await ctx.reply(MessageChain([At(user_id), Plain(f"❌ 导入失败\n原因: {result}")]))
+
     async def _show_help(self, ctx: EventContext, user_id: str):
         help_msg = (
             "🛠️ 管理命令指南\n"
             "----------------\n"
             "1. 创建管理员：/打卡管理 创建\n"
             "2. 数据备份：/打卡管理 备份\n"
+            "3. 数据恢复：/打卡管理 恢复 [序号|文件名]\n"
+            "4. 数据导出：/打卡管理 导出 [csv|jsonl]\n"
+            "5. 数据导入：/打卡管理 导入 [文件名]\n"
+            "6. 空间回收：/打卡管理 回收（旧库一次性转换，期间打卡暂停）\n"
+            "7. 补打卡校正：/打卡管理 校正 [确认]（旧版按 UTC 存储的补打卡）\n"
             "----------------\n"
             "⚠️ 所有操作需管理员权限"
         )
@@ -443,36 +743,66 @@ class HelpCommandHandler(CommandHandler):
                 "📝 打卡系统使用指南\n"
                 "-----------------\n"
                 "1. 日常打卡：/打卡 <目标>\n"
-                "2. 记录查询：/打卡记录\n"
+                "2. 记录查询：/打卡记录 [月|年]\n"
                 "3. 数据分析：/打卡分析\n"
                 "4. 记录删除：/打卡删除 <目标|所有>\n"
                 "5. 补打卡：/打卡补 [用户] <目标> <日期>\n"
                 "6. 管理功能：/打卡管理\n"
-                "7. 打卡帮助: /打卡帮助"
+                "7. 群内排行：/打卡排行 [目标]\n"
+                "8. 群内统计：/打卡统计 [天数]\n"
+                "9. 打卡帮助: /打卡帮助"
             )
         await ctx.reply([At(user_id), Plain(help_msg)])
 
 class CheckInManager:
     """打卡系统核心管理类"""
+    # 命令 -> 处理类（首次使用时创建实例）
+    HANDLER_CLASSES = {
+        '打卡': CheckInHandler,
+        '打卡删除': DeleteHandler,
+        '打卡记录': RecordHandler,
+        '打卡分析': AnalysisHandler,
+        '打卡补': SupplementHandler,
+        '打卡管理': AdminCommandHandler,
+        '打卡排行': RankingHandler,
+        '打卡统计': StatsHandler,
+        '打卡帮助': HelpCommandHandler
+    }
+
     def __init__(self, plugin: 'DailyGoalsTrackerPlugin'):
         self.plugin = plugin
-        self.command_handlers: Dict[str, CommandHandler] = {
-            '打卡': CheckInHandler(plugin),
-            '打卡删除': DeleteHandler(plugin),
-            '打卡记录': RecordHandler(plugin),
-            '打卡分析': AnalysisHandler(plugin),
-            '打卡补': SupplementHandler(plugin),
-            '打卡管理': AdminCommandHandler(plugin),
-            '打卡帮助': HelpCommandHandler(plugin)
-        }
-    
-    async def process_command(self, ctx: EventContext, cmd: str, user_id: str, args: list):
+        self.command_handlers: Dict[str, CommandHandler] = {}
+        # 已登记的 (群, 成员)，避免每条命令都写库
+        self._members = LRUCache(MEMBER_CACHE_SIZE)
+
+    def get_handler(self, cmd: str) -> Optional[CommandHandler]:
         handler = self.command_handlers.get(cmd)
+        if handler is None and cmd in self.HANDLER_CLASSES:
+            handler = self.command_handlers[cmd] = self.HANDLER_CLASSES[cmd](self.plugin)
+        return handler
+
+    def clear_caches(self):
+        """恢复备份、旧版升级完成等整体替换数据后调用（可能在数据库线程中）"""
+        self._members.clear()
+        for handler in list(self.command_handlers.values()):
+            handler.clear_cache()
+
+    async def process_command(self, ctx: EventContext, cmd: str, user_id: str, args: list):
+        handler = self.get_handler(cmd)
         if handler:
+            if str(ctx.event.launcher_type) == 'group':
+                await self._register_member(str(ctx.event.launcher_id), user_id)
             await handler.handle(ctx, user_id, args)
         else:
             return
 
+    async def _register_member(self, group_id: str, user_id: str):
+        """在群内使用打卡命令的用户登记为群成员（参与群排行）"""
+        if self._members.get((group_id, user_id)):
+            return
+        await self.plugin.db.join_group(user_id, group_id)
+        self._members.put((group_id, user_id), True)
+
 @register(name="DailyGoalsTracker", 
          description="打卡系统，支持目标管理、AI分析等功能",
          version="2.14", 
@@ -480,10 +810,23 @@ class CheckInManager:
 class DailyGoalsTrackerPlugin(BasePlugin):
     def __init__(self, host: APIHost):
         self.ap = host.ap
-        self.db = DatabaseManager()
+        # 启动各阶段耗时 [(阶段, 毫秒), ...]，initialize 结束时写入日志
+        self._startup_timings = []
+        start = time.perf_counter()
+        self.config = load_config()
+        start = self._record_startup("配置", start)
+        self.db = AsyncDatabase(
+            create_storage(self.config["storage"]),
+            write_behind=self.config["write_behind"]
+        )
+        start = self._record_startup("存储", start)
+        self.retention = None
+        # 命令处理器、大模型生成器均在首次使用时创建
         self.manager = CheckInManager(self)
+        # 恢复备份后已登记成员、群统计等缓存随之失效
+        self.db.db.add_reset_listener(self.manager.clear_caches)
         # self.admin_mode = AdminModeManager(self)
-        self._generator = Generator(self.ap)
+        self._generator = None
         
         # 初始化配置
         self.cooldown = 30
@@ -491,7 +834,44 @@ class DailyGoalsTrackerPlugin(BasePlugin):
         self._last_request = 0
 
     async def initialize(self):
-        self.db.init_db()
+        start = time.perf_counter()
+        # 结构已是最新时只读取 user_version（构造存储时已完成检查）
+        await self.db.init_db()
+        start = self._record_startup("结构检查", start)
+        if self.config["retention"]["enabled"]:
+            self.retention = RetentionEngine(
+                self.db,
+                RetentionPolicy.from_config(self.config["retention"], logger=self.ap.logger),
+                logger=self.ap.logger
+            )
+            self.retention.start()
+            self._record_startup("清理任务", start)
+        self.ap.logger.info(
+            "打卡插件启动完成：" + "，".join(f"{phase} {ms:.1f}ms" for phase, ms in self._startup_timings)
+        )
+
+    def _record_startup(self, phase: str, start: float) -> float:
+        """记录一个启动阶段的耗时，返回下一阶段的开始时间"""
+        now = time.perf_counter()
+        self._startup_timings.append((phase, (now - start) * 1000))
+        return now
+
+    @property
+    def generator(self) -> Generator:
+        """大模型生成器（首次分析时创建）"""
+        if self._generator is None:
+            self._generator = Generator(self.ap)
+        return self._generator
+
+    def __del__(self):
+        """插件卸载时停止后台任务，提交排队的打卡并关闭数据库连接"""
+        # __init__ 中途失败时属性可能尚未赋值
+        retention = getattr(self, 'retention', None)
+        if retention:
+            retention.stop()
+        db = getattr(self, 'db', None)
+        if db:
+            db.close()
 
     async def _check_admin_permission(self, ctx, user_id, required_action):
         """
@@ -501,7 +881,7 @@ class DailyGoalsTrackerPlugin(BasePlugin):
         :param required_action: 需要执行的操作名称（用于提示）
         :return: (is_admin, admin_id) 元组
         """
-        reAdmin_status, reAdmin_id = self.db.read_admin_id(user_id)
+        reAdmin_status, reAdmin_id = await self.db.read_admin_id(user_id)
         
         if reAdmin_status == "不存在":
             await ctx.reply(MessageChain([
@@ -524,7 +904,7 @@ class DailyGoalsTrackerPlugin(BasePlugin):
         """带重试机制的模型调用"""
         for attempt in range(self.retry_limit):
             try:
-                return await self._generator.return_chat(
+                return await self.generator.return_chat(
                     request=question,
                     system_prompt=system_prompt
                 )
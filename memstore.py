@@ -0,0 +1,458 @@
+"""
+内存存储引擎
+- 数据保存在带索引的字典中，进程退出即丢失
+- 适用于测试、基准测试和无需持久化的临时部署
+- 语义与 SQLite 引擎一致（由 conformance 校验）
+"""
+import threading
+from datetime import datetime, timedelta
+
+from .storage import (
+    CheckinStorage, DATA_DIR, UTC_OFFSET, china_tz, day_key, today_key, month_of, to_epoch,
+    epoch_day, parse_checkin_time
+)
+from .streaks import current_streak, streak_row
+from .rollups import DAY, periods, build_rollups
+from .bitmaps import DayBitmap
+from .rankings import combined_stats, merge_top
+from .transfer import EXPORT_CHUNK
+
+
+class MemoryStorage(CheckinStorage):
+    """内存存储引擎（所有操作在同一把锁内执行）"""
+    def __init__(self, data_dir=DATA_DIR):
+        super().__init__(data_dir)
+        self._lock = threading.RLock()
+        self.clear_database()
+
+    def init_db(self):
+        """内存引擎无需初始化"""
+
+    # ---------- 内部索引维护 ----------
+    def _resolve_goal_id(self, user_id, goal):
+        goal_id = self._goal_index.get((user_id, goal))
+        if goal_id is None:
+            goal_id = self._next_goal_id
+            self._next_goal_id += 1
+            self._goals[goal_id] = (user_id, goal)
+            self._goal_index[(user_id, goal)] = goal_id
+            self._user_goals.setdefault(user_id, {})[goal_id] = None
+        return goal_id
+
+    def _add_checkin(self, user_id, checkin_time, goal_id, day):
+        checkin_id = self._next_checkin_id
+        self._next_checkin_id += 1
+        self._checkins[checkin_id] = (user_id, checkin_time, goal_id, day)
+        self._user_checkins.setdefault(user_id, {})[checkin_id] = None
+        self._day_checkins.setdefault(day, {})[checkin_id] = None
+        days = self._goal_days.setdefault(goal_id, {})
+        days[day] = days.get(day, 0) + 1
+        self._rollup_add(goal_id, day)
+        return checkin_id
+
+    def _remove_checkin(self, checkin_id):
+        user_id, _, goal_id, day = self._checkins.pop(checkin_id)
+        self._user_checkins[user_id].pop(checkin_id)
+        self._day_checkins[day].pop(checkin_id)
+        if not self._day_checkins[day]:
+            del self._day_checkins[day]
+        days = self._goal_days[goal_id]
+        days[day] -= 1
+        if not days[day]:
+            del days[day]
+        return goal_id
+
+    def _remove_goal(self, goal_id):
+        user_id, goal = self._goals.pop(goal_id)
+        del self._goal_index[(user_id, goal)]
+        self._user_goals[user_id].pop(goal_id)
+        self._goal_days.pop(goal_id, None)
+        self._streaks.pop(goal_id, None)
+        self._archive.pop(goal_id, None)
+        self._rollups.pop(goal_id, None)
+
+    def _rollup_add(self, goal_id, day):
+        """与 rollups.add_checkins 相同的累加规则"""
+        rollups = self._rollups.setdefault(goal_id, {})
+        new_day = (DAY, day) not in rollups
+        for key in periods(day):
+            row = rollups.setdefault(key, [0, 0])
+            row[0] += new_day
+            row[1] += 1
+
+    def _rollup_remove(self, goal_id, day):
+        """与 rollups.remove_checkins 相同的扣减规则"""
+        rollups = self._rollups.get(goal_id, {})
+        if (DAY, day) not in rollups:
+            return
+        lost_day = rollups[(DAY, day)][1] <= 1
+        for key in periods(day):
+            row = rollups[key]
+            row[0] -= lost_day
+            row[1] -= 1
+            if row[1] <= 0:
+                del rollups[key]
+
+    def _is_archived(self, goal_id, day):
+        entry = self._archive.get(goal_id, {}).get(month_of(day))
+        return bool(entry) and day in entry[0]
+
+    def _record_day(self, goal_id, day):
+        """与 streaks.SQL_ADVANCE_STREAK 相同的增量推进规则"""
+        row = self._streaks.get(goal_id)
+        if row is None:
+            self._streaks[goal_id] = [1, day, 1, 1]
+            return
+        streak, last_day, longest, total = row
+        if day < last_day:
+            # 补录早于最近打卡日的记录，需按历史修复
+            self._rebuild_streak(goal_id)
+            return
+        if day == last_day:
+            return
+        streak = streak + 1 if day == last_day + 1 else 1
+        self._streaks[goal_id] = [streak, day, max(longest, streak), total + 1]
+
+    def _rebuild_streak(self, goal_id):
+        """按打卡日（含已归档）重算单个目标的统计，与 streaks.rebuild_streaks_from_bitmaps 相同"""
+        bitmap = DayBitmap.from_days(self._goal_days.get(goal_id, ()))
+        for days, _ in self._archive.get(goal_id, {}).values():
+            for day in days:
+                bitmap.add(day)
+        if not bitmap:
+            self._streaks.pop(goal_id, None)
+            return
+        _, _, longest, total = self._streaks.get(goal_id, (0, 0, 0, 0))
+        self._streaks[goal_id] = list(streak_row(bitmap, longest, total))
+
+    def _row(self, checkin_id):
+        user_id, checkin_time, goal_id, _ = self._checkins[checkin_id]
+        return (checkin_id, user_id, checkin_time, self._goals[goal_id][1])
+
+    def _insert_checkins(self, user_id, goals, now, day):
+        goal_ids = {goal: self._resolve_goal_id(user_id, goal) for goal in dict.fromkeys(goals)}
+        checkin_ids = [self._add_checkin(user_id, now, goal_ids[goal], day) for goal in goals]
+        for goal_id in goal_ids.values():
+            self._record_day(goal_id, day)
+        return checkin_ids
+
+    # ---------- 打卡写入 ----------
+    def checkin(self, user_id, goals):
+        """打卡功能（支持多目标）"""
+        now_dt = datetime.now(china_tz)
+        with self._lock:
+            return self._insert_checkins(user_id, goals, to_epoch(now_dt), day_key(now_dt))
+
+    def checkin_many(self, requests):
+        """批量打卡，结果与请求一一对应"""
+        now_dt = datetime.now(china_tz)
+        now = to_epoch(now_dt)
+        day = day_key(now_dt)
+        results = []
+        with self._lock:
+            for user_id, goals in requests:
+                try:
+                    results.append(self._insert_checkins(user_id, goals, now, day))
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    def supplement_checkin(self, user_id, goal, checkin_date):
+        """补打卡功能"""
+        try:
+            checkin_time = parse_checkin_time(checkin_date)
+            day = day_key(checkin_time)
+            with self._lock:
+                goal_id = self._goal_index.get((user_id, goal))
+                if goal_id is not None and (
+                    day in self._goal_days.get(goal_id, ()) or self._is_archived(goal_id, day)
+                ):
+                    raise ValueError("该日期已存在此目标的打卡记录")
+                goal_id = self._resolve_goal_id(user_id, goal)
+                checkin_id = self._add_checkin(user_id, to_epoch(checkin_time), goal_id, day)
+                self._record_day(goal_id, day)
+                return checkin_id
+        except Exception as e:
+            raise ValueError(f"日期处理失败: {str(e)}")
+
+    def import_rows(self, records):
+        """逐条写入，相同（目标, 时间）已存在或当日已归档的跳过"""
+        imported = skipped = 0
+        times = {}  # user_id -> {(目标ID, 打卡时间)}（每个用户只扫描一次已有记录）
+        with self._lock:
+            for user_id, goal, checkin_time in records:
+                goal_id = self._resolve_goal_id(user_id, goal)
+                day = epoch_day(checkin_time)
+                if user_id not in times:
+                    times[user_id] = {
+                        (row[2], row[1])
+                        for row in (self._checkins[cid] for cid in self._user_checkins.get(user_id, ()))
+                    }
+                if (goal_id, checkin_time) in times[user_id] or self._is_archived(goal_id, day):
+                    skipped += 1
+                    continue
+                self._add_checkin(user_id, checkin_time, goal_id, day)
+                self._record_day(goal_id, day)
+                times[user_id].add((goal_id, checkin_time))
+                imported += 1
+        return imported, skipped
+
+    # ---------- 查询 ----------
+    def get_checkins(self, user_id):
+        """查询用户所有打卡记录"""
+        with self._lock:
+            return [self._row(cid) for cid in self._user_checkins.get(user_id, ())]
+
+    def get_checkin_report(self, user_id):
+        """打卡记录报告数据"""
+        today = today_key()
+        with self._lock:
+            checkins = self.get_checkins(user_id)
+            streaks = {
+                self._goals[goal_id][1]: current_streak(self._streaks[goal_id][:2], today)
+                for goal_id in self._user_goals.get(user_id, ())
+                if goal_id in self._streaks
+            }
+        return checkins, streaks
+
+    def get_goals(self, checkin_id):
+        """通过打卡记录获取目标"""
+        with self._lock:
+            if checkin_id not in self._checkins:
+                return []
+            return [self._row(checkin_id)[3]]
+
+    def get_last_goals(self, user_id):
+        """获取用户最近一次打卡（同一时间戳）的目标"""
+        with self._lock:
+            rows = [self._row(cid) for cid in self._user_checkins.get(user_id, ())]
+        if not rows:
+            return []
+        last_time = max(row[2] for row in rows)
+        return list(dict.fromkeys(row[3] for row in rows if row[2] == last_time))
+
+    def get_admin_qq(self):
+        """获取管理员QQ（基于最早打卡记录）"""
+        with self._lock:
+            if not self._checkins:
+                return '0'
+            checkin_id = min(self._checkins, key=lambda cid: (self._checkins[cid][1], cid))
+            return self._checkins[checkin_id][0]
+
+    def get_today_status(self, user_id, goals):
+        """一次查询多个目标的今日打卡状态与连续天数"""
+        today = today_key()
+        status = {}
+        with self._lock:
+            for goal in dict.fromkeys(goals):
+                row = self._streaks.get(self._goal_index.get((user_id, goal)))
+                if row is None:
+                    status[goal] = (False, 0)
+                else:
+                    status[goal] = (row[1] == today, current_streak(row[:2], today))
+        return status
+
+    def get_consecutive_days(self, user_id, goal=None):
+        """计算连续打卡天数"""
+        today = today_key()
+        with self._lock:
+            if goal:
+                row = self._streaks.get(self._goal_index.get((user_id, goal)))
+                return current_streak(row[:2] if row else None, today)
+            merged = DayBitmap()
+            for bitmap in self.get_day_bitmaps(user_id).values():
+                merged = merged | bitmap
+        return merged.streak_ending(today)
+
+    def get_recent_checkins(self, user_id, days=30):
+        """获取用户近期的打卡记录（按目标分组）"""
+        cutoff = to_epoch(datetime.now(china_tz) - timedelta(days=days))
+        with self._lock:
+            rows = [self._row(cid) for cid in self._user_checkins.get(user_id, ())]
+        goal_data = {}
+        for _, _, checkin_time, goal in sorted(rows, key=lambda row: (row[3], row[2])):
+            if checkin_time >= cutoff:
+                goal_data.setdefault(goal, []).append(checkin_time)
+        return goal_data
+
+    def iter_history(self, user_id):
+        """流式读取用户全部打卡日（先归档、后近期记录）"""
+        with self._lock:
+            items = [
+                (self._goals[goal_id][1], goal_id)
+                for goal_id in self._user_goals.get(user_id, ())
+            ]
+            history = [
+                (goal, sorted(day for entry in self._archive.get(goal_id, {}).values() for day in entry[0]),
+                 list(self._goal_days.get(goal_id, ())))
+                for goal, goal_id in items
+            ]
+        for goal, archived, _ in history:
+            for day in archived:
+                yield goal, day
+        for goal, _, recent in history:
+            for day in recent:
+                yield goal, day
+
+    def get_period_stats(self, user_id, grain, period):
+        """某日/月/年的汇总统计"""
+        with self._lock:
+            return {
+                self._goals[goal_id][1]: tuple(self._rollups[goal_id][(grain, period)])
+                for goal_id in self._user_goals.get(user_id, ())
+                if (grain, period) in self._rollups.get(goal_id, {})
+            }
+
+    def iter_export_rows(self, user_id=None):
+        """按打卡ID（单个用户按时间）分块读取"""
+        with self._lock:
+            if user_id is None:
+                checkin_ids = sorted(self._checkins)
+            else:
+                checkin_ids = sorted(self._user_checkins.get(user_id, ()), key=lambda cid: self._checkins[cid][1])
+            rows = [
+                (row[0], self._goals[row[2]][1], row[1])
+                for row in (self._checkins[cid] for cid in checkin_ids)
+            ]
+        for start in range(0, len(rows), EXPORT_CHUNK):
+            yield rows[start:start + EXPORT_CHUNK]
+
+    # ---------- 群排行 ----------
+    def join_group(self, user_id, group_id):
+        """登记群成员"""
+        with self._lock:
+            members = self._group_members.setdefault(group_id, set())
+            joined = user_id not in members
+            members.add(user_id)
+            return joined
+
+    def get_group_ranking(self, group_id, goal=None, limit=10):
+        """群内前 K 名（查询时按成员现有统计计算）"""
+        today = today_key()
+        rows = []
+        with self._lock:
+            for user_id in self._group_members.get(group_id, ()):
+                if goal:
+                    row = self._streaks.get(self._goal_index.get((user_id, goal)))
+                    stats = (row[0], row[1], row[3]) if row else None
+                else:
+                    stats = combined_stats(self.get_day_bitmaps(user_id).values())
+                if stats:
+                    rows.append((user_id, *stats))
+        streaks = [(user_id, streak) for user_id, streak, last_day, _ in rows if last_day == today]
+        totals = [(user_id, total) for user_id, _, _, total in rows]
+        return merge_top([streaks], limit), merge_top([totals], limit)
+
+    def get_group_stats(self, group_id, since_day):
+        """群内自 since_day 起的打卡统计"""
+        goals, hours = {}, [0] * 24
+        active = checkins = 0
+        with self._lock:
+            members = self._group_members.get(group_id, set())
+            for user_id in members:
+                rows = [
+                    self._checkins[cid] for cid in self._user_checkins.get(user_id, ())
+                    if self._checkins[cid][3] >= since_day
+                ]
+                if rows:
+                    active += 1
+                checkins += len(rows)
+                for goal in {self._goals[goal_id][1] for _, _, goal_id, _ in rows}:
+                    goal_members, goal_checkins = goals.get(goal, (0, 0))
+                    goals[goal] = (goal_members + 1, goal_checkins)
+                for _, checkin_time, goal_id, _ in rows:
+                    goal = self._goals[goal_id][1]
+                    goals[goal] = (goals[goal][0], goals[goal][1] + 1)
+                    hours[(checkin_time + UTC_OFFSET) % 86400 // 3600] += 1
+            return {
+                "members": len(members),
+                "active": active,
+                "checkins": checkins,
+                "goals": goals,
+                "hours": hours,
+            }
+
+    # ---------- 删除与清理 ----------
+    def delete_goals(self, user_id, goal):
+        """删除用户特定目标及相关记录"""
+        with self._lock:
+            goal_id = self._goal_index.get((user_id, goal))
+            if goal_id is None:
+                return 0
+            for checkin_id in [cid for cid in self._user_checkins.get(user_id, ())
+                               if self._checkins[cid][2] == goal_id]:
+                self._remove_checkin(checkin_id)
+            self._remove_goal(goal_id)
+            return 1
+
+    def delete_all_checkins(self, user_id):
+        """删除用户所有打卡记录（保留目标）"""
+        with self._lock:
+            checkin_ids = list(self._user_checkins.get(user_id, ()))
+            for checkin_id in checkin_ids:
+                self._remove_checkin(checkin_id)
+            for goal_id in self._user_goals.get(user_id, ()):
+                self._streaks.pop(goal_id, None)
+                self._archive.pop(goal_id, None)
+                self._rollups.pop(goal_id, None)
+            return len(checkin_ids)
+
+    def clear_database(self):
+        """清空所有数据"""
+        with self._lock:
+            self._goals = {}            # goal_id -> (user_id, goal)
+            self._goal_index = {}       # (user_id, goal) -> goal_id
+            self._user_goals = {}       # user_id -> {goal_id}
+            self._checkins = {}         # checkin_id -> (user_id, checkin_time, goal_id, day)
+            self._user_checkins = {}    # user_id -> {checkin_id}（按写入顺序）
+            self._day_checkins = {}     # day -> {checkin_id}
+            self._goal_days = {}        # goal_id -> {day: 记录数}
+            self._streaks = {}          # goal_id -> [current, last_day, longest, total]
+            self._archive = {}          # goal_id -> {YYYYMM: [{day}, 记录数]}
+            self._rollups = {}          # goal_id -> {(grain, period): [days, checkins]}
+            self._group_members = {}    # group_id -> {user_id}
+            self._next_goal_id = 1
+            self._next_checkin_id = 1
+        self._notify_reset()
+
+    def rebuild_rollups(self):
+        """从打卡记录与归档重算全部汇总"""
+        with self._lock:
+            day_counts = [
+                (goal_id, day, count)
+                for goal_id, days in self._goal_days.items()
+                for day, count in days.items()
+            ]
+            archived = [
+                (goal_id, month, sorted(entry[0]), entry[1])
+                for goal_id, months in self._archive.items()
+                for month, entry in months.items()
+            ]
+            self._rollups = {}
+            for (goal_id, grain, period), row in build_rollups(day_counts, archived).items():
+                self._rollups.setdefault(goal_id, {})[(grain, period)] = row
+
+    def purge_checkins_chunk(self, cutoff_day, limit=500, archive=True):
+        """移出一批早于 cutoff_day 的打卡记录（默认并入归档），并清理因此失去记录的目标"""
+        with self._lock:
+            expired = []
+            for day in sorted(d for d in self._day_checkins if d < cutoff_day):
+                expired.extend(self._day_checkins[day])
+                if len(expired) >= limit:
+                    break
+            expired = expired[:limit]
+            goal_ids = set()
+            for checkin_id in expired:
+                day = self._checkins[checkin_id][3]
+                goal_id = self._remove_checkin(checkin_id)
+                goal_ids.add(goal_id)
+                if archive:
+                    entry = self._archive.setdefault(goal_id, {}).setdefault(month_of(day), [set(), 0])
+                    entry[0].add(day)
+                    entry[1] += 1
+                else:
+                    self._rollup_remove(goal_id, day)
+            for goal_id in goal_ids:
+                if not self._goal_days.get(goal_id) and not self._archive.get(goal_id):
+                    self._remove_goal(goal_id)
+            return len(expired)
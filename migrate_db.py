@@ -1,195 +1,419 @@
 """
-数据库迁移工具 - 将旧版打卡数据库迁移到新版结构
+数据库迁移工具 - 将旧版（v1.21 以前）打卡数据库迁移到新版结构
 版本说明：
-- 旧数据库结构：
-  checkins表 (id, user_id, checkin_time)
+- 旧数据库结构（database.py）：
+  checkins表 (id, user_id, checkin_time)  checkin_time 为 UTC+8 时间文本
   goals表 (id, checkin_id, goal)
   关系：一个checkin记录对应多个goal
-- 新数据库结构：
+- 新数据库结构：按 migrations 建到最新版本
   goals表 (id, user_id, goal) - 存储用户的所有目标
-  checkins表 (id, user_id, checkin_time, goal_id) - 每个打卡记录关联一个目标
-功能说明：
-1. 自动备份原始数据库
-2. 创建新的数据结构
-3. 迁移所有数据：
-   - 将原goals表中的每个(goal,user_id)组合转为唯一goal记录
-   - 为原checkins表中的每个goal创建对应的新打卡记录
-4. 验证数据完整性
-5. 提供替换原数据库选项
-使用步骤：
-1. 将本脚本放在与旧数据库(checkin.db)相同目录
-2. 运行脚本: python migrate_script.py
-3. 根据提示操作
+  checkins表 (id, user_id, checkin_time, goal_id, day) - 每个打卡记录关联一个目标，时间为 Unix 时间戳
+  以及连续统计、汇总、位图等派生表（迁移完成后一次性重建）
+迁移过程：
+1. 以 SQLite 备份 API 备份旧数据库（checkin_backup.db）
+2. 一条 INSERT ... SELECT 创建全部 (user_id, goal) 目标
+3. 按旧 goals 表行号顺序分块读取（fetchmany），每块一次 executemany 写入并提交；
+   检查点（已迁移到的行号）与该块在同一事务中提交，中断后重新运行即从检查点继续
+4. 重建派生表，按用户核对旧库与新库的打卡记录数
+5. 核对通过后按参数或提示替换旧数据库
+插件启动时发现旧版结构会自动在后台完成上述步骤（见 legacy.py），通常无需手动运行。
+手动迁移时在插件目录的上一级运行（需停止插件）：
+    python -m DailyGoalsTracker.migrate_db                  # 交互式，完成后询问是否替换
+    python -m DailyGoalsTracker.migrate_db --yes            # 非交互，核对通过后直接替换
+    python -m DailyGoalsTracker.migrate_db --keep           # 非交互，保留新旧两个数据库
+命令行参数(可选):
+--old-db - 指定旧数据库路径(默认 data_dir/checkin.db)
+--new-db - 指定新数据库路径(默认 data_dir/checkin_new.db)
+--batch-size - 每块读取的行数
 注意事项：
-- 迁移前会自动创建备份(checkin_backup.db)
+- 无法解析的打卡时间不会写入 checkins，而是记录在新库的 legacy_invalid 表中并在结果中报告
 - 如迁移失败，可从备份恢复
-- 建议在测试环境先运行确认无误后再在生产环境使用
-命令行参数(可选):
---old-db - 指定旧数据库路径(默认./checkin.db)
---new-db - 指定新数据库路径(默认./checkin_new.db)
 """
-import sqlite3
 import os
-import shutil
-from datetime import datetime
-
-def migrate_database(old_db_path, new_db_path):
-    """迁移数据库从旧结构到新结构"""
-    
-    # 创建新数据库并初始化表结构
-    new_conn = sqlite3.connect(new_db_path)
-    new_c = new_conn.cursor()
-    
-    # 创建新表结构（修正后的版本）
-    new_c.execute('''
-        CREATE TABLE IF NOT EXISTS goals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            goal TEXT NOT NULL,
-            UNIQUE(user_id, goal)
+import sys
+import time
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+
+from .migrations import run_migrations, create_invalid_table
+from .streaks import rebuild_streaks
+from .rollups import rebuild_rollups
+from .bitmaps import rebuild_bitmaps
+from .storage import DATA_DIR, UTC_OFFSET, epoch_day, parse_checkin_time, to_epoch
+
+# 每块读取与写入的行数
+BATCH_SIZE = 20000
+# 进度输出间隔（秒）
+PROGRESS_INTERVAL = 2.0
+
+# 旧库：按 goals 行号顺序与打卡记录关联（主键查找，无需排序）
+SQL_LEGACY_ROWS = '''
+    SELECT g.id, c.user_id, c.checkin_time, g.goal
+    FROM goals g
+    JOIN checkins c ON c.id = g.checkin_id
+    WHERE g.id > ?
+    ORDER BY g.id
+'''
+
+# 目标按首次出现的顺序创建
+SQL_LEGACY_GOALS = '''
+    INSERT OR IGNORE INTO main.goals (user_id, goal)
+    SELECT c.user_id, g.goal
+    FROM legacy.goals g
+    JOIN legacy.checkins c ON c.id = g.checkin_id
+    GROUP BY c.user_id, g.goal
+    ORDER BY MIN(g.id)
+'''
+
+SQL_LEGACY_USER_COUNTS = '''
+    SELECT c.user_id, COUNT(*)
+    FROM goals g
+    JOIN checkins c ON c.id = g.checkin_id
+    GROUP BY c.user_id
+'''
+
+
+def is_legacy_schema(conn):
+    """数据库是否为旧版结构（goals 表含 checkin_id 列）"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(goals)")]
+    return 'checkin_id' in columns
+
+
+def _connect_legacy(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"旧数据库不存在: {path}")
+    conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    if not is_legacy_schema(conn):
+        conn.close()
+        raise ValueError(f"不是旧版结构的数据库（可能已经迁移过）: {path}")
+    return conn
+
+
+def _create_checkpoint_table(c):
+    """迁移检查点（单行）与无法解析的记录"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS legacy_migration (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            source TEXT NOT NULL,
+            source_rows INTEGER NOT NULL,
+            last_row INTEGER NOT NULL,
+            migrated INTEGER NOT NULL,
+            finished INTEGER NOT NULL
         )
     ''')
-    
-    new_c.execute('''
-        CREATE TABLE IF NOT EXISTS checkins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            checkin_time DATETIME NOT NULL,
-            goal_id INTEGER NOT NULL,
-            FOREIGN KEY (goal_id) REFERENCES goals(id)
+    create_invalid_table(c)
+
+
+def _open_target(path, source, source_rows):
+    """打开（或创建）新数据库，返回 (连接, 检查点)
+
+    检查点为 (last_row, migrated, finished)；新建时为 (0, 0, 0)。
+    插件在线升级时旧库仍在追加记录，续传时只核对来源路径并更新行数。
+    """
+    exists = os.path.exists(path)
+    conn = sqlite3.connect(path)
+    if exists:
+        has_checkpoint = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'legacy_migration'"
+        ).fetchone()
+        if not has_checkpoint:
+            conn.close()
+            raise FileExistsError(f"新数据库已存在且不是可续传的迁移结果（请先移走）: {path}")
+    # 批量写入：WAL + NORMAL 同步仍保证已提交的检查点不丢失
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    run_migrations(conn)
+    c = conn.cursor()
+    _create_checkpoint_table(c)
+    row = c.execute(
+        "SELECT source, source_rows, last_row, migrated, finished FROM legacy_migration"
+    ).fetchone()
+    if row is None:
+        c.execute(
+            "INSERT INTO legacy_migration VALUES (1, ?, ?, 0, 0, 0)", (source, source_rows)
         )
-    ''')
-    
-    # 连接到旧数据库
-    old_conn = sqlite3.connect(old_db_path)
-    old_c = old_conn.cursor()
-    
+        conn.commit()
+        return conn, (0, 0, 0)
+    if row[0] != source:
+        conn.close()
+        raise ValueError(f"新数据库的检查点来自另一个旧库（{row[0]}），请先移走: {path}")
+    if row[1] != source_rows:
+        c.execute("UPDATE legacy_migration SET source_rows = ?", (source_rows,))
+        conn.commit()
+    return conn, row[2:]
+
+
+def _checkin_indexes():
+    """最新结构中 checkins 表的二级索引 [(名称, 建索引语句), ...]（取自内存中新建的空库）"""
+    conn = sqlite3.connect(":memory:")
+    try:
+        run_migrations(conn)
+        return conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'checkins' AND sql IS NOT NULL"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def parse_legacy_time(text):
+    """旧版 UTC+8 时间文本 -> 时间戳（无法解析返回 None）"""
+    try:
+        naive = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        try:
+            return to_epoch(parse_checkin_time(text))
+        except (TypeError, ValueError):
+            return None
+    if naive.tzinfo is not None:
+        return int(naive.timestamp())
+    return int(naive.replace(tzinfo=timezone.utc).timestamp()) - UTC_OFFSET
+
+
+def migrate_database(old_db_path, new_db_path, batch_size=BATCH_SIZE, progress=None, finish=True):
+    """迁移数据库从旧结构到新结构（可中断，重新调用即从检查点继续）
+
+    Args:
+        progress: 进度回调 progress(已处理行数, 旧库总行数, 已用秒数)，每块调用一次
+        finish: 为 False 时只复制记录，不重建索引与派生表（旧库仍在写入时先复制大部分，
+                之后再调用一次补齐并完成）
+
+    Returns:
+        dict: {"goals", "checkins", "invalid", "resumed_from", "finished_before", "elapsed", "rate"}
+    """
+    start = time.perf_counter()
+    source = os.path.abspath(old_db_path)
+    old_conn = _connect_legacy(old_db_path)
+    source_rows = old_conn.execute("SELECT COUNT(*) FROM goals").fetchone()[0]
+    new_conn, (last_row, migrated, finished) = _open_target(new_db_path, source, source_rows)
+    resumed_from = last_row
+    processed = 0
     try:
-        # 第一步：处理目标数据
-        goal_cache = {}  # 缓存格式: (user_id, goal) -> new_goal_id
-        
-        # 获取所有旧的目标数据（需要关联checkins表获取user_id）
-        old_c.execute('''
-            SELECT g.goal, c.user_id 
-            FROM goals g
-            INNER JOIN checkins c ON g.checkin_id = c.id
-            ORDER BY c.id
-        ''')
-        
-        for goal, user_id in old_c.fetchall():
-            # 检查是否已存在该目标
-            cache_key = (user_id, goal)
-            if cache_key not in goal_cache:
-                new_c.execute(
-                    "SELECT id FROM goals WHERE user_id = ? AND goal = ?",
-                    (user_id, goal)
+        c = new_conn.cursor()
+        if not finished:
+            # 批量写入期间去掉 checkins 的二级索引，写完后一次性重建
+            indexes = _checkin_indexes()
+            for name, _ in indexes:
+                c.execute(f"DROP INDEX IF EXISTS {name}")
+            # 目标：一条语句创建（续传时已有的目标忽略）
+            c.execute("ATTACH DATABASE ? AS legacy", (f"file:{source}?mode=ro",))
+            c.execute("BEGIN IMMEDIATE")
+            c.execute(SQL_LEGACY_GOALS)
+            new_conn.commit()
+            c.execute("DETACH DATABASE legacy")
+            goal_ids = {(user_id, goal): goal_id for goal_id, user_id, goal in c.execute(
+                "SELECT id, user_id, goal FROM goals"
+            )}
+
+            if last_row:
+                processed = old_conn.execute(
+                    "SELECT COUNT(*) FROM goals WHERE id <= ?", (last_row,)
+                ).fetchone()[0]
+            rows = old_conn.execute(SQL_LEGACY_ROWS, (last_row,))
+            while True:
+                batch = rows.fetchmany(batch_size)
+                if not batch:
+                    break
+                checkins, invalid = [], []
+                times = {}  # 同一次打卡的多个目标时间相同
+                for row_id, user_id, checkin_time, goal in batch:
+                    if checkin_time not in times:
+                        times[checkin_time] = parse_legacy_time(checkin_time)
+                    ts = times[checkin_time]
+                    if ts is None:
+                        invalid.append((row_id, user_id, checkin_time, goal))
+                    else:
+                        checkins.append((user_id, ts, (user_id, goal), epoch_day(ts)))
+                last_row = batch[-1][0]
+                migrated += len(checkins)
+                c.execute("BEGIN IMMEDIATE")
+                # 旧库仍在写入时（插件在线升级），创建目标之后追加的记录可能带有新目标
+                for key in {row[2] for row in checkins} - goal_ids.keys():
+                    c.execute("INSERT OR IGNORE INTO goals (user_id, goal) VALUES (?, ?)", key)
+                    goal_ids[key] = c.execute(
+                        "SELECT id FROM goals WHERE user_id = ? AND goal = ?", key
+                    ).fetchone()[0]
+                checkins = [(user_id, ts, goal_ids[key], day) for user_id, ts, key, day in checkins]
+                c.executemany(
+                    "INSERT INTO checkins (user_id, checkin_time, goal_id, day) VALUES (?, ?, ?, ?)",
+                    checkins
                 )
-                existing = new_c.fetchone()
-                
-                if existing:
-                    goal_cache[cache_key] = existing[0]
-                else:
-                    new_c.execute(
-                        "INSERT INTO goals (user_id, goal) VALUES (?, ?)",
-                        (user_id, goal)
-                    )
-                    goal_cache[cache_key] = new_c.lastrowid
-        
-        # 第二步：处理打卡记录
-        old_c.execute('''
-            SELECT c.id, c.user_id, c.checkin_time, g.goal
-            FROM checkins c
-            INNER JOIN goals g ON c.id = g.checkin_id
-            ORDER BY c.id
-        ''')
-        
-        # 用于跟踪已迁移的原始checkin_id
-        migrated_checkins = set()
-        
-        for old_checkin_id, user_id, checkin_time, goal in old_c.fetchall():
-            # 获取对应的新goal_id
-            goal_id = goal_cache[(user_id, goal)]
-            
-            # 插入新的打卡记录（每个目标生成一条记录）
-            new_c.execute(
-                "INSERT INTO checkins (user_id, checkin_time, goal_id) VALUES (?, ?, ?)",
-                (user_id, checkin_time, goal_id)
-            )
-            migrated_checkins.add(old_checkin_id)
-        
-        # 验证是否所有打卡记录都已处理
-        old_c.execute("SELECT COUNT(DISTINCT id) FROM checkins")
-        original_count = old_c.fetchone()[0]
-        if len(migrated_checkins) != original_count:
-            print(f"警告: 原始打卡记录{original_count}条，迁移后{len(migrated_checkins)}条")
-        
-        new_conn.commit()
-        print(f"数据库迁移成功! 新数据库已保存到: {new_db_path}")
-        
-    except sqlite3.Error as e:
-        print(f"迁移过程中发生数据库错误: {str(e)}")
-        new_conn.rollback()
+                c.executemany(
+                    "INSERT OR REPLACE INTO legacy_invalid VALUES (?, ?, ?, ?)", invalid
+                )
+                c.execute(
+                    "UPDATE legacy_migration SET last_row = ?, migrated = ?", (last_row, migrated)
+                )
+                new_conn.commit()
+                processed += len(batch)
+                if progress:
+                    progress(processed, source_rows, time.perf_counter() - start)
+
+        if not finished and finish:
+            # 索引与派生表一次性重建
+            c.execute("BEGIN IMMEDIATE")
+            for _, sql in indexes:
+                c.execute(sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+            rebuild_streaks(c)
+            rebuild_rollups(c)
+            rebuild_bitmaps(c)
+            c.execute("UPDATE legacy_migration SET finished = 1")
+            new_conn.commit()
+        if finish:
+            # 恢复为回滚日志模式，新库可以单文件复制或替换（插件打开时会重新启用 WAL）
+            new_conn.execute("PRAGMA journal_mode=DELETE")
+        goals, checkins, invalid = (
+            new_conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('goals', 'checkins', 'legacy_invalid')
+        )
+    except BaseException:
+        if new_conn.in_transaction:
+            new_conn.rollback()
         raise
     finally:
         new_conn.close()
         old_conn.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "goals": goals,
+        "checkins": checkins,
+        "invalid": invalid,
+        "resumed_from": resumed_from,
+        "finished_before": bool(finished),
+        "elapsed": elapsed,
+        "rate": processed / elapsed if elapsed else 0,
+    }
 
-def main():
-    # 路径配置
-    # BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    BASE_DIR = "data/plugins/DailyGoalsTracker"
-    OLD_DB_PATH = os.path.join(BASE_DIR, "checkin.db")
-    NEW_DB_PATH = os.path.join(BASE_DIR, "checkin_new.db")
-    BACKUP_PATH = os.path.join(BASE_DIR, "checkin_backup.db")
-    
-    # 备份旧数据库
+
+def verify_migration(old_db_path, new_db_path):
+    """按用户核对打卡记录数（旧库 = 新库 + 无法解析），并检查外键与完整性
+
+    Returns:
+        list: 问题描述，空列表表示核对通过
+    """
+    old_conn = _connect_legacy(old_db_path)
+    new_conn = sqlite3.connect(f"file:{os.path.abspath(new_db_path)}?mode=ro", uri=True)
+    try:
+        expected = dict(old_conn.execute(SQL_LEGACY_USER_COUNTS))
+        actual = dict(new_conn.execute("SELECT user_id, COUNT(*) FROM checkins GROUP BY user_id"))
+        for user_id, count in new_conn.execute(
+            "SELECT user_id, COUNT(*) FROM legacy_invalid GROUP BY user_id"
+        ):
+            actual[user_id] = actual.get(user_id, 0) + count
+        problems = [
+            f"用户 {user_id}: 旧库 {expected.get(user_id, 0)} 条，新库 {actual.get(user_id, 0)} 条"
+            for user_id in sorted(set(expected) | set(actual))
+            if expected.get(user_id, 0) != actual.get(user_id, 0)
+        ]
+        old_goals = old_conn.execute('''
+            SELECT COUNT(*) FROM (
+                SELECT DISTINCT c.user_id, g.goal
+                FROM goals g JOIN checkins c ON c.id = g.checkin_id
+            )
+        ''').fetchone()[0]
+        new_goals = new_conn.execute("SELECT COUNT(*) FROM goals").fetchone()[0]
+        if old_goals != new_goals:
+            problems.append(f"目标数不一致: 旧库 {old_goals}，新库 {new_goals}")
+        for table, rowid, parent, _ in new_conn.execute("PRAGMA foreign_key_check"):
+            problems.append(f"表 {table} 行 {rowid} 引用了不存在的 {parent}")
+        result = new_conn.execute("PRAGMA quick_check").fetchone()[0]
+        if result != 'ok':
+            problems.append(f"完整性检查失败: {result}")
+        return problems
+    finally:
+        new_conn.close()
+        old_conn.close()
+
+
+def backup_legacy(old_db_path, backup_path):
+    """以 SQLite 备份 API 复制旧数据库（已存在的备份保留不动，续传时不会覆盖）"""
+    if os.path.exists(backup_path):
+        return False
+    src = sqlite3.connect(f"file:{os.path.abspath(old_db_path)}?mode=ro", uri=True)
+    dst = sqlite3.connect(backup_path)
     try:
-        if os.path.exists(OLD_DB_PATH):
-            shutil.copy2(OLD_DB_PATH, BACKUP_PATH)
-            print(f"已创建数据库备份: {BACKUP_PATH}")
-        else:
-            print(f"错误: 旧数据库不存在 {OLD_DB_PATH}")
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return True
+
+
+def _print_progress():
+    """每 PROGRESS_INTERVAL 秒输出一次进度与速度"""
+    last = [0.0]
+
+    def report(done, total, elapsed):
+        if elapsed - last[0] < PROGRESS_INTERVAL and done < total:
             return
-    except Exception as e:
-        print(f"备份失败: {str(e)}")
-        return
-    
-    # 执行迁移
+        last[0] = elapsed
+        rate = done / elapsed if elapsed else 0
+        remaining = (total - done) / rate if rate else 0
+        percent = done * 100 / total if total else 100
+        print(f"已处理 {done}/{total} 行（{percent:.1f}%），{rate:.0f} 行/秒，预计剩余 {remaining:.0f} 秒")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DailyGoalsTracker 旧版数据库迁移（需停止插件）")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="数据目录")
+    parser.add_argument("--old-db", help="旧数据库路径（默认 data_dir/checkin.db）")
+    parser.add_argument("--new-db", help="新数据库路径（默认 data_dir/checkin_new.db）")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    choice = parser.add_mutually_exclusive_group()
+    choice.add_argument("-y", "--yes", action="store_true", help="核对通过后直接替换旧数据库")
+    choice.add_argument("--keep", action="store_true", help="保留新旧两个数据库，不询问")
+    args = parser.parse_args()
+
+    old_db_path = args.old_db or os.path.join(args.data_dir, "checkin.db")
+    new_db_path = args.new_db or os.path.join(args.data_dir, "checkin_new.db")
+    backup_path = os.path.join(os.path.dirname(old_db_path) or '.', "checkin_backup.db")
+
     try:
-        migrate_database(OLD_DB_PATH, NEW_DB_PATH)
-        
-        # 验证迁移结果
-        with sqlite3.connect(NEW_DB_PATH) as conn:
-            c = conn.cursor()
-            
-            # 检查目标表
-            c.execute("SELECT COUNT(*) FROM goals")
-            print(f"新数据库目标数量: {c.fetchone()[0]}")
-            
-            # 检查打卡记录表
-            c.execute("SELECT COUNT(DISTINCT user_id, checkin_time) FROM checkins")
-            print(f"唯一打卡记录数量: {c.fetchone()[0]}")
-            
-            # 检查外键约束
-            c.execute("PRAGMA foreign_key_check")
-            issues = c.fetchall()
-            if issues:
-                print("发现外键约束问题:")
-                for table, rowid, parent, fkid in issues:
-                    print(f"表 {table} 行 {rowid} 引用了不存在的 {parent}.{fkid}")
-            else:
-                print("外键约束检查通过")
-                
-        # 用户确认替换
-        if input("是否替换旧数据库？(y/n): ").lower() == 'y':
-            os.replace(NEW_DB_PATH, OLD_DB_PATH)
-            print("已成功替换旧数据库")
-        else:
-            print("保留新旧两个数据库")
-            
+        if backup_legacy(old_db_path, backup_path):
+            print(f"已创建数据库备份: {backup_path}")
+        result = migrate_database(old_db_path, new_db_path, args.batch_size, _print_progress())
+    except KeyboardInterrupt:
+        print("\n⏸️ 迁移已中断，已提交的部分保存在新数据库中，重新运行即可继续")
+        sys.exit(130)
     except Exception as e:
-        print(f"迁移失败: {str(e)}")
-        print(f"请检查备份文件: {BACKUP_PATH}")
+        print(f"❌ 迁移失败: {e}")
+        print(f"请检查备份文件: {backup_path}")
+        sys.exit(1)
+
+    if result["finished_before"]:
+        resumed = "（此前已完成，本次只做核对）"
+    elif result["resumed_from"]:
+        resumed = f"（从旧库第 {result['resumed_from']} 行继续）"
+    else:
+        resumed = ""
+    print(
+        f"✅ 迁移完成{resumed}：目标 {result['goals']}，打卡记录 {result['checkins']}，"
+        f"用时 {result['elapsed']:.1f}秒（{result['rate']:.0f} 行/秒）"
+    )
+    if result["invalid"]:
+        print(f"⚠️ {result['invalid']} 条记录的时间无法解析，已保存在新数据库的 legacy_invalid 表中")
+
+    problems = verify_migration(old_db_path, new_db_path)
+    if problems:
+        print("❌ 核对未通过，保留新旧两个数据库：\n" + "\n".join(problems[:20]))
+        sys.exit(1)
+    print("✅ 核对通过：各用户打卡记录数、目标数一致，外键与完整性检查通过")
+
+    if args.yes:
+        replace = True
+    elif args.keep or not sys.stdin.isatty():
+        replace = False
+    else:
+        replace = input("是否替换旧数据库？(y/n): ").lower() == 'y'
+    if replace:
+        os.replace(new_db_path, old_db_path)
+        print("已成功替换旧数据库")
+    else:
+        print(f"保留新旧两个数据库，新数据库: {new_db_path}")
+
 
 if __name__ == "__main__":
     main()
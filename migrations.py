@@ -0,0 +1,295 @@
+"""
+数据库结构迁移
+- 以 PRAGMA user_version 记录当前结构版本
+- 每个迁移步骤注册一个版本号，init_db 时按顺序执行尚未应用的步骤
+- 每个步骤在独立事务中执行，成功后写入新版本号
+"""
+from .streaks import create_streak_table, rebuild_streaks
+from .archive import create_archive_table
+from .rollups import create_rollup_table, rebuild_rollups
+from .bitmaps import create_bitmap_table, rebuild_bitmaps
+from .rankings import create_group_tables
+
+# 迁移注册表：版本号 -> 迁移函数
+MIGRATIONS = {}
+
+
+def migration(version):
+    """注册迁移步骤"""
+    def decorator(func):
+        if version in MIGRATIONS:
+            raise ValueError(f"迁移版本重复: {version}")
+        MIGRATIONS[version] = func
+        return func
+    return decorator
+
+
+def latest_version():
+    """当前代码支持的最新结构版本"""
+    return max(MIGRATIONS)
+
+
+def create_invalid_table(c):
+    """时间无法解析的旧打卡记录（迁移时移出 checkins，保留原文便于人工核对）"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS legacy_invalid (
+            legacy_row INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            checkin_time TEXT,
+            goal TEXT NOT NULL
+        )
+    ''')
+
+
+def create_utc_rows_table(c):
+    """可能以 UTC 时间文本存储的旧补打卡记录（迁移时按本地时间处理，待管理员确认校正）"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS legacy_utc_rows (
+            checkin_id INTEGER PRIMARY KEY
+        )
+    ''')
+
+
+def _table_count(conn, table):
+    """表中的记录数（表不存在为0）"""
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone():
+        return 0
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def invalid_checkin_count(conn):
+    """legacy_invalid 中的记录数（表不存在为0）"""
+    return _table_count(conn, 'legacy_invalid')
+
+
+def legacy_utc_count(conn):
+    """legacy_utc_rows 中尚未校正、且记录仍在 checkins 中的条数"""
+    if not _table_count(conn, 'legacy_utc_rows'):
+        return 0
+    return conn.execute(
+        "SELECT COUNT(*) FROM legacy_utc_rows l JOIN checkins c ON c.id = l.checkin_id"
+    ).fetchone()[0]
+
+
+def get_schema_version(conn):
+    """读取数据库结构版本"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn):
+    """执行所有未应用的迁移
+
+    Returns:
+        list: 本次应用的版本号
+    """
+    current = get_schema_version(conn)
+    applied = []
+    for version in sorted(v for v in MIGRATIONS if v > current):
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            # 加写锁后再确认版本，避免多个进程重复迁移
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            MIGRATIONS[version](c)
+            c.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def check_query_plans(conn, queries):
+    """检查热点查询是否全部走索引
+
+    Args:
+        queries (dict): 查询名称 -> SQL
+
+    Returns:
+        list: (查询名称, 执行计划明细) 未使用索引的步骤
+    """
+    problems = []
+    for name, sql in queries.items():
+        params = [None] * sql.count('?')
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[-1]
+            if detail.startswith('SCAN'):
+                problems.append((name, detail))
+    return problems
+
+
+@migration(1)
+def _create_base_tables(c):
+    """基础表结构"""
+    # 创建目标表（新增UNIQUE约束）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            goal TEXT NOT NULL,
+            UNIQUE(user_id, goal)
+        )
+    ''')
+
+    # 创建打卡记录表（新增goal_id外键）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS checkins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            checkin_time DATETIME NOT NULL,
+            goal_id INTEGER NOT NULL,
+            FOREIGN KEY (goal_id) REFERENCES goals(id)
+        )
+    ''')
+
+
+@migration(2)
+def _add_checkin_indexes(c):
+    """打卡记录覆盖索引"""
+    # 按用户+目标查询（今日状态、连续天数）
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkins_user_goal_time
+        ON checkins(user_id, goal_id, checkin_time)
+    ''')
+    # 按目标查询（删除目标、清理孤立目标）
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkins_goal_time
+        ON checkins(goal_id, checkin_time)
+    ''')
+    # 按用户时间范围查询（近期记录、最近一次打卡）
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkins_user_time
+        ON checkins(user_id, checkin_time)
+    ''')
+
+
+@migration(3)
+def _add_checkin_day(c):
+    """物化打卡日期（UTC+8 自然日，距1970-01-01的天数）
+
+    此前的补打卡存储 UTC 时间文本，打卡存储 UTC+8 本地时间文本，两者格式相同，
+    无法可靠区分，因此全部按本地时间取日期回填（补打卡记录可能早一天）。
+    可能是旧补打卡的记录（秒为 00，打卡时刻恰好整分的记录也会列入）登记到
+    legacy_utc_rows，由管理员确认后校正（见 DatabaseManager.correct_legacy_supplements）。
+    """
+    c.execute("ALTER TABLE checkins ADD COLUMN day INTEGER")
+    create_utc_rows_table(c)
+    c.execute('''
+        INSERT OR IGNORE INTO legacy_utc_rows (checkin_id)
+        SELECT id FROM checkins
+        WHERE typeof(checkin_time) = 'text' AND length(checkin_time) = 19
+        AND substr(checkin_time, 18) = '00'
+    ''')
+    # 历史记录按存储的本地时间取日期回填
+    c.execute('''
+        UPDATE checkins
+        SET day = CAST(julianday(DATE(checkin_time)) - julianday('1970-01-01') AS INTEGER)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkins_goal_day
+        ON checkins(goal_id, day)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkins_user_day
+        ON checkins(user_id, day)
+    ''')
+
+
+@migration(4)
+def _add_goal_streaks(c):
+    """连续打卡统计表（按历史记录回填）"""
+    create_streak_table(c)
+    rebuild_streaks(c)
+
+
+@migration(5)
+def _add_checkin_day_index(c):
+    """按日期批量清理旧记录的索引"""
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkins_day
+        ON checkins(day)
+    ''')
+
+
+@migration(6)
+def _checkin_time_to_epoch(c):
+    """打卡时间改为整数（Unix 时间戳，秒）
+
+    文本时间按 UTC+8 本地时间处理（strftime('%s') 按 UTC 解析，再减去 8 小时），
+    日序号按 UTC+8 重新计算。迁移 3 之前的补打卡实际存储的是 UTC 文本，
+    转换后早 8 小时；这些记录无法可靠识别，候选记录保留在 legacy_utc_rows 中，
+    由管理员确认后校正，默认不改动。
+    无法解析的时间（此时 day 同样为空）移入 legacy_invalid，不阻止迁移。
+    """
+    c.execute('''
+        CREATE TABLE checkins_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            checkin_time INTEGER NOT NULL,
+            goal_id INTEGER NOT NULL,
+            day INTEGER,
+            FOREIGN KEY (goal_id) REFERENCES goals(id)
+        )
+    ''')
+    create_invalid_table(c)
+    c.execute('''
+        INSERT OR REPLACE INTO legacy_invalid (legacy_row, user_id, checkin_time, goal)
+        SELECT c.id, c.user_id, c.checkin_time, COALESCE(g.goal, '')
+        FROM checkins c
+        LEFT JOIN goals g ON g.id = c.goal_id
+        WHERE typeof(c.checkin_time) != 'integer' AND strftime('%s', c.checkin_time) IS NULL
+    ''')
+    c.execute('''
+        INSERT INTO checkins_new (id, user_id, checkin_time, goal_id, day)
+        SELECT id, user_id,
+               CASE WHEN typeof(checkin_time) = 'integer' THEN checkin_time
+                    ELSE CAST(strftime('%s', checkin_time) AS INTEGER) - 28800 END,
+               goal_id, day
+        FROM checkins
+        WHERE typeof(checkin_time) = 'integer' OR strftime('%s', checkin_time) IS NOT NULL
+    ''')
+    c.execute("UPDATE checkins_new SET day = (checkin_time + 28800) / 86400")
+    c.execute("DROP TABLE checkins")
+    c.execute("ALTER TABLE checkins_new RENAME TO checkins")
+
+    # 重建索引（整数时间戳使索引更紧凑）
+    for name, columns in (
+        ('idx_checkins_user_goal_time', 'user_id, goal_id, checkin_time'),
+        ('idx_checkins_goal_time', 'goal_id, checkin_time'),
+        ('idx_checkins_user_time', 'user_id, checkin_time'),
+        ('idx_checkins_goal_day', 'goal_id, day'),
+        ('idx_checkins_user_day', 'user_id, day'),
+        ('idx_checkins_day', 'day'),
+    ):
+        c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON checkins({columns})")
+
+
+@migration(7)
+def _add_checkin_archive(c):
+    """历史打卡归档表"""
+    create_archive_table(c)
+
+
+@migration(8)
+def _add_checkin_rollups(c):
+    """日/月/年汇总表（按打卡记录与归档回填）"""
+    create_rollup_table(c)
+    rebuild_rollups(c)
+
+
+@migration(9)
+def _add_goal_bitmaps(c):
+    """目标打卡日位图（按打卡记录与归档回填）"""
+    create_bitmap_table(c)
+    rebuild_bitmaps(c)
+
+
+@migration(10)
+def _add_group_rankings(c):
+    """群成员与排行表（成员在群内使用命令时登记）"""
+    create_group_tables(c)
@@ -0,0 +1,138 @@
+"""
+群打卡排行（group_members / group_rankings）
+- group_members: 群与成员的关联，成员在群内发送打卡命令时登记
+- group_rankings: 每个群、每个目标、每个成员一行的当前连续天数与累计天数，
+  goal 为空字符串的行是成员按任一目标合计的统计
+- 打卡、补打卡时在同一事务内刷新该成员所在各群的行；未加入任何群的用户只多一次索引查找
+- 排行榜按 (group_id, goal, last_day, current_streak) 与 (group_id, goal, total_days)
+  索引倒序读取前 K 名，不扫描成员
+"""
+from .bitmaps import SQL_USER_BITMAPS, DayBitmap
+
+# 成员按任一目标合计的排行使用的目标名
+ALL_GOALS = ''
+
+SQL_GROUP_TOP_STREAKS = '''
+    SELECT user_id, current_streak FROM group_rankings
+    WHERE group_id = ? AND goal = ? AND last_day = ?
+    ORDER BY current_streak DESC
+    LIMIT ?
+'''
+
+SQL_GROUP_TOP_TOTALS = '''
+    SELECT user_id, total_days FROM group_rankings
+    WHERE group_id = ? AND goal = ?
+    ORDER BY total_days DESC
+    LIMIT ?
+'''
+
+SQL_USER_GROUPS = "SELECT group_id FROM group_members WHERE user_id = ?"
+
+SQL_REFRESH_GOAL_RANKINGS = '''
+    INSERT OR REPLACE INTO group_rankings
+        (group_id, goal, user_id, current_streak, last_day, total_days)
+    SELECT m.group_id, g.goal, g.user_id, s.current_streak, s.last_day, s.total_days
+    FROM group_members m
+    JOIN goals g ON g.user_id = m.user_id
+    JOIN goal_streaks s ON s.goal_id = g.id
+    WHERE m.user_id = ? {where}
+'''
+
+
+def create_group_tables(c):
+    """创建群成员与排行表"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS group_members (
+            group_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            PRIMARY KEY (group_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_group_members_user
+        ON group_members(user_id)
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS group_rankings (
+            group_id TEXT NOT NULL,
+            goal TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            current_streak INTEGER NOT NULL,
+            last_day INTEGER NOT NULL,
+            total_days INTEGER NOT NULL,
+            PRIMARY KEY (group_id, goal, user_id)
+        ) WITHOUT ROWID
+    ''')
+    # 前 K 名索引
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_group_rankings_streak
+        ON group_rankings(group_id, goal, last_day, current_streak)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_group_rankings_total
+        ON group_rankings(group_id, goal, total_days)
+    ''')
+    # 删除目标时按成员查找
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_group_rankings_user
+        ON group_rankings(user_id, goal)
+    ''')
+
+
+def combined_stats(bitmaps):
+    """各目标位图 -> 按任一目标合计的 (连续天数, 最近打卡日, 累计天数)，无记录为 None"""
+    merged = DayBitmap()
+    for bitmap in bitmaps:
+        merged = merged | bitmap
+    if not merged:
+        return None
+    last_day = merged.last_day()
+    return merged.streak_ending(last_day), last_day, merged.count()
+
+
+def refresh_rankings(c, user_id, goal_ids=None):
+    """刷新成员在所在各群的排行行（需在写入打卡的同一事务中、位图与统计更新之后调用）
+
+    Args:
+        goal_ids: 需要刷新的目标ID，None 表示成员的全部目标
+    """
+    groups = [row[0] for row in c.execute(SQL_USER_GROUPS, (user_id,))]
+    if not groups:
+        return
+    params = [user_id]
+    where = ''
+    if goal_ids is not None:
+        goal_ids = list(goal_ids)
+        where = "AND g.id IN ({})".format(','.join('?' * len(goal_ids)))
+        params += goal_ids
+    c.execute(SQL_REFRESH_GOAL_RANKINGS.format(where=where), params)
+
+    stats = combined_stats(
+        DayBitmap.from_blob(base_day, bits)
+        for _, base_day, bits in c.execute(SQL_USER_BITMAPS, (user_id,)).fetchall()
+    )
+    if stats is None:
+        c.execute("DELETE FROM group_rankings WHERE user_id = ? AND goal = ?", (user_id, ALL_GOALS))
+        return
+    c.executemany('''
+        INSERT OR REPLACE INTO group_rankings
+            (group_id, goal, user_id, current_streak, last_day, total_days)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(group_id, ALL_GOALS, user_id, *stats) for group_id in groups])
+
+
+def remove_rankings(c, user_id, goals=None):
+    """删除成员的排行行（goals 为空时删除全部目标），随后需调用 refresh_rankings 更新合计行"""
+    if goals is None:
+        c.execute("DELETE FROM group_rankings WHERE user_id = ?", (user_id,))
+        return
+    c.executemany(
+        "DELETE FROM group_rankings WHERE user_id = ? AND goal = ?",
+        [(user_id, goal) for goal in goals]
+    )
+
+
+def merge_top(lists, limit):
+    """合并多个分片的前 K 名 [(user_id, 数值), ...]"""
+    rows = [row for rows in lists for row in rows]
+    return sorted(rows, key=lambda row: -row[1])[:limit]
@@ -0,0 +1,167 @@
+"""
+分片数调整工具（需在插件停止时运行）
+在插件目录的上一级运行：
+    python -m DailyGoalsTracker.reshard --from 1 --to 4
+读取旧分片布局中的全部数据，按新分片数重新分布到新的数据库文件，
+核对记录数后输出结果。旧文件保留不动，确认无误后再修改配置 storage.shards
+并手动删除旧文件。
+"""
+import os
+import sys
+import time
+import argparse
+
+from .dbedit import DatabaseManager
+from .shards import shard_paths, shard_of
+from .storage import DATA_DIR
+
+# 每次提交写入的行数
+BATCH_SIZE = 5000
+
+
+def _open_shards(data_dir, shards):
+    return [
+        DatabaseManager(db_path=path, data_dir=os.path.dirname(path))
+        for path in shard_paths(data_dir, shards)
+    ]
+
+
+def _table_counts(managers):
+    counts = {}
+    for manager in managers:
+        conn = manager.pool.connection()
+        for table in ('goals', 'checkins', 'goal_streaks', 'checkin_archive', 'checkin_rollups', 'goal_bitmaps',
+                      'group_members', 'group_rankings'):
+            counts[table] = counts.get(table, 0) + conn.execute(
+                f"SELECT COUNT(*) FROM {table}"
+            ).fetchone()[0]
+    return counts
+
+
+def _copy_shard(source, targets, batch_size):
+    """把一个旧分片的数据按用户写入新分片（目标ID重新分配）"""
+    src = source.pool.connection()
+    target_conns = [target.pool.connection() for target in targets]
+    goal_map = {}   # 旧目标ID -> (新分片, 新目标ID)
+
+    for goal_id, user_id, goal in src.execute("SELECT id, user_id, goal FROM goals ORDER BY id"):
+        index = shard_of(user_id, len(targets))
+        cursor = target_conns[index].execute(
+            "INSERT INTO goals (user_id, goal) VALUES (?, ?)", (user_id, goal)
+        )
+        goal_map[goal_id] = (index, cursor.lastrowid)
+    for conn in target_conns:
+        conn.commit()
+
+    # 连续打卡统计原样复制（保留已归档记录之前的历史累计值）
+    for row in src.execute("SELECT * FROM goal_streaks"):
+        index, new_goal_id = goal_map[row[0]]
+        target_conns[index].execute(
+            "INSERT INTO goal_streaks VALUES (?, ?, ?, ?, ?)", (new_goal_id, *row[1:])
+        )
+    # 归档按目标整行复制
+    for row in src.execute("SELECT goal_id, month, days, checkins FROM checkin_archive"):
+        index, new_goal_id = goal_map[row[0]]
+        target_conns[index].execute(
+            "INSERT INTO checkin_archive (goal_id, month, days, checkins) VALUES (?, ?, ?, ?)",
+            (new_goal_id, *row[1:])
+        )
+    # 汇总与位图同样按目标整行复制（含已归档部分）
+    for row in src.execute("SELECT goal_id, grain, period, days, checkins FROM checkin_rollups"):
+        index, new_goal_id = goal_map[row[0]]
+        target_conns[index].execute(
+            "INSERT INTO checkin_rollups (goal_id, grain, period, days, checkins) VALUES (?, ?, ?, ?, ?)",
+            (new_goal_id, *row[1:])
+        )
+    for row in src.execute("SELECT goal_id, base_day, bits FROM goal_bitmaps"):
+        index, new_goal_id = goal_map[row[0]]
+        target_conns[index].execute(
+            "INSERT INTO goal_bitmaps (goal_id, base_day, bits) VALUES (?, ?, ?)",
+            (new_goal_id, *row[1:])
+        )
+    # 群成员与排行按成员所在分片复制
+    for group_id, user_id in src.execute("SELECT group_id, user_id FROM group_members"):
+        target_conns[shard_of(user_id, len(targets))].execute(
+            "INSERT INTO group_members (group_id, user_id) VALUES (?, ?)", (group_id, user_id)
+        )
+    for row in src.execute("SELECT * FROM group_rankings"):
+        target_conns[shard_of(row[2], len(targets))].execute(
+            "INSERT INTO group_rankings VALUES (?, ?, ?, ?, ?, ?)", row
+        )
+    for conn in target_conns:
+        conn.commit()
+
+    pending = [[] for _ in targets]
+    rows = src.execute("SELECT user_id, checkin_time, goal_id, day FROM checkins ORDER BY id")
+    while True:
+        batch = rows.fetchmany(batch_size)
+        if not batch:
+            break
+        for user_id, checkin_time, goal_id, day in batch:
+            index, new_goal_id = goal_map[goal_id]
+            pending[index].append((user_id, checkin_time, new_goal_id, day))
+        for conn, items in zip(target_conns, pending):
+            if items:
+                conn.executemany(
+                    "INSERT INTO checkins (user_id, checkin_time, goal_id, day) VALUES (?, ?, ?, ?)",
+                    items
+                )
+                conn.commit()
+                items.clear()
+
+
+def reshard(data_dir, old_shards, new_shards, batch_size=BATCH_SIZE):
+    """按新分片数重新分布数据
+
+    Returns:
+        dict: 旧/新布局的各表记录数与用时
+    """
+    if old_shards == new_shards:
+        raise ValueError("新旧分片数相同")
+    for path in shard_paths(data_dir, old_shards):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"旧分片不存在: {path}")
+    for path in shard_paths(data_dir, new_shards):
+        if os.path.exists(path):
+            raise FileExistsError(f"新分片已存在（请先移走）: {path}")
+
+    start = time.perf_counter()
+    sources = _open_shards(data_dir, old_shards)
+    targets = _open_shards(data_dir, new_shards)
+    try:
+        for source in sources:
+            _copy_shard(source, targets, batch_size)
+        before, after = _table_counts(sources), _table_counts(targets)
+    finally:
+        for manager in sources + targets:
+            manager.close()
+    if before != after:
+        raise RuntimeError(f"记录数不一致: 旧 {before} / 新 {after}")
+    return {"before": before, "after": after, "elapsed": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DailyGoalsTracker 分片数调整（需停止插件）")
+    parser.add_argument("--from", dest="old_shards", type=int, required=True, help="当前分片数")
+    parser.add_argument("--to", dest="new_shards", type=int, required=True, help="目标分片数")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="数据目录")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    try:
+        result = reshard(args.data_dir, args.old_shards, args.new_shards, args.batch_size)
+    except Exception as e:
+        print(f"❌ 分片调整失败: {e}")
+        sys.exit(1)
+    counts = result["after"]
+    print(
+        f"✅ 分片调整完成：{args.old_shards} -> {args.new_shards}，用时 {result['elapsed']:.1f}秒\n"
+        f"目标 {counts['goals']}，打卡记录 {counts['checkins']}，连续统计 {counts['goal_streaks']}，"
+        f"归档 {counts['checkin_archive']}，汇总 {counts['checkin_rollups']}，位图 {counts['goal_bitmaps']}\n"
+        f"请将配置 storage.shards 改为 {args.new_shards} 后重启插件；旧文件确认无误后可删除：\n"
+        + "\n".join(shard_paths(args.data_dir, args.old_shards))
+    )
+
+
+if __name__ == "__main__":
+    main()
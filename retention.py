@@ -0,0 +1,122 @@
+"""
+打卡记录保留策略
+- 在每日低峰时段后台运行，不阻塞打卡
+- 按日期索引分批移出过期记录，每批一个短事务，批次之间让出写线程
+- 过期记录默认并入按月归档（历史统计仍可查询），也可配置为直接删除
+- 同时清理既无记录也无归档的目标
+- 清理结束后以增量方式回收磁盘空间（旧库需先由管理员执行一次转换，清理任务不做完整 VACUUM）
+"""
+import asyncio
+import inspect
+from datetime import datetime, timedelta
+
+from .storage import china_tz, today_key
+
+
+class RetentionPolicy:
+    """保留策略配置"""
+    def __init__(self, keep_days=365, batch_size=500, pause_ms=50,
+                 offpeak_start=3, offpeak_end=5, vacuum_pages=1000, archive=True):
+        self.keep_days = keep_days          # 热表保留最近多少天的记录
+        self.batch_size = batch_size        # 每批移出的记录数
+        self.pause = pause_ms / 1000        # 批次之间的间隔
+        self.offpeak_start = offpeak_start  # 低峰时段开始（小时，UTC+8）
+        self.offpeak_end = offpeak_end      # 低峰时段结束（小时，UTC+8）
+        self.vacuum_pages = vacuum_pages    # 每次增量回收的页数
+        self.archive = archive              # 归档（False 时直接删除）
+
+    @classmethod
+    def from_config(cls, config, logger=None):
+        """从配置的 retention 段创建（未知的键忽略并记录，不阻止插件启动）"""
+        fields = set(inspect.signature(cls).parameters)
+        ignored = sorted(k for k in config if k not in fields and k != "enabled")
+        if ignored and logger:
+            logger.warning(f"retention 配置中的未知项已忽略: {', '.join(ignored)}")
+        return cls(**{k: v for k, v in config.items() if k in fields})
+
+    def in_offpeak(self, now=None):
+        """当前是否处于低峰时段"""
+        hour = (now or datetime.now(china_tz)).hour
+        if self.offpeak_start <= self.offpeak_end:
+            return self.offpeak_start <= hour < self.offpeak_end
+        return hour >= self.offpeak_start or hour < self.offpeak_end
+
+    def seconds_until_offpeak(self, now=None):
+        """距离下一个低峰时段开始的秒数（正处于低峰时段时为0）"""
+        now = now or datetime.now(china_tz)
+        if self.in_offpeak(now):
+            return 0
+        start = now.replace(hour=self.offpeak_start, minute=0, second=0, microsecond=0)
+        if start <= now:
+            start += timedelta(days=1)
+        return (start - now).total_seconds()
+
+
+class RetentionEngine:
+    """后台保留任务"""
+    def __init__(self, adb, policy, logger=None):
+        self.adb = adb
+        self.policy = policy
+        self.logger = logger
+        self._task = None
+
+    def start(self):
+        """启动每日低峰时段的后台清理"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.policy.seconds_until_offpeak())
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._log(f"打卡记录清理失败: {e}", error=True)
+            # 跳过本次低峰时段的剩余时间
+            while self.policy.in_offpeak():
+                await asyncio.sleep(600)
+
+    async def run_once(self, force=False):
+        """执行一轮清理（force=True 时忽略低峰时段限制）
+
+        Returns:
+            int: 移出的打卡记录数
+        """
+        policy = self.policy
+        cutoff_day = today_key() - policy.keep_days
+        total = 0
+        while force or policy.in_offpeak():
+            deleted = await self.adb.purge_checkins_chunk(cutoff_day, policy.batch_size, policy.archive)
+            if not deleted:
+                break
+            total += deleted
+            await asyncio.sleep(policy.pause)
+        if total:
+            action = "归档" if policy.archive else "清理"
+            self._log(f"已{action} {total} 条 {policy.keep_days} 天前的打卡记录")
+            await self._vacuum(force)
+        return total
+
+    async def _vacuum(self, force):
+        """增量回收空闲页"""
+        policy = self.policy
+        if not await self.adb.incremental_vacuum_enabled():
+            # 转换需要完整 VACUUM，会长时间阻塞打卡，只由管理员手动执行
+            self._log("数据库尚未开启增量空间回收，已跳过；可在低峰时段执行 /打卡管理 回收 进行一次性转换")
+            return
+        while force or policy.in_offpeak():
+            remaining = await self.adb.incremental_vacuum(policy.vacuum_pages)
+            if not remaining:
+                break
+            await asyncio.sleep(policy.pause)
+
+    def _log(self, message, error=False):
+        if self.logger:
+            (self.logger.error if error else self.logger.info)(message)
@@ -0,0 +1,175 @@
+"""
+打卡汇总表（checkin_rollups）维护
+- 每个目标按 日/月/年 三种粒度各一行：days 为打卡天数（按自然日去重），checkins 为打卡记录数
+- 打卡、补打卡时在同一事务内增量累加；记录直接删除时扣减，并入归档时保持不变
+- 月度/年度统计按主键直接读取，每个目标一次查找
+"""
+from .storage import day_to_date, month_of
+from .archive import decode_days
+
+# 统计粒度
+DAY = 0     # period 为日序号
+MONTH = 1   # period 为 YYYYMM
+YEAR = 2    # period 为 YYYY
+
+SQL_USER_ROLLUP = '''
+    SELECT g.goal, r.days, r.checkins
+    FROM goals g
+    JOIN checkin_rollups r ON r.goal_id = g.id
+    WHERE g.user_id = ? AND r.grain = ? AND r.period = ?
+'''
+
+SQL_ADD_ROLLUP = '''
+    INSERT INTO checkin_rollups (goal_id, grain, period, days, checkins)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(goal_id, grain, period) DO UPDATE SET
+        days = days + excluded.days,
+        checkins = checkins + excluded.checkins
+'''
+
+SQL_SUB_ROLLUP = '''
+    UPDATE checkin_rollups
+    SET days = days - ?, checkins = checkins - ?
+    WHERE goal_id = ? AND grain = ? AND period = ?
+'''
+
+
+def periods(day):
+    """日序号 -> [(粒度, 周期), ...]"""
+    return [(DAY, day), (MONTH, month_of(day)), (YEAR, day_to_date(day).year)]
+
+
+def create_rollup_table(c):
+    """创建汇总表"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS checkin_rollups (
+            goal_id INTEGER NOT NULL,
+            grain INTEGER NOT NULL,
+            period INTEGER NOT NULL,
+            days INTEGER NOT NULL,
+            checkins INTEGER NOT NULL,
+            PRIMARY KEY (goal_id, grain, period),
+            FOREIGN KEY (goal_id) REFERENCES goals(id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _count(rows):
+    """[(goal_id, day), ...] -> {(goal_id, day): 记录数}"""
+    counts = {}
+    for key in rows:
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def add_checkins(c, rows):
+    """累加新写入的打卡记录（需在写入记录的同一事务中调用）
+
+    Args:
+        rows: [(goal_id, day), ...] 每条记录一项
+    """
+    for (goal_id, day), count in _count(rows).items():
+        existing = c.execute(
+            "SELECT checkins FROM checkin_rollups WHERE goal_id = ? AND grain = ? AND period = ?",
+            (goal_id, DAY, day)
+        ).fetchone()
+        new_day = 0 if existing and existing[0] > 0 else 1
+        c.executemany(SQL_ADD_ROLLUP, [
+            (goal_id, grain, period, new_day, count) for grain, period in periods(day)
+        ])
+
+
+def remove_checkins(c, rows):
+    """扣减被直接删除的打卡记录（并入归档的记录不调用）
+
+    Args:
+        rows: [(goal_id, day), ...] 每条记录一项
+    """
+    for (goal_id, day), count in _count(rows).items():
+        existing = c.execute(
+            "SELECT checkins FROM checkin_rollups WHERE goal_id = ? AND grain = ? AND period = ?",
+            (goal_id, DAY, day)
+        ).fetchone()
+        if not existing:
+            continue
+        lost_day = 1 if existing[0] <= count else 0
+        keys = [(goal_id, grain, period) for grain, period in periods(day)]
+        c.executemany(SQL_SUB_ROLLUP, [(lost_day, count, *key) for key in keys])
+        c.executemany(
+            "DELETE FROM checkin_rollups WHERE goal_id = ? AND grain = ? AND period = ? AND checkins <= 0",
+            keys
+        )
+
+
+def delete_rollups(c, goal_ids):
+    """删除目标的全部汇总"""
+    goal_ids = list(goal_ids)
+    if goal_ids:
+        c.execute(
+            "DELETE FROM checkin_rollups WHERE goal_id IN ({})".format(','.join('?' * len(goal_ids))),
+            goal_ids
+        )
+
+
+def build_rollups(day_counts, archived):
+    """按打卡日计算汇总行
+
+    Args:
+        day_counts: [(goal_id, day, 记录数), ...] 近期记录
+        archived: [(goal_id, 月份, [日序号], 记录数), ...] 归档（只保留每月记录数，
+                  日粒度按每天1条计）
+
+    Returns:
+        dict: (goal_id, grain, period) -> [days, checkins]
+    """
+    rollups = {}
+    seen = set()
+
+    def add(goal_id, day, count):
+        new_day = (goal_id, day) not in seen
+        seen.add((goal_id, day))
+        for grain, period in periods(day):
+            row = rollups.setdefault((goal_id, grain, period), [0, 0])
+            row[0] += new_day
+            row[1] += count
+
+    for goal_id, month, days, checkins in archived:
+        for day in days:
+            add(goal_id, day, 1)
+        # 同日多次打卡的差额只计入月、年
+        extra = checkins - len(days)
+        if extra > 0:
+            for grain, period in periods(days[0])[1:]:
+                rollups[(goal_id, grain, period)][1] += extra
+    for goal_id, day, count in day_counts:
+        add(goal_id, day, count)
+    return rollups
+
+
+def rebuild_rollups(c, goal_ids=None):
+    """从打卡记录与归档重算汇总（goal_ids为空时重算全部）"""
+    if goal_ids is None:
+        where, params = '', []
+        c.execute("DELETE FROM checkin_rollups")
+    else:
+        params = list(goal_ids)
+        if not params:
+            return
+        where = "AND goal_id IN ({})".format(','.join('?' * len(params)))
+        delete_rollups(c, params)
+    day_counts = c.execute(f'''
+        SELECT goal_id, day, COUNT(*) FROM checkins
+        WHERE day IS NOT NULL {where}
+        GROUP BY goal_id, day
+    ''', params).fetchall()
+    archived = [
+        (goal_id, month, decode_days(month, blob), checkins)
+        for goal_id, month, blob, checkins in c.execute(f'''
+            SELECT goal_id, month, days, checkins FROM checkin_archive
+            WHERE 1 {where}
+        ''', params)
+    ]
+    c.executemany(
+        "INSERT INTO checkin_rollups (goal_id, grain, period, days, checkins) VALUES (?, ?, ?, ?, ?)",
+        [(*key, days, checkins) for key, (days, checkins) in build_rollups(day_counts, archived).items()]
+    )
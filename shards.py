@@ -0,0 +1,345 @@
+"""
+按用户分片的 SQLite 存储
+- 用户按 user_id 的稳定哈希分布到 N 个数据库文件，每个分片有独立的写锁
+- 单用户操作路由到所在分片；跨用户操作（备份、恢复、过期清理等）依次作用于所有分片
+- 打卡ID编码分片号：全局ID = 分片内ID * N + 分片序号
+- 分片数变更需离线执行 reshard 工具
+"""
+import os
+import time
+import zlib
+
+from .dbedit import DatabaseManager
+from .backup import BackupEngine, new_backup_name
+from .storage import CheckinStorage, DATA_DIR
+from .rankings import merge_top
+from .transfer import IMPORT_TRANSACTION
+
+
+def shard_paths(data_dir, shards):
+    """各分片的数据库路径（单分片即原有的 checkin.db）"""
+    if shards == 1:
+        return [os.path.join(data_dir, 'checkin.db')]
+    return [
+        os.path.join(data_dir, f'shards{shards}', f'shard{i}', 'checkin.db')
+        for i in range(shards)
+    ]
+
+
+def shard_of(user_id, shards):
+    """用户所在分片（CRC32，跨进程稳定）"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % shards
+
+
+class ShardedStorage(CheckinStorage):
+    """分片存储引擎（每个分片是一个 DatabaseManager）"""
+    def __init__(self, data_dir=DATA_DIR, shards=4):
+        super().__init__(data_dir)
+        self.write_shards = shards
+        self.shards = [
+            DatabaseManager(db_path=path, data_dir=os.path.dirname(path))
+            for path in shard_paths(data_dir, shards)
+        ]
+
+    def shard_index(self, user_id):
+        return shard_of(user_id, self.write_shards)
+
+    def _shard(self, user_id):
+        return self.shards[self.shard_index(user_id)]
+
+    def _global_id(self, index, checkin_id):
+        return checkin_id * self.write_shards + index
+
+    def _global_rows(self, user_id, rows):
+        index = self.shard_index(user_id)
+        return [(self._global_id(index, row[0]), *row[1:]) for row in rows]
+
+    # ---------- 生命周期 ----------
+    def init_db(self):
+        for shard in self.shards:
+            shard.init_db()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def add_reset_listener(self, callback):
+        for shard in self.shards:
+            shard.add_reset_listener(callback)
+
+    # ---------- 打卡写入 ----------
+    def checkin(self, user_id, goals):
+        index = self.shard_index(user_id)
+        ids = self.shards[index].checkin(user_id, goals)
+        return [self._global_id(index, cid) for cid in ids]
+
+    def checkin_many(self, requests):
+        """按分片拆分批次，每个分片一个事务"""
+        grouped = {}
+        for position, (user_id, goals) in enumerate(requests):
+            grouped.setdefault(self.shard_index(user_id), []).append((position, user_id, goals))
+        results = [None] * len(requests)
+        for index, batch in grouped.items():
+            try:
+                shard_results = self.shards[index].checkin_many(
+                    [(user_id, goals) for _, user_id, goals in batch]
+                )
+            except Exception as e:
+                shard_results = [e] * len(batch)
+            for (position, _, _), result in zip(batch, shard_results):
+                if not isinstance(result, Exception):
+                    result = [self._global_id(index, cid) for cid in result]
+                results[position] = result
+        return results
+
+    def supplement_checkin(self, user_id, goal, checkin_date):
+        index = self.shard_index(user_id)
+        checkin_id = self.shards[index].supplement_checkin(user_id, goal, checkin_date)
+        return self._global_id(index, checkin_id)
+
+    def import_rows(self, records):
+        """按用户分发到各分片，每个分片攒满一个事务的行数后写入，全部写入后重算派生表"""
+        pending = [[] for _ in self.shards]
+        imported = skipped = 0
+        affected = {}
+
+        def flush(index):
+            nonlocal imported, skipped
+            batch_imported, batch_skipped, goals = self.import_batch(pending[index])
+            imported += batch_imported
+            skipped += batch_skipped
+            affected.update(goals)
+            pending[index] = []
+
+        try:
+            for record in records:
+                index = self.shard_index(record[0])
+                pending[index].append(record)
+                if len(pending[index]) >= IMPORT_TRANSACTION:
+                    flush(index)
+            for index, items in enumerate(pending):
+                if items:
+                    flush(index)
+        finally:
+            self.rebuild_imported(affected)
+        return imported, skipped
+
+    def import_batch(self, records):
+        """按用户分发到各分片写入（每个分片一个事务），待重算的目标以全局目标ID标识"""
+        grouped = {}
+        for record in records:
+            grouped.setdefault(self.shard_index(record[0]), []).append(record)
+        imported = skipped = 0
+        affected = {}
+        for index, items in grouped.items():
+            shard_imported, shard_skipped, goals = self.shards[index].import_batch(items)
+            imported += shard_imported
+            skipped += shard_skipped
+            affected.update({self._global_id(index, goal_id): user_id for goal_id, user_id in goals.items()})
+        return imported, skipped, affected
+
+    def rebuild_imported(self, goal_users):
+        grouped = {}
+        for global_id, user_id in goal_users.items():
+            index = global_id % self.write_shards
+            grouped.setdefault(index, {})[global_id // self.write_shards] = user_id
+        for index, goals in grouped.items():
+            self.shards[index].rebuild_imported(goals)
+
+    # ---------- 查询 ----------
+    def get_checkins(self, user_id):
+        return self._global_rows(user_id, self._shard(user_id).get_checkins(user_id))
+
+    def get_checkin_report(self, user_id):
+        checkins, streaks = self._shard(user_id).get_checkin_report(user_id)
+        return self._global_rows(user_id, checkins), streaks
+
+    def get_goals(self, checkin_id):
+        index = checkin_id % self.write_shards
+        return self.shards[index].get_goals(checkin_id // self.write_shards)
+
+    def get_last_goals(self, user_id):
+        return self._shard(user_id).get_last_goals(user_id)
+
+    def get_admin_qq(self):
+        firsts = [first for first in (s.get_first_checkin() for s in self.shards) if first]
+        return min(firsts)[1] if firsts else '0'
+
+    def get_today_status(self, user_id, goals):
+        return self._shard(user_id).get_today_status(user_id, goals)
+
+    def has_checked_in_today(self, user_id, goal):
+        return self._shard(user_id).has_checked_in_today(user_id, goal)
+
+    def get_consecutive_days(self, user_id, goal=None):
+        return self._shard(user_id).get_consecutive_days(user_id, goal)
+
+    def get_recent_checkins(self, user_id, days=30):
+        return self._shard(user_id).get_recent_checkins(user_id, days)
+
+    def iter_history(self, user_id):
+        return self._shard(user_id).iter_history(user_id)
+
+    def get_day_bitmaps(self, user_id):
+        return self._shard(user_id).get_day_bitmaps(user_id)
+
+    def get_period_stats(self, user_id, grain, period):
+        return self._shard(user_id).get_period_stats(user_id, grain, period)
+
+    def iter_export_rows(self, user_id=None):
+        """依次流式读取各分片"""
+        if user_id is not None:
+            yield from self._shard(user_id).iter_export_rows(user_id)
+            return
+        for shard in self.shards:
+            yield from shard.iter_export_rows()
+
+    # ---------- 群排行 ----------
+    def join_group(self, user_id, group_id):
+        return self._shard(user_id).join_group(user_id, group_id)
+
+    def get_group_ranking(self, group_id, goal=None, limit=10):
+        """各分片取前 K 名后合并"""
+        results = [shard.get_group_ranking(group_id, goal, limit) for shard in self.shards]
+        return (
+            merge_top([streaks for streaks, _ in results], limit),
+            merge_top([totals for _, totals in results], limit),
+        )
+
+    def get_group_stats(self, group_id, since_day):
+        """各分片分别聚合后相加（成员只在一个分片中，人数可直接相加）"""
+        stats = {"members": 0, "active": 0, "checkins": 0, "goals": {}, "hours": [0] * 24}
+        for shard in self.shards:
+            result = shard.get_group_stats(group_id, since_day)
+            for key in ("members", "active", "checkins"):
+                stats[key] += result[key]
+            for goal, (members, checkins) in result["goals"].items():
+                total = stats["goals"].get(goal, (0, 0))
+                stats["goals"][goal] = (total[0] + members, total[1] + checkins)
+            stats["hours"] = [a + b for a, b in zip(stats["hours"], result["hours"])]
+        return stats
+
+    # ---------- 删除与清理 ----------
+    def delete_goals(self, user_id, goal):
+        return self._shard(user_id).delete_goals(user_id, goal)
+
+    def delete_all_checkins(self, user_id):
+        return self._shard(user_id).delete_all_checkins(user_id)
+
+    def clear_database(self):
+        for shard in self.shards:
+            shard.clear_database()
+
+    def purge_checkins_chunk(self, cutoff_day, limit=500, archive=True):
+        """依次清理各分片，每次调用只处理一个分片中的一批"""
+        for shard in self.shards:
+            deleted = shard.purge_checkins_chunk(cutoff_day, limit, archive)
+            if deleted:
+                return deleted
+        return 0
+
+    # ---------- 维护 ----------
+    def check_query_plans(self):
+        return [problem for shard in self.shards for problem in shard.check_query_plans()]
+
+    def rebuild_rollups(self):
+        for shard in self.shards:
+            shard.rebuild_rollups()
+
+    def legacy_supplement_count(self):
+        return sum(shard.legacy_supplement_count() for shard in self.shards)
+
+    def correct_legacy_supplements(self):
+        return sum(shard.correct_legacy_supplements() for shard in self.shards)
+
+    def incremental_vacuum_enabled(self):
+        return all(shard.incremental_vacuum_enabled() for shard in self.shards)
+
+    def enable_incremental_vacuum(self):
+        return any([shard.enable_incremental_vacuum() for shard in self.shards])
+
+    def incremental_vacuum(self, pages=1000):
+        return sum(shard.incremental_vacuum(pages) for shard in self.shards)
+
+    def backup_database(self, backup_dir=None, max_backups=3, compress=True):
+        """依次备份所有分片（每个分片备份到自己的目录，同一轮次的文件同名）
+
+        任一分片失败时删除本轮已生成的文件；全部成功后才轮换旧备份，各分片保留相同的轮次。
+        """
+        engines = [
+            shard.backup_engine(self._shard_backup_dir(backup_dir, index), max_backups, compress)
+            for index, shard in enumerate(self.shards)
+        ]
+        name = new_backup_name([engine.backup_dir for engine in engines], compress)
+        paths = []
+        for index, shard in enumerate(self.shards):
+            success, result = shard.backup_database(
+                backup_dir=self._shard_backup_dir(backup_dir, index),
+                max_backups=max_backups,
+                compress=compress,
+                name=name,
+                rotate=False
+            )
+            if not success:
+                for path in paths:
+                    BackupEngine.remove(path)
+                return False, f"分片{index}: {result}"
+            paths.append(result)
+        for engine in engines:
+            engine.rotate()
+        return True, paths
+
+    def _shard_backup_dir(self, backup_dir, index):
+        if backup_dir is None:
+            return None
+        return os.path.join(backup_dir, f'shards{self.write_shards}', f'shard{index}')
+
+    def list_backups(self, backup_dir=None):
+        """所有分片都有的备份轮次（按文件名匹配，以分片0的顺序与修改时间为准）"""
+        listings = [
+            {
+                name: (size, mtime)
+                for name, size, mtime in shard.list_backups(self._shard_backup_dir(backup_dir, index))
+            }
+            for index, shard in enumerate(self.shards)
+        ]
+        return [
+            (name, sum(listing[name][0] for listing in listings), mtime)
+            for name, (_, mtime) in listings[0].items()
+            if all(name in listing for listing in listings)
+        ]
+
+    def restore_database(self, backup_name, backup_dir=None):
+        """按轮次恢复所有分片（先校验全部分片的备份，任一未通过则不改动任何分片）"""
+        names = [name for name, _, _ in self.list_backups(backup_dir)]
+        if backup_name.isdigit() and 1 <= int(backup_name) <= len(names):
+            name = names[int(backup_name) - 1]
+        elif backup_name in names:
+            name = backup_name
+        else:
+            return False, f"未找到备份：{backup_name}"
+
+        start = time.perf_counter()
+        prepared = []
+        for index, shard in enumerate(self.shards):
+            success, result = shard.prepare_restore(name, self._shard_backup_dir(backup_dir, index))
+            if not success:
+                for _, tmp_path in prepared:
+                    BackupEngine.discard(tmp_path)
+                return False, f"分片{index}: {result}"
+            prepared.append(result)
+
+        counts = {}
+        for index, (shard, item) in enumerate(zip(self.shards, prepared)):
+            success, result = shard.apply_restore(item, start)
+            if not success:
+                for _, tmp_path in prepared[index + 1:]:
+                    BackupEngine.discard(tmp_path)
+                return False, f"分片{index}: {result}"
+            for table, count in result["counts"].items():
+                counts[table] = counts.get(table, 0) + count
+        return True, {
+            "path": name,
+            "elapsed": time.perf_counter() - start,
+            "counts": counts,
+        }
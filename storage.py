@@ -0,0 +1,463 @@
+"""
+打卡存储接口
+- CheckinStorage 定义命令处理依赖的全部存储操作，各存储引擎实现该接口
+- 内置引擎：sqlite（dbedit.DatabaseManager，默认；shards > 1 时为 shards.ShardedStorage）、
+  memory（memstore.MemoryStorage）
+- 引擎通过配置 storage.engine 选择，见 create_storage
+"""
+import os
+import json
+from datetime import datetime, timedelta, timezone
+
+# 默认数据目录（数据库、备份、日志）
+DATA_DIR = "data/plugins/DailyGoalsTracker"
+
+# 创建UTC+8时区对象
+china_tz = timezone(timedelta(hours=8))
+UTC_OFFSET = 8 * 3600
+EPOCH_DATE = datetime(1970, 1, 1).date()
+
+# 补打卡支持的日期格式
+TIME_FORMATS = [
+    '%Y-%m-%d %H:%M',    # 标准格式
+    '%Y-%m-%d',           # 仅日期
+    '%Y-%m-%d %H:%M:%S',  # 带秒数
+    '%Y/%m/%d %H:%M',     # 斜线分隔
+    '%Y.%m.%d %H:%M',    # 点分隔
+    '%Y-%m-%dT%H:%M',     # ISO格式
+    '%Y%m%d %H%M'        # 紧凑格式
+]
+
+
+def day_key(dt):
+    """日期/时间 -> 日序号（UTC+8 自然日，距1970-01-01的天数）"""
+    if isinstance(dt, datetime):
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(china_tz)
+        dt = dt.date()
+    return (dt - EPOCH_DATE).days
+
+
+def today_key():
+    """今日的日序号"""
+    return day_key(datetime.now(china_tz))
+
+
+def day_to_date(day):
+    """日序号 -> date"""
+    return EPOCH_DATE + timedelta(days=day)
+
+
+def month_of(day):
+    """日序号 -> 月份键（YYYYMM）"""
+    d = day_to_date(day)
+    return d.year * 100 + d.month
+
+
+def to_epoch(dt):
+    """带时区的 datetime -> 打卡时间戳（Unix 秒）"""
+    return int(dt.timestamp())
+
+
+def from_epoch(ts):
+    """打卡时间戳 -> UTC+8 datetime"""
+    return datetime.fromtimestamp(ts, china_tz)
+
+
+def epoch_day(ts):
+    """打卡时间戳 -> 日序号（与 day_key 一致）"""
+    return (ts + UTC_OFFSET) // 86400
+
+
+def format_time(ts, fmt='%Y-%m-%d %H:%M'):
+    """打卡时间戳 -> UTC+8 显示文本"""
+    return from_epoch(ts).strftime(fmt)
+
+
+def parse_checkin_time(checkin_date):
+    """解析补打卡日期（UTC+8），只有日期时默认中午12点
+
+    Raises:
+        ValueError: 日期格式错误或为未来时间
+    """
+    # 预处理输入（统一分隔符）
+    processed_date = checkin_date.replace('/', '-').replace('.', '-').replace('T', ' ')
+
+    # 尝试解析日期
+    checkin_time = None
+    for fmt in TIME_FORMATS:
+        try:
+            checkin_time = datetime.strptime(processed_date, fmt)
+            break
+        except ValueError:
+            continue
+    # 处理纯数字格式（如20230317）
+    if not checkin_time and len(processed_date) >= 8:
+        try:
+            if ' ' in processed_date:
+                date_part, time_part = processed_date.split(' ', 1)
+                checkin_time = datetime.strptime(date_part, '%Y%m%d')
+                checkin_time = checkin_time.replace(
+                    hour=int(time_part[:2]),
+                    minute=int(time_part[2:4])
+                )
+            else:
+                checkin_time = datetime.strptime(processed_date, '%Y%m%d')
+        except:
+            pass
+    # 添加默认时间
+    if checkin_time:
+        if checkin_time.hour == 0 and checkin_time.minute == 0:
+            checkin_time = checkin_time.replace(hour=12)
+    else:
+        raise ValueError(
+            f"日期格式错误，支持格式示例：\n"
+            f"2025-03-17\n2025/3/17 12:00\n2025.12.31 23:59"
+        )
+    # 转换为中国时区（aware时间）
+    checkin_time = checkin_time.replace(tzinfo=china_tz)
+
+    # 未来时间检查
+    if checkin_time > datetime.now(china_tz):
+        raise ValueError("不能补未来的打卡记录")
+    return checkin_time
+
+
+class CheckinStorage:
+    """打卡存储接口
+
+    打卡时间统一为整数 Unix 时间戳（秒，与时区无关），显示时用 from_epoch /
+    format_time 转为 UTC+8；日序号见 day_key。所有方法均为同步调用，由 AsyncDatabase 放入线程执行；
+    实现必须线程安全。
+    """
+    # 可并行写入的分片数（AsyncDatabase 按分片分配写线程）
+    write_shards = 1
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self._reset_listeners = []
+
+    def shard_index(self, user_id):
+        """用户所在的写入分片"""
+        return 0
+
+    # ---------- 生命周期 ----------
+    def init_db(self):
+        """初始化存储（可重复调用）"""
+        raise NotImplementedError
+
+    def add_reset_listener(self, callback):
+        """数据被整体替换（恢复备份、清空、旧版升级完成）后调用 callback()，
+        供上层清空依赖数据的缓存；可能在数据库线程中调用"""
+        self._reset_listeners.append(callback)
+
+    def _notify_reset(self):
+        for callback in self._reset_listeners:
+            callback()
+
+    def close(self):
+        """释放存储资源"""
+
+    # ---------- 打卡写入 ----------
+    def checkin(self, user_id, goals):
+        """打卡（多目标），返回打卡ID列表"""
+        raise NotImplementedError
+
+    def checkin_many(self, requests):
+        """批量打卡 [(user_id, goals), ...]
+
+        Returns:
+            list: 与请求一一对应，成功为打卡ID列表，失败为异常对象
+        """
+        raise NotImplementedError
+
+    def supplement_checkin(self, user_id, goal, checkin_date):
+        """补打卡，返回打卡ID
+
+        Raises:
+            ValueError: 日期无效或当日已有该目标的记录
+        """
+        raise NotImplementedError
+
+    def import_rows(self, records):
+        """逐批写入 (user_id, 目标, 打卡时间) 记录，相同（目标, 时间）已存在或当日已归档的跳过，
+        统计、汇总、位图与排行随之更新 -> (导入数, 跳过数)
+        """
+        raise NotImplementedError
+
+    def import_batch(self, records):
+        """在一个写事务中写入一批记录 -> (导入数, 跳过数, 待重算 {目标键: user_id})
+
+        分批导入时每批单独提交到写线程，之后用 rebuild_imported 分批重算派生表；
+        默认一次完成写入与重算。
+        """
+        return (*self.import_rows(records), {})
+
+    def rebuild_imported(self, goal_users):
+        """重算 import_batch 返回的目标的统计、汇总、位图与排行"""
+
+    # ---------- 查询 ----------
+    def get_checkins(self, user_id):
+        """用户所有打卡记录 [(id, user_id, checkin_time, goal), ...]"""
+        raise NotImplementedError
+
+    def get_checkin_report(self, user_id):
+        """(打卡记录列表, {目标: 当前连续天数})"""
+        raise NotImplementedError
+
+    def get_goals(self, checkin_id):
+        """打卡记录对应的目标列表"""
+        raise NotImplementedError
+
+    def get_last_goals(self, user_id):
+        """用户最近一次打卡（同一时间戳）的目标"""
+        raise NotImplementedError
+
+    def get_admin_qq(self):
+        """最早打卡的用户（无记录时为 '0'）"""
+        raise NotImplementedError
+
+    def get_today_status(self, user_id, goals):
+        """目标 -> (今日是否已打卡, 当前连续天数)"""
+        raise NotImplementedError
+
+    def has_checked_in_today(self, user_id, goal):
+        """目标今日是否已打卡"""
+        return self.get_today_status(user_id, [goal])[goal][0]
+
+    def get_consecutive_days(self, user_id, goal=None):
+        """当前连续打卡天数（不指定目标时按用户任一目标计算，含已归档的日期）"""
+        raise NotImplementedError
+
+    def get_recent_checkins(self, user_id, days=30):
+        """近期打卡时间，按目标分组 {目标: [checkin_time, ...]}"""
+        raise NotImplementedError
+
+    def iter_history(self, user_id):
+        """流式读取用户全部打卡日（归档 + 近期记录）-> (目标, 日序号)
+
+        同一目标同一天可能出现多次，由调用方去重。
+        """
+        raise NotImplementedError
+
+    def get_history_summary(self, user_id, year=None):
+        """长期打卡统计（含归档）
+
+        Returns:
+            dict: 目标 -> {"days": 打卡天数, "months": {YYYYMM: 天数},
+                           "first_day": 首次打卡日序号, "last_day": 最近打卡日序号}
+        """
+        history = {}
+        for goal, day in self.iter_history(user_id):
+            month = month_of(day)
+            if year and month // 100 != year:
+                continue
+            history.setdefault(goal, {}).setdefault(month, set()).add(day)
+        return {
+            goal: {
+                "days": sum(len(days) for days in months.values()),
+                "months": {month: len(months[month]) for month in sorted(months)},
+                "first_day": min(months[min(months)]),
+                "last_day": max(months[max(months)]),
+            }
+            for goal, months in history.items()
+        }
+
+    def get_day_bitmaps(self, user_id):
+        """各目标的打卡日位图（含归档）{目标: bitmaps.DayBitmap}"""
+        from .bitmaps import DayBitmap
+        bitmaps = {}
+        for goal, day in self.iter_history(user_id):
+            bitmaps.setdefault(goal, DayBitmap()).add(day)
+        return bitmaps
+
+    def get_period_stats(self, user_id, grain, period):
+        """某日/月/年的汇总统计（grain 见 rollups.DAY/MONTH/YEAR）
+
+        Returns:
+            dict: 目标 -> (打卡天数, 打卡记录数)，该周期内无记录的目标不出现
+        """
+        raise NotImplementedError
+
+    def iter_export_rows(self, user_id=None):
+        """分块流式读取打卡记录（user_id 为空时读取全部）-> 每块 [(user_id, 目标, 打卡时间), ...]"""
+        raise NotImplementedError
+
+    # ---------- 群排行 ----------
+    def join_group(self, user_id, group_id):
+        """登记群成员，返回是否新加入"""
+        raise NotImplementedError
+
+    def get_group_ranking(self, group_id, goal=None, limit=10):
+        """群内前 K 名（不指定目标时按成员任一目标合计）
+
+        当前连续天数只统计今日已打卡的成员。
+
+        Returns:
+            tuple: ([(user_id, 当前连续天数), ...], [(user_id, 累计天数), ...])，均按数值降序
+        """
+        raise NotImplementedError
+
+    def get_group_stats(self, group_id, since_day):
+        """群内自 since_day（含）起的打卡统计
+
+        Returns:
+            dict: {"members": 成员数, "active": 有打卡的成员数, "checkins": 打卡记录数,
+                   "goals": {目标: (打卡成员数, 打卡记录数)}, "hours": [UTC+8 各小时打卡数] * 24}
+        """
+        raise NotImplementedError
+
+    # ---------- 删除与清理 ----------
+    def delete_goals(self, user_id, goal):
+        """删除用户目标及其打卡记录，返回删除的目标数"""
+        raise NotImplementedError
+
+    def delete_all_checkins(self, user_id):
+        """删除用户所有打卡记录，返回删除的记录数"""
+        raise NotImplementedError
+
+    def clear_database(self):
+        """清空所有数据"""
+        raise NotImplementedError
+
+    def purge_checkins_chunk(self, cutoff_day, limit=500, archive=True):
+        """移出一批早于 cutoff_day 的打卡记录
+
+        archive=True 时并入归档（历史统计仍可读取），否则直接删除；
+        既无记录也无归档的目标随之删除。连续打卡统计保留历史累计值。
+        返回本批移出数（0 表示已清理完毕）。
+        """
+        raise NotImplementedError
+
+    def clear_old_checkins(self, days=30, batch_size=500, archive=True):
+        """归档（或删除）指定天数前的记录（分批执行，每批独立事务）"""
+        cutoff_day = today_key() - days
+        total = 0
+        while True:
+            deleted = self.purge_checkins_chunk(cutoff_day, batch_size, archive)
+            if not deleted:
+                return total
+            total += deleted
+
+    # ---------- 维护（引擎不支持时为空操作） ----------
+    def check_query_plans(self):
+        """未走索引的热点查询 [(名称, 计划), ...]"""
+        return []
+
+    def rebuild_rollups(self):
+        """从打卡记录与归档重算日/月/年汇总"""
+
+    def legacy_supplement_count(self):
+        """迁移时登记、可能按 UTC 存储的旧补打卡记录数"""
+        return 0
+
+    def correct_legacy_supplements(self):
+        """把登记的旧补打卡记录按 UTC 时间校正（重算日期与派生表），返回校正条数"""
+        return 0
+
+    def incremental_vacuum_enabled(self):
+        """是否已开启增量空间回收"""
+        return True
+
+    def enable_incremental_vacuum(self):
+        """开启增量空间回收（可能需要重写整个数据库并阻塞写入），返回是否执行了转换"""
+        return False
+
+    def incremental_vacuum(self, pages=1000):
+        """回收一批空闲空间，返回剩余空闲页数"""
+        return 0
+
+    def backup_database(self, backup_dir=None, max_backups=3, compress=True):
+        """备份数据 -> (是否成功, 备份路径（分片存储为路径列表）或错误信息)"""
+        return False, "当前存储引擎不支持备份"
+
+    def list_backups(self, backup_dir=None):
+        """已有备份 [(文件名, 大小, 修改时间), ...]"""
+        return []
+
+    def restore_database(self, backup_name, backup_dir=None):
+        """从备份恢复 -> (是否成功, 结果或错误信息)"""
+        return False, "当前存储引擎不支持恢复"
+
+
+    # ---------- 与存储引擎无关 ----------
+    def export_checkins(self, path, fmt=None, user_id=None):
+        """流式导出打卡记录到 CSV / JSONL 文件
+
+        Returns:
+            tuple: (是否成功, {"path", "count", "elapsed"} 或错误信息)
+        """
+        from .transfer import export_file
+        try:
+            return True, export_file(self.iter_export_rows(user_id), path, fmt)
+        except Exception as e:
+            error_msg = f"数据导出失败: {str(e)}"
+            self.log_error(error_msg)
+            return False, error_msg
+
+    def import_checkins(self, path, fmt=None):
+        """从 CSV / JSONL 文件分批导入打卡记录（重复导入同一文件不会产生重复记录）
+
+        Returns:
+            tuple: (是否成功, {"path", "imported", "skipped", "invalid", "errors", "elapsed"} 或错误信息)
+        """
+        from .transfer import import_file
+        try:
+            return True, import_file(path, self.import_rows, fmt)
+        except Exception as e:
+            error_msg = f"数据导入失败: {str(e)}"
+            self.log_error(error_msg)
+            return False, error_msg
+
+    def log_error(self, message):
+        """记录错误日志"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        error_log_path = os.path.join(self.data_dir, "error.log")
+        timestamp = datetime.now(china_tz).strftime("%Y-%m-%d %H:%M:%S")
+        with open(error_log_path, 'a', encoding='utf-8') as f:
+            f.write(f"[{timestamp}] {message}\n")
+
+    def read_admin_id(self, user_id):
+        """读取或创建管理员ID"""
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        file_path = os.path.join(current_directory, "admin_data.json")
+
+        if os.path.exists(file_path):
+            try:
+                with open(file_path, "r") as f:
+                    admin_data = json.load(f)
+                    if "admin_id" in admin_data:
+                        return ["存在", admin_data["admin_id"]]
+                    else:
+                        admin_data["admin_id"] = user_id
+                        with open(file_path, "w") as f:
+                            json.dump(admin_data, f)
+                        return ["不存在", user_id]
+            except json.JSONDecodeError:
+                admin_data = {"admin_id": user_id}
+                with open(file_path, "w") as f:
+                    json.dump(admin_data, f)
+                return ["不存在", user_id]
+        else:
+            with open(file_path, "w") as f:
+                return ["不存在", user_id]
+
+
+def create_storage(config):
+    """按配置创建存储引擎
+
+    Args:
+        config (dict): 配置中的 storage 段 {"engine": "sqlite"|"memory", "data_dir": ..., "shards": N}
+    """
+    engine = config.get("engine", "sqlite")
+    data_dir = config.get("data_dir", DATA_DIR)
+    if engine == "sqlite":
+        if config.get("shards", 1) > 1:
+            from .shards import ShardedStorage
+            return ShardedStorage(data_dir=data_dir, shards=config["shards"])
+        from .dbedit import DatabaseManager
+        return DatabaseManager(data_dir=data_dir)
+    if engine == "memory":
+        from .memstore import MemoryStorage
+        return MemoryStorage(data_dir=data_dir)
+    raise ValueError(f"未知的存储引擎: {engine}")
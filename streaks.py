@@ -0,0 +1,158 @@
+"""
+连续打卡统计表（goal_streaks）维护
+- current_streak: 截至 last_day 的连续天数
+- last_day: 最近一次打卡的日序号
+- longest_streak: 历史最长连续天数
+- total_days: 累计打卡天数（按自然日去重）
+补录早于 last_day 的打卡时按位图（含已归档的打卡日）重算，不只读近期记录
+"""
+from .bitmaps import DayBitmap
+
+# 按日序号的"间隔分组"计算每个目标的连续区间，再按目标开窗取最近一段与最长、合计
+SQL_REBUILD_STREAKS = '''
+    WITH days AS (
+        SELECT DISTINCT goal_id, day FROM checkins
+        WHERE day IS NOT NULL {where}
+    ),
+    islands AS (
+        SELECT goal_id, day,
+               day - ROW_NUMBER() OVER (PARTITION BY goal_id ORDER BY day) AS grp
+        FROM days
+    ),
+    runs AS (
+        SELECT goal_id, COUNT(*) AS len, MAX(day) AS end_day
+        FROM islands
+        GROUP BY goal_id, grp
+    ),
+    ranked AS (
+        SELECT goal_id, len, end_day,
+               ROW_NUMBER() OVER goal_runs AS rn,
+               MAX(len) OVER goal_runs AS longest,
+               SUM(len) OVER goal_runs AS total
+        FROM runs
+        WINDOW goal_runs AS (
+            PARTITION BY goal_id ORDER BY end_day DESC
+            ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+        )
+    )
+    INSERT OR REPLACE INTO goal_streaks
+        (goal_id, current_streak, last_day, longest_streak, total_days)
+    SELECT goal_id, len, end_day, longest, total
+    FROM ranked
+    WHERE rn = 1
+'''
+
+# 新打卡日不早于 last_day 时增量推进
+SQL_ADVANCE_STREAK = '''
+    INSERT INTO goal_streaks
+        (goal_id, current_streak, last_day, longest_streak, total_days)
+    VALUES (?, 1, ?, 1, 1)
+    ON CONFLICT(goal_id) DO UPDATE SET
+        current_streak = CASE
+            WHEN excluded.last_day = last_day THEN current_streak
+            WHEN excluded.last_day = last_day + 1 THEN current_streak + 1
+            ELSE 1 END,
+        longest_streak = MAX(longest_streak, CASE
+            WHEN excluded.last_day = last_day THEN current_streak
+            WHEN excluded.last_day = last_day + 1 THEN current_streak + 1
+            ELSE 1 END),
+        total_days = total_days + (excluded.last_day != last_day),
+        last_day = excluded.last_day
+    WHERE excluded.last_day >= last_day
+'''
+
+SQL_REPLACE_STREAK = '''
+    INSERT OR REPLACE INTO goal_streaks
+        (goal_id, current_streak, last_day, longest_streak, total_days)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+
+def create_streak_table(c):
+    """创建连续打卡统计表"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS goal_streaks (
+            goal_id INTEGER PRIMARY KEY,
+            current_streak INTEGER NOT NULL,
+            last_day INTEGER NOT NULL,
+            longest_streak INTEGER NOT NULL,
+            total_days INTEGER NOT NULL,
+            FOREIGN KEY (goal_id) REFERENCES goals(id)
+        )
+    ''')
+
+
+def rebuild_streaks(c, goal_ids=None):
+    """从打卡记录重算统计（goal_ids为空时重算全部）"""
+    if goal_ids is None:
+        c.execute("DELETE FROM goal_streaks")
+        c.execute(SQL_REBUILD_STREAKS.format(where=''))
+        return
+    goal_ids = list(goal_ids)
+    if not goal_ids:
+        return
+    placeholders = ','.join('?' * len(goal_ids))
+    c.execute(f"DELETE FROM goal_streaks WHERE goal_id IN ({placeholders})", goal_ids)
+    c.execute(
+        SQL_REBUILD_STREAKS.format(where=f"AND goal_id IN ({placeholders})"),
+        goal_ids
+    )
+
+
+def streak_row(bitmap, longest=0, total=0):
+    """位图 -> (current_streak, last_day, longest_streak, total_days)
+
+    最长连续与累计天数不低于原值（未归档直接删除的历史只保留在统计中）。
+    """
+    last_day = bitmap.last_day()
+    return (
+        bitmap.streak_ending(last_day), last_day,
+        max(longest, bitmap.longest_streak()), max(total, bitmap.count())
+    )
+
+
+def rebuild_streaks_from_bitmaps(c, goal_ids):
+    """按位图（含已归档的打卡日）重算目标的统计（位图需已包含本次写入的打卡日）"""
+    goal_ids = list(goal_ids)
+    if not goal_ids:
+        return
+    placeholders = ','.join('?' * len(goal_ids))
+    existing = {
+        goal_id: (longest, total)
+        for goal_id, longest, total in c.execute(
+            f"SELECT goal_id, longest_streak, total_days FROM goal_streaks WHERE goal_id IN ({placeholders})",
+            goal_ids
+        )
+    }
+    rows = [
+        (goal_id, *streak_row(DayBitmap.from_blob(base_day, bits), *existing.get(goal_id, (0, 0))))
+        for goal_id, base_day, bits in c.execute(
+            f"SELECT goal_id, base_day, bits FROM goal_bitmaps WHERE goal_id IN ({placeholders})",
+            goal_ids
+        ).fetchall()
+    ]
+    c.executemany(SQL_REPLACE_STREAK, rows)
+
+
+def record_day(c, goal_id, day):
+    """登记目标在某日打卡（需在写入打卡记录并置位位图后、同一事务中调用）"""
+    c.execute(SQL_ADVANCE_STREAK, (goal_id, day))
+    if c.rowcount == 0:
+        # 补录早于最近打卡日的记录，需按历史（含归档）修复
+        rebuild_streaks_from_bitmaps(c, [goal_id])
+
+
+def record_days(c, goal_ids, day):
+    """批量登记多个目标在同一日打卡"""
+    goal_ids = list(dict.fromkeys(goal_ids))
+    c.executemany(SQL_ADVANCE_STREAK, [(goal_id, day) for goal_id in goal_ids])
+    if c.rowcount < len(goal_ids):
+        rebuild_streaks_from_bitmaps(c, goal_ids)
+
+
+def current_streak(row, today):
+    """根据统计行计算当前连续天数（今日未打卡视为0）"""
+    if not row:
+        return 0
+    streak, last_day = row
+    return streak if last_day == today else 0
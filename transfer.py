@@ -0,0 +1,171 @@
+"""
+打卡记录导出与导入（CSV / JSONL）
+- 导出：游标 fetchmany 分块读取，逐块写入文件，内存占用与数据量无关
+- 导入：逐行解析、分批写入，每行一条打卡记录；已存在相同（目标, 时间）的记录会跳过，
+  重复导入同一文件不会产生重复数据
+- 字段：user_id、goal、checkin_time（Unix 时间戳；导入时也接受补打卡支持的日期文本）、
+  time（UTC+8 显示时间，仅导出，便于阅读）
+"""
+import csv
+import json
+import os
+import time
+
+from .storage import format_time, parse_checkin_time, to_epoch
+
+FORMATS = ('csv', 'jsonl')
+FIELDS = ['user_id', 'goal', 'checkin_time', 'time']
+
+# 导出时每次 fetchmany 的行数
+EXPORT_CHUNK = 1000
+# 导入时每条 executemany 的行数
+IMPORT_BATCH = 5000
+# 导入时每个写事务的行数（分批导入时打卡最多等待一个事务）
+IMPORT_TRANSACTION = 10000
+# 导入后每个事务重算派生表的目标数
+REBUILD_CHUNK = 100
+# 导入报告中保留的错误行数
+MAX_ERRORS = 20
+
+
+def detect_format(path, fmt=None):
+    """按参数或扩展名确定格式"""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip('.')).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的格式: {fmt}（支持 {', '.join(FORMATS)}）")
+    return fmt
+
+
+class ExportWriter:
+    """分块写入导出文件"""
+    def __init__(self, path, fmt=None):
+        self.fmt = detect_format(path, fmt)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._csv = None
+        if self.fmt == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(FIELDS)
+        self.count = 0
+
+    def write_rows(self, rows):
+        """rows: [(user_id, goal, checkin_time), ...]"""
+        records = [(user_id, goal, ts, format_time(ts, '%Y-%m-%d %H:%M:%S')) for user_id, goal, ts in rows]
+        if self._csv:
+            self._csv.writerows(records)
+        else:
+            self._file.writelines(
+                json.dumps(dict(zip(FIELDS, record)), ensure_ascii=False) + '\n' for record in records
+            )
+        self.count += len(records)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _parse_time(value):
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    return to_epoch(parse_checkin_time(value))
+
+
+def read_records(path, fmt=None, report=None):
+    """逐行读取导入文件 -> (user_id, goal, checkin_time)
+
+    Args:
+        report (dict): 无法解析的行计入 report["invalid"]，前 MAX_ERRORS 行的
+                       (行号, 原因) 追加到 report["errors"]（不中断导入）
+    """
+    fmt = detect_format(path, fmt)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            rows = enumerate(csv.DictReader(f), 2)
+        else:
+            rows = ((line_no, line) for line_no, line in enumerate(f, 1) if line.strip())
+        for line_no, row in rows:
+            try:
+                if fmt == 'jsonl':
+                    row = json.loads(row)
+                user_id = str(row['user_id']).strip()
+                goal = str(row['goal']).strip()
+                if not user_id or not goal:
+                    raise ValueError("user_id 或 goal 为空")
+                checkin_time = _parse_time(row.get('checkin_time') or row['time'])
+            except (KeyError, TypeError, AttributeError, ValueError) as e:
+                if report is not None:
+                    report["invalid"] = report.get("invalid", 0) + 1
+                    errors = report.setdefault("errors", [])
+                    if len(errors) < MAX_ERRORS:
+                        errors.append((line_no, str(e)))
+                continue
+            yield user_id, goal, checkin_time
+
+
+def iter_chunks(iterable, size):
+    """按固定大小分块"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_file(chunks, path, fmt=None):
+    """把分块的打卡记录写入导出文件（先写临时文件，完成后再替换）
+
+    Returns:
+        dict: {"path", "count", "elapsed"}
+    """
+    start = time.perf_counter()
+    fmt = detect_format(path, fmt)
+    tmp_path = path + '.tmp'
+    try:
+        with ExportWriter(tmp_path, fmt) as writer:
+            for rows in chunks:
+                writer.write_rows(rows)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {"path": path, "count": writer.count, "elapsed": time.perf_counter() - start}
+
+
+def open_import(path, fmt=None):
+    """打开导入文件
+
+    Returns:
+        tuple: (记录迭代器, 报告 {"path", "imported", "skipped", "invalid", "errors", "elapsed"})；
+               无法解析的行在读取时计入报告，其余字段由调用方填写
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"文件不存在: {path}")
+    report = {"path": path, "imported": 0, "skipped": 0, "invalid": 0, "errors": [], "elapsed": 0.0}
+    return read_records(path, fmt, report), report
+
+
+def import_file(path, import_rows, fmt=None):
+    """逐行读取导入文件并交给存储引擎写入
+
+    Args:
+        import_rows: 接收 (user_id, goal, checkin_time) 迭代器、返回 (导入数, 跳过数) 的函数
+
+    Returns:
+        dict: {"path", "imported", "skipped", "invalid", "errors", "elapsed"}
+    """
+    start = time.perf_counter()
+    records, report = open_import(path, fmt)
+    report["imported"], report["skipped"] = import_rows(records)
+    report["elapsed"] = time.perf_counter() - start
+    return report